@@ -0,0 +1,107 @@
+"""
+Benchmark of the per-step DOM extraction.
+
+Times the general extraction (`page.content()`, `inner_text("body")` and `query_selector_all`
+followed by the BeautifulSoup parsing and the input probe) against the single
+`page.evaluate` of the DOM bundle and the incremental extraction after a small change to the page
+(a dropdown of a few links opening), on saved HTML pages or live URLs. No model is called, but a
+chromium from `playwright install chromium` is needed.
+
+    python automation_eval/benchmarks/dom_extraction.py page.html https://example.com
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+from playwright.async_api import async_playwright
+
+from pyba.core.scripts.extractions import (
+    BundleDOMExtraction,
+    GeneralDOMExtraction,
+    IncrementalDOMExtraction,
+)
+from pyba.utils.load_yaml import load_config
+
+ROUNDS = 5
+SELECTOR = ", ".join(load_config("general")["process_config"]["selectors"])
+
+# A dropdown opening, the kind of change most steps make
+OPEN_DROPDOWN = """() => {
+    const menu = document.createElement("ul");
+    menu.innerHTML = [1, 2, 3, 4, 5].map((i) => `<li><a href="/option/${i}">Option ${i}</a></li>`).join("");
+    document.body.appendChild(menu);
+}"""
+
+
+async def general_step(page):
+    html = await page.content()
+    body_text = await page.inner_text("body")
+    elements = await page.query_selector_all(SELECTOR)
+    return await GeneralDOMExtraction(
+        html=html, body_text=body_text, elements=elements, base_url=page.url, page=page
+    ).extract()
+
+
+async def bundle_step(page):
+    return await BundleDOMExtraction(page=page).extract()
+
+
+async def best_run(step, page) -> float:
+    """
+    Returns the fastest of a few extractions in seconds
+    """
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        await step(page)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+async def best_incremental_run(page) -> float:
+    """
+    Returns the fastest of a few incremental extractions in seconds, each after a dropdown opens
+    """
+    extraction = IncrementalDOMExtraction(page=page)
+    await extraction.extract()
+
+    timings = []
+    for _ in range(ROUNDS):
+        await page.evaluate(OPEN_DROPDOWN)
+        start = time.perf_counter()
+        await extraction.extract()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+async def main(sources):
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        context = await browser.new_context()
+        await context.add_init_script(script=IncrementalDOMExtraction.init_script)
+        page = await context.new_page()
+
+        for source in sources:
+            if Path(source).exists():
+                await page.set_content(Path(source).read_text(errors="ignore"))
+            else:
+                await page.goto(source, wait_until="networkidle")
+
+            before = await best_run(general_step, page)
+            after = await best_run(bundle_step, page)
+            incremental = await best_incremental_run(page)
+            print(
+                f"{source}: general {before * 1000:.1f} ms, bundle {after * 1000:.1f} ms "
+                f"({before / after:.1f}x), incremental after a change {incremental * 1000:.1f} ms "
+                f"({before / incremental:.1f}x)"
+            )
+
+        await browser.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    asyncio.run(main(sys.argv[1:]))
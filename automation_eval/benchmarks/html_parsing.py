@@ -0,0 +1,75 @@
+"""
+Benchmark of the HTML parsing in the general DOM extraction.
+
+Times the hyperlink and clickable extraction the way it used to run (each of them parsing the page
+with `html.parser` on its own) against a single parse with the fastest installed backend shared by
+both. Pass saved pages on the command line, otherwise synthetic pages of about 1 and 5 MB are used.
+No model is called and no browser is opened.
+
+    python automation_eval/benchmarks/html_parsing.py page.html
+"""
+
+import sys
+import time
+from pathlib import Path
+
+from pyba.core.scripts.extractions.general import HTML_PARSER, GeneralDOMExtraction
+
+ROUNDS = 3
+
+
+def synthetic_page(size_mb: float) -> str:
+    """
+    Builds a page of roughly `size_mb` with a mix of links, buttons and text, like a search result
+    """
+    item = (
+        '<div class="result" tabindex="0"><a href="/item/{i}?ref=list">Result {i}</a>'
+        "<p>Some descriptive text for result number {i} with a few more words in it.</p>"
+        '<button type="button" onclick="save({i})">Save</button>'
+        '<span role="link">Details {i}</span></div>\n'
+    )
+    count = int(size_mb * 1024 * 1024 / len(item.format(i=10000)))
+    items = "".join(item.format(i=i) for i in range(count))
+    return f"<html><body><form><input name='q'></form>{items}</body></html>"
+
+
+def separate_parses(html: str):
+    # Two extractors with their own parse, as `_extract_href` and `_extract_clickables` used to do
+    GeneralDOMExtraction(html, "", [], "https://example.com", parser="html.parser")._extract_href()
+    GeneralDOMExtraction(
+        html, "", [], "https://example.com", parser="html.parser"
+    )._extract_clickables()
+
+
+def shared_parse(html: str):
+    extraction = GeneralDOMExtraction(html, "", [], "https://example.com")
+    extraction._extract_href()
+    extraction._extract_clickables()
+
+
+def best_run(step, html: str) -> float:
+    """
+    Returns the fastest of a few runs in seconds
+    """
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        step(html)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        pages = {path: Path(path).read_text(errors="ignore") for path in sys.argv[1:]}
+    else:
+        pages = {f"synthetic {size} MB": synthetic_page(size) for size in (1, 5)}
+
+    print(f"Shared parse backend: {HTML_PARSER}")
+    for name, html in pages.items():
+        before = best_run(separate_parses, html)
+        after = best_run(shared_parse, html)
+        print(
+            f"{name} ({len(html) / 1024 / 1024:.1f} MB): separate html.parser parses "
+            f"{before:.2f} s, shared parse {after:.2f} s ({before / after:.1f}x)"
+        )
@@ -0,0 +1,62 @@
+"""
+Micro-benchmark for the per-call overhead of the response schemas.
+
+Times what every action step used to rebuild (the JSON schema of `PlaywrightResponse`, the strict
+OpenAI `response_format` and the response cache fingerprint) against the cached versions handed
+out by the `LLMFactory`, over a 100 step run. No model is called.
+
+    python automation_eval/benchmarks/schema_cache.py
+"""
+
+import time
+
+from openai.lib._parsing._completions import type_to_response_format_param
+
+from pyba.core.agent.llm_factory import LLMFactory
+from pyba.core.agent.response_cache import ResponseCache
+from pyba.utils.structure import PlaywrightResponse
+
+STEPS = 100
+ROUNDS = 5
+
+
+def uncached_step():
+    PlaywrightResponse.model_json_schema()  # Gemini's `response_json_schema`
+    type_to_response_format_param(PlaywrightResponse)  # `chat.completions.parse`
+    PlaywrightResponse.model_json_schema()  # The response cache fingerprint
+
+
+def cached_step():
+    LLMFactory.json_schema(PlaywrightResponse)
+    LLMFactory.openai_response_format(PlaywrightResponse)
+    ResponseCache.fingerprint(
+        provider="openai",
+        model="gpt-4o",
+        system_instruction="",
+        response_format=PlaywrightResponse,
+        prompt="",
+    )
+
+
+def best_run(step) -> float:
+    """
+    Returns the fastest of a few 100 step runs in seconds
+    """
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for _ in range(STEPS):
+            step()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    cached_step()  # Warm the caches, the first step pays the same as before
+
+    before = best_run(uncached_step)
+    after = best_run(cached_step)
+
+    for label, total in (("without the cache", before), ("with the cache   ", after)):
+        print(f"{STEPS} steps {label}: {total * 1000:.1f} ms ({total / STEPS * 1e6:.0f} us/step)")
+    print(f"Speedup: {before / after:.1f}x")
@@ -0,0 +1,118 @@
+"""
+Checks that a long page is extracted in chunks and merged back into one object.
+
+A local stub of `/v1/chat/completions` plays the extraction model: it answers every prompt with the
+products named in the page text it was sent. An engine with a small `extraction_chunk_tokens` is
+pointed at it with `openai_base_url`, and a page of a few hundred product lines is handed to the
+extraction agent as the list of lines the cleaned_dom keeps. The page must be sent in several
+chunks and every product must come back exactly once in the merged result. No API key, model or
+browser is needed.
+
+    python automation_eval/extraction_chunking/chunked_page.py
+"""
+
+import asyncio
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+from pydantic import BaseModel
+
+from pyba import Engine
+from pyba.core.agent.extraction_agent import ExtractionAgent
+
+PRODUCT_PATTERN = re.compile(r"^Product (\d+) costs", re.MULTILINE)
+PRODUCTS = 300
+
+
+class Products(BaseModel):
+    names: List[str]
+
+
+class StubServer:
+    """
+    A chat completions endpoint in a background thread which extracts the products from the text
+    of every prompt it gets
+    """
+
+    def __init__(self):
+        self.prompts = []
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_port}/v1"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                prompt = body["messages"][-1]["content"]
+                stub.prompts.append(prompt)
+
+                names = [f"Product {n}" for n in PRODUCT_PATTERN.findall(prompt)]
+                data = json.dumps(
+                    {
+                        "id": "stub",
+                        "object": "chat.completion",
+                        "created": 0,
+                        "model": body["model"],
+                        "choices": [
+                            {
+                                "index": 0,
+                                "finish_reason": "stop",
+                                "message": {
+                                    "role": "assistant",
+                                    "content": json.dumps({"names": names}),
+                                },
+                            }
+                        ],
+                        "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+                    }
+                ).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+async def main():
+    # The lines of the page as the cleaned_dom keeps them, about 3000 tokens in total
+    actual_text = [f"Product {n} costs {n * 3} EUR and ships in two days" for n in range(PRODUCTS)]
+
+    with StubServer() as stub:
+        engine = Engine(
+            openai_base_url=stub.base_url,
+            openai_model="stub-model",
+            extraction_chunk_tokens=500,
+            handle_dependencies=False,
+            enable_tracing=False,
+        )
+        agent = ExtractionAgent(engine=engine, extraction_format=Products)
+        extracted = await agent.info_extraction(
+            task="List the names of all the products", actual_text=actual_text
+        )
+
+    assert len(stub.prompts) > 1, f"The page was sent in {len(stub.prompts)} request"
+    expected = [f"Product {n}" for n in range(PRODUCTS)]
+    assert extracted["names"] == expected, extracted
+    print(f"Extracted {len(extracted['names'])} products from {len(stub.prompts)} chunks")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,138 @@
+"""
+Checks the OpenAI compatible `base_url` path against a local stub server.
+
+Two stubs of `/v1/chat/completions` are started on localhost: one which accepts the strict
+`json_schema` response format, like vLLM with guided decoding, and one which rejects it with a 400
+and only knows `json_object`, like an older llama.cpp server. An engine is pointed at each of them
+with `openai_base_url` and asked for an action and an output. The first must be served with
+structured outputs and the second must fall back to JSON mode once and stay there. No API key, model
+or browser is needed.
+
+    python automation_eval/openai_compatible/stub_server.py
+"""
+
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pyba import Engine
+from pyba.utils.structure import CleanedDOM
+
+# Valid for both the action and the output schemas, each ignores the other's fields
+REPLY = {
+    "actions": [{"goto": "https://example.com"}],
+    "extract_info": False,
+    "output": "The stub's answer",
+}
+
+
+class StubServer:
+    """
+    A chat completions endpoint in a background thread which keeps the response format of every
+    request it gets
+    """
+
+    def __init__(self, supports_json_schema: bool):
+        self.supports_json_schema = supports_json_schema
+        self.response_formats = []
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_port}/v1"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                response_format = body.get("response_format", {}).get("type")
+                stub.response_formats.append(response_format)
+
+                if response_format == "json_schema" and not stub.supports_json_schema:
+                    self._send(400, {"error": {"message": "json_schema is not supported"}})
+                    return
+
+                self._send(
+                    200,
+                    {
+                        "id": "stub",
+                        "object": "chat.completion",
+                        "created": 0,
+                        "model": body["model"],
+                        "choices": [
+                            {
+                                "index": 0,
+                                "finish_reason": "stop",
+                                "message": {"role": "assistant", "content": json.dumps(REPLY)},
+                            }
+                        ],
+                        "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+                    },
+                )
+
+            def _send(self, status: int, payload: dict):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+async def ask(base_url: str):
+    """
+    Asks an engine pointed at the stub for an action and then an output
+    """
+    engine = Engine(
+        openai_base_url=base_url,
+        openai_model="stub-model",
+        handle_dependencies=False,
+        enable_tracing=False,
+    )
+    cleaned_dom = CleanedDOM(actual_text=["Example Domain"]).to_dict()
+
+    action = await engine.fetch_action(
+        cleaned_dom=cleaned_dom, user_prompt="Go to example.com", history=""
+    )
+    output = await engine.playwright_agent.get_output(
+        cleaned_dom=cleaned_dom, user_prompt="What is this page?"
+    )
+    return action, output
+
+
+async def main():
+    with StubServer(supports_json_schema=True) as stub:
+        action, output = await ask(stub.base_url)
+        assert action.goto == "https://example.com", action
+        assert output == REPLY["output"], output
+        assert stub.response_formats == ["json_schema", "json_schema"], stub.response_formats
+        print(f"Structured outputs: {stub.response_formats}")
+
+    with StubServer(supports_json_schema=False) as stub:
+        action, output = await ask(stub.base_url)
+        assert action.goto == "https://example.com", action
+        assert output == REPLY["output"], output
+        # Rejected once, then JSON mode for the rest of the calls to that server
+        assert stub.response_formats == [
+            "json_schema",
+            "json_object",
+            "json_object",
+        ], stub.response_formats
+        print(f"JSON mode fallback: {stub.response_formats}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,36 +1,54 @@
-import random
+import json
 import time
-from typing import Literal, Dict, List, Any
+from typing import Awaitable, Callable, Literal, Dict, List, Any, Optional
 
+from pyba.core.agent.dom_serializer import estimate_tokens
 from pyba.core.agent.llm_factory import LLMFactory
+from pyba.core.agent.rate_limiter import RateLimiter
+from pyba.core.agent.response_cache import ResponseCache
+from pyba.core.agent.retry_policy import RetryPolicy
+from pyba.core.agent.telemetry import LLMCallRecord, Telemetry
 from pyba.logger import get_logger
+from pyba.utils.exceptions import LLMRequestFailed
+from pyba.utils.load_yaml import load_config
+from pyba.utils.prompts import json_mode_prompt
+
+config = load_config("general")["main_engine_configs"]
 
 
 class BaseAgent:
     """
     The base class for all Agents to define common methods
 
-        Contains methods for exponential backoff and retry as well
-        Note: this backoff and retry will be blocking for that specific context.
+        All provider calls go through the `RetryPolicy`, which retries the retryable errors with
+        exponential backoff within a bounded number of attempts and time, and raises a typed
+        exception otherwise. The calls are made through the async clients and the backoff uses
+        `asyncio.sleep`, so a slow or rate-limited call only suspends the coroutine that made it
+        and never the event loop.
 
     Defines the following variables:
 
-    `exponential_base`: 2 (we're using base 2)
-    `base_timeout`: 1 second
-    `max_backoff_time`: 60 seconds
-    `attempt_number`: The current attempt number initialised to 1
+    `retry_policy`: The retry policy for the provider calls
     `LLMFactory`: The internal agent call is made by agent itself
+    `prompt_cache`: The session's prompt cache, shared by all the agents of an engine
+    `response_cache`: The persistent LLM response cache, None unless enabled on the engine
+    `cassette`: The cassette the responses are recorded to or replayed from, if any
+    `rate_limiter`: The process-wide rate limiter for the provider, waited on before every call
+    `telemetry`: The engine's telemetry, which gets a record of every call
     `log`: The logger for the agents
     """
 
     def __init__(self, engine):
-        self.base = 2
-        self.base_timeout = 1
-        self.max_backoff_time = 60
-        self.attempt_number = 1
+        self.retry_policy = RetryPolicy()
 
         self.engine = engine
         self.llm_factory = LLMFactory(engine=self.engine)
+        self.prompt_cache = self.engine.prompt_cache
+        self.response_cache = self.engine.response_cache
+        self.cassette = self.engine.cassette
+        self.replaying = self.cassette is not None and self.cassette.mode == "replay"
+        self.rate_limiter = RateLimiter.for_provider(self.engine.provider)
+        self.telemetry = self.engine.telemetry
         self.log = get_logger()
         self.mode: Literal["Normal", "DFS", "BFS"] = self.engine.mode
 
@@ -41,7 +59,7 @@ class BaseAgent:
         raise NotImplementedError("Subclasses must implement _initialise_prompt")
 
     def _initialise_openai_arguments(
-        self, system_instruction: str, prompt: str, model_name: str
+        self, system_instruction: str, prompt: str, model_name: str, context: List[str] = None
     ) -> Dict[str, List[Dict[str, str]]]:
         """
         Initialises the arguments for OpenAI agents
@@ -50,128 +68,391 @@ class BaseAgent:
             `system_instruction`: The system instruction for the agent
             `prompt`: The current prompt for the agent
             `model_name`: The OpenAI model name
+            `context`: Earlier user messages to send before the prompt (such as a reference snapshot)
 
         Returns:
             An arguments dictionary which can be directly passed to OpenAI agents
         """
 
-        messages = [
-            {"role": "system", "content": system_instruction},
-            {"role": "user", "content": prompt},
-        ]
+        messages = [{"role": "system", "content": system_instruction}]
+        messages += [{"role": "user", "content": message} for message in context or []]
+        messages.append({"role": "user", "content": prompt})
 
         kwargs = {
             "model": model_name,
             "messages": messages,
         }
 
+        # Requests sharing the same static prefix are routed to the same cache. Compatible servers
+        # don't know the parameter, they cache the prefix on their own if at all
+        prompt_cache_key = self.prompt_cache.openai_cache_key(system_instruction)
+        if prompt_cache_key and self.engine.openai_base_url is None:
+            kwargs["prompt_cache_key"] = prompt_cache_key
+
         return kwargs
 
-    def handle_openai_execution(self, agent: Any, prompt: str):
+    def _request_key(self, agent: Dict, prompt: str, context: List[str] = None) -> Optional[str]:
+        """
+        Returns the key identifying a request for the response cache and the cassette, or None if
+        neither of them is in use
+        """
+        if self.response_cache is None and self.cassette is None:
+            return None
+
+        return ResponseCache.fingerprint(
+            provider=self.engine.provider,
+            model=agent["model"],
+            system_instruction=agent["system_instruction"],
+            response_format=agent["response_format"],
+            prompt=prompt,
+            context=context,
+        )
+
+    @staticmethod
+    def _estimate_request_tokens(agent: Dict, prompt: str, context: List[str] = None) -> int:
+        """
+        Estimates the input tokens of a request for the rate limiter
+        """
+        text = agent["system_instruction"] + prompt + "".join(context or [])
+        return estimate_tokens(text)
+
+    async def _call_openai_json_mode(self, agent: Dict, arguments: Dict):
+        """
+        Calls an OpenAI compatible server which lacks structured outputs. The schema is added to
+        the system message, the server is asked for a JSON object and the reply is validated
+        against the schema locally.
+
+        Args:
+            `agent`: The agent to use
+            `arguments`: The arguments from `_initialise_openai_arguments`
+        """
+        schema = json.dumps(LLMFactory.json_schema(agent["response_format"]))
+        messages = [dict(message) for message in arguments["messages"]]
+        messages[0]["content"] += json_mode_prompt.format(schema=schema)
+
+        response = await self.llm_factory.get_client().chat.completions.create(
+            **{**arguments, "messages": messages}, response_format={"type": "json_object"}
+        )
+        agent["response_format"].model_validate_json(response.choices[0].message.content)
+        return response
+
+    async def _call_openai_structured(self, agent: Dict, arguments: Dict):
+        """
+        Calls OpenAI with structured outputs. This is what `chat.completions.parse` does, except
+        that the strict schema comes from the factory's cache instead of being converted from the
+        response model on every call. The reply is validated against the model locally.
+
+        Args:
+            `agent`: The agent to use
+            `arguments`: The arguments from `_initialise_openai_arguments`
+        """
+        response = await self.llm_factory.get_client().chat.completions.create(
+            **arguments,
+            response_format=LLMFactory.openai_response_format(agent["response_format"]),
+        )
+        agent["response_format"].model_validate_json(response.choices[0].message.content)
+        return response
+
+    async def _run_call(
+        self,
+        provider: str,
+        call: Callable[[], Awaitable[Any]],
+        estimated_tokens: int,
+        record: LLMCallRecord,
+    ) -> Any:
+        """
+        Runs a provider call under the retry policy and the rate limiter, counting the attempts,
+        the time queued on the rate limiter and the backoff into the call's telemetry record
+
+        Every attempt takes a request from the limiter, but only the first one takes the estimated
+        tokens. The usage is settled once per call, so the retries (and a JSON mode fallback, which
+        runs on the same record) would otherwise keep tokens that are never given back.
+        """
+
+        async def before_attempt():
+            record.attempts += 1
+            tokens = estimated_tokens if record.attempts == 1 else 0
+            record.queue_seconds += await self.rate_limiter.acquire(tokens)
+
+        return await self.retry_policy.run(
+            provider=provider,
+            call=call,
+            before_attempt=before_attempt,
+            on_backoff=record.add_backoff,
+        )
+
+    async def _with_telemetry(
+        self,
+        agent: Dict,
+        execution: Callable[[LLMCallRecord], Awaitable[Any]],
+        read_usage: Callable[[Any], Dict],
+    ) -> Any:
+        """
+        Runs one of the executions and hands its record to the telemetry, also when it fails
+
+        Args:
+            `agent`: The agent making the call
+            `execution`: The execution, called with the record to fill in
+            `read_usage`: Reads the token counts from the response
+        """
+        record = self.telemetry.start(agent, provider=self.engine.provider)
+        started_at = time.perf_counter()
+        try:
+            response = await execution(record)
+        except Exception as e:
+            self.telemetry.finish(record, started_at, error=e)
+            raise
+
+        self.telemetry.finish(record, started_at, usage=read_usage(response))
+        return response
+
+    async def handle_openai_execution(self, agent: Any, prompt: str, context: List[str] = None):
         """
         Helper method to handle OpenAI execution
 
         Args:
             `agent`: The agent to use (action_agent or output_agent)
             `prompt`: The fully formatted prompt string
+            `context`: Earlier user messages to send before the prompt
 
         Returns:
             `response`: The raw response from the model. The exact required values
             are expected to be extraced within each agent
         """
+        return await self._with_telemetry(
+            agent,
+            lambda record: self._openai_execution(agent, prompt, context, record),
+            lambda response: Telemetry.openai_usage(getattr(response, "usage", None)),
+        )
+
+    async def _openai_execution(
+        self, agent: Dict, prompt: str, context: List[str], record: LLMCallRecord
+    ):
+        """
+        The OpenAI execution behind `handle_openai_execution`
+        """
         arguments = self._initialise_openai_arguments(
             system_instruction=agent["system_instruction"],
             prompt=prompt,
             model_name=agent["model"],
+            context=context,
         )
 
-        while True:
-            try:
-                response = agent["client"].chat.completions.parse(
-                    **arguments, response_format=agent["response_format"]
-                )
-                self.attempt_number = 1
-                break
-            except Exception:
-                # If we hit a rate limit, calculate the time to wait and retry
-                wait_time = self.calculate_next_time(self.attempt_number)
-                self.log.warning(f"Hit the rate limit for OpenAI, retrying in {wait_time} seconds")
-                time.sleep(wait_time)  # wait_time is in seconds
-                self.attempt_number += 1
-
+        request_key = self._request_key(agent, prompt, context)
+        if self.replaying:
+            record.source = "cassette"
+            return ResponseCache.as_openai_response(self.cassette.replay(request_key))
+
+        if self.response_cache:
+            cached_response = await self.response_cache.get(request_key)
+            if cached_response is not None:
+                record.source = "cache"
+                if self.cassette:
+                    # Recorded as well, or the replay would miss the calls the cache answered
+                    self.cassette.record(request_key, cached_response)
+                return self.response_cache.as_openai_response(cached_response)
+
+        estimated_tokens = self._estimate_request_tokens(agent, prompt, context)
+
+        def call():
+            if self.llm_factory.uses_json_mode():
+                return self._call_openai_json_mode(agent, arguments)
+            return self._call_openai_structured(agent, arguments)
+
+        try:
+            response = await self._run_call("OpenAI", call, estimated_tokens, record)
+        except LLMRequestFailed as e:
+            if not self.llm_factory.can_fall_back_to_json_mode(e.error):
+                raise
+            self.log.warning(
+                f"{self.engine.openai_base_url} doesn't support structured outputs, falling back to JSON mode"
+            )
+            self.llm_factory.fall_back_to_json_mode()
+            response = await self._run_call("OpenAI", call, estimated_tokens, record)
+
+        usage = getattr(response, "usage", None)
+        self.rate_limiter.settle(estimated_tokens, getattr(usage, "total_tokens", None))
+        self.prompt_cache.record_openai_usage(usage)
+        response_text = response.choices[0].message.content
+        if self.cassette:
+            self.cassette.record(request_key, response_text)
+        if self.response_cache:
+            await self.response_cache.put(
+                request_key, self.engine.provider, agent["model"], response_text
+            )
         return response
 
-    def handle_vertexai_execution(self, agent: Any, prompt: str):
+    async def handle_vertexai_execution(self, agent: Any, prompt: str, context: List[str] = None):
         """
         Helper method to handle VertexAI execution
 
         Args:
             `agent`: The agent to use (action_agent or output_agent)
             `prompt`: The fully formatted prompt string
+            `context`: Earlier user messages to send before the prompt. With an unbounded chat
+                they are already in its history and aren't sent again
+
+        The chat keeps the earlier steps as history, which grows by a full prompt every step. The
+        `vertexai.history_turns` config bounds it to the last few exchanges, or (set to 0) makes
+        every call stateless with `generate_content` like the gemini path.
 
         Returns:
             `response`: The raw response from the model. The exact required values
             are expected to be extraced within each agent
         """
-        while True:
-            try:
-                response = agent.send_message(prompt)
-                self.attempt_number = 1
-                break
-            except Exception:
-                wait_time = self.calculate_next_time(self.attempt_number)
-                self.log.warning(
-                    f"Hit the rate limit for VertexAI, retrying in {wait_time} seconds"
+        return await self._with_telemetry(
+            agent,
+            lambda record: self._vertexai_execution(agent, prompt, context, record),
+            lambda response: Telemetry.gemini_usage(getattr(response, "usage_metadata", None)),
+        )
+
+    async def _vertexai_execution(
+        self, agent: Dict, prompt: str, context: List[str], record: LLMCallRecord
+    ):
+        """
+        The VertexAI execution behind `handle_vertexai_execution`
+        """
+        history_turns = config["vertexai"]["history_turns"]
+        if history_turns is None:
+            context = None
+        contents = [*context, prompt] if context else prompt
+
+        request_key = self._request_key(agent, prompt, context)
+        if self.replaying:
+            record.source = "cassette"
+            return self.cassette.as_vertexai_response(
+                self.cassette.replay(request_key), agent["response_format"]
+            )
+
+        cached_content = await self.prompt_cache.get_cached_content(
+            client=self.llm_factory.get_client(),
+            model=agent["model"],
+            system_instruction=agent["system_instruction"],
+        )
+
+        estimated_tokens = self._estimate_request_tokens(agent, prompt, context)
+
+        if history_turns == 0:
+            generation_config = LLMFactory.vertexai_config(
+                agent["response_format"],
+                system_instruction=agent["system_instruction"],
+                cached_content=cached_content,
+            )
+
+            def call():
+                return self.llm_factory.get_client().aio.models.generate_content(
+                    model=agent["model"], contents=contents, config=generation_config
                 )
-                time.sleep(wait_time)
-                self.attempt_number += 1
 
+        else:
+            if agent["chat"] is None:
+                agent["chat"] = self.llm_factory.create_chat(agent)
+
+            # With an explicit cache the system instruction is served from the cache, so the
+            # per-message config overrides the chat's own config which carries the instruction inline
+            message_config = None
+            if cached_content:
+                message_config = LLMFactory.vertexai_config(
+                    agent["response_format"], cached_content=cached_content
+                )
+
+            def call():
+                return agent["chat"].send_message(contents, config=message_config)
+
+        response = await self._run_call("VertexAI", call, estimated_tokens, record)
+
+        if history_turns:
+            self.llm_factory.trim_chat(agent, history_turns)
+
+        usage_metadata = getattr(response, "usage_metadata", None)
+        self.log.info(
+            f"VertexAI prompt tokens for this step: "
+            f"{getattr(usage_metadata, 'prompt_token_count', None)}"
+        )
+        self.rate_limiter.settle(
+            estimated_tokens, getattr(usage_metadata, "total_token_count", None)
+        )
+        self.prompt_cache.record_gemini_usage(usage_metadata)
+        if self.cassette:
+            self.cassette.record(request_key, response.text)
         return response
 
-    def handle_gemini_execution(self, agent: Any, prompt: str):
+    async def handle_gemini_execution(self, agent: Any, prompt: str, context: List[str] = None):
         """
         Helper method to handle gemini's execution
 
         Args:
             `agent`: The agent to use (action_agent or output_agent)
             `prompt`: The fully formatted prompt string
+            `context`: Earlier user messages to send before the prompt
 
         Returns:
             `response`: The raw response from the model. The exact required values
             are expected to be extraced within each agent
         """
+        return await self._with_telemetry(
+            agent,
+            lambda record: self._gemini_execution(agent, prompt, context, record),
+            lambda response: Telemetry.gemini_usage(getattr(response, "usage_metadata", None)),
+        )
+
+    async def _gemini_execution(
+        self, agent: Dict, prompt: str, context: List[str], record: LLMCallRecord
+    ):
+        """
+        The Gemini execution behind `handle_gemini_execution`
+        """
+        request_key = self._request_key(agent, prompt, context)
+        if self.replaying:
+            record.source = "cassette"
+            return ResponseCache.as_gemini_response(self.cassette.replay(request_key))
+
+        if self.response_cache:
+            cached_response = await self.response_cache.get(request_key)
+            if cached_response is not None:
+                record.source = "cache"
+                if self.cassette:
+                    # Recorded as well, or the replay would miss the calls the cache answered
+                    self.cassette.record(request_key, cached_response)
+                return self.response_cache.as_gemini_response(cached_response)
+
         gemini_config = {
             "response_mime_type": "application/json",
-            "response_json_schema": agent["response_format"].model_json_schema(),
-            "system_instruction": agent["system_instruction"],
+            "response_json_schema": LLMFactory.json_schema(agent["response_format"]),
         }
 
-        while True:
-            try:
-                response = agent["client"].models.generate_content(
-                    model=agent["model"],
-                    contents=prompt,
-                    config=gemini_config,
-                )
-                self.attempt_number = 1
-                break
-            except Exception:
-                wait_time = self.calculate_next_time(self.attempt_number)
-                self.log.warning(f"Hit the rate limit for Gemini, retrying in {wait_time} seconds")
-                time.sleep(wait_time)
-                self.attempt_number += 1
+        cached_content = await self.prompt_cache.get_cached_content(
+            client=self.llm_factory.get_client(),
+            model=agent["model"],
+            system_instruction=agent["system_instruction"],
+        )
+        if cached_content:
+            gemini_config["cached_content"] = cached_content
+        else:
+            gemini_config["system_instruction"] = agent["system_instruction"]
+
+        estimated_tokens = self._estimate_request_tokens(agent, prompt, context)
+
+        response = await self._run_call(
+            "Gemini",
+            lambda: self.llm_factory.get_client().aio.models.generate_content(
+                model=agent["model"],
+                contents=[*context, prompt] if context else prompt,
+                config=gemini_config,
+            ),
+            estimated_tokens,
+            record,
+        )
 
+        usage_metadata = getattr(response, "usage_metadata", None)
+        self.rate_limiter.settle(
+            estimated_tokens, getattr(usage_metadata, "total_token_count", None)
+        )
+        self.prompt_cache.record_gemini_usage(usage_metadata)
+        if self.cassette:
+            self.cassette.record(request_key, response.text)
+        if self.response_cache:
+            await self.response_cache.put(
+                request_key, self.engine.provider, agent["model"], response.text
+            )
         return response
-
-    def calculate_next_time(self, attempt_number):
-        """
-        Function to calculate the next wait time in seconds
-
-        Args:
-                `attempt_number`: The number of failed attempts
-        """
-
-        delay = self.base_timeout * (self.base ** (attempt_number - 1))
-        delay = min(delay, self.max_backoff_time)
-        jitter = random.uniform(0, delay / 2)
-        return delay + jitter
@@ -0,0 +1,107 @@
+import json
+import threading
+from collections import defaultdict
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List, Literal, Optional
+
+from pyba.utils.exceptions import CassetteResponseNotFound, UnknownCassetteMode
+
+
+class Cassette:
+    """
+    Records the structured LLM responses of a run to a file and replays them later.
+
+    In `record` mode every request goes to the real provider and its response is appended to the
+    cassette under the hash of the request (the same fingerprint the response cache uses). In
+    `replay` mode no provider is contacted at all: the responses are served from the cassette by
+    matching that hash, in the order they were recorded when the same request was made more than
+    once.
+
+    Together with recorded pages this makes runs deterministic and offline, so the engine's own
+    overhead (DOM extraction, actions, DB writes) can be measured without the model latency.
+
+    The file is JSON lines. The first line records the provider and model the cassette was made
+    with, the rest hold one response each.
+    """
+
+    def __init__(self, path: str, mode: Literal["record", "replay"]):
+        """
+        Args:
+            `path`: The cassette file
+            `mode`: `record` to write the responses of this run, `replay` to serve them
+        """
+        if mode not in ("record", "replay"):
+            raise UnknownCassetteMode(mode=mode)
+
+        self.path = Path(path)
+        self.mode = mode
+        self._lock = threading.Lock()
+
+        # key -> recorded responses in order, and how many of them were replayed so far
+        self._responses: Dict[str, List[str]] = defaultdict(list)
+        self._replayed: Dict[str, int] = defaultdict(int)
+
+        if self.mode == "replay":
+            self.header = self.read_header(path)
+            with open(self.path, "r", encoding="utf-8") as f:
+                next(f)
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._responses[entry["key"]].append(entry["response"])
+        else:
+            self.header = None
+
+    @staticmethod
+    def read_header(path: str) -> Dict[str, str]:
+        """
+        Returns the provider and model a cassette was recorded with
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            return json.loads(f.readline())
+
+    def start_recording(self, provider: str, model: str) -> None:
+        """
+        Starts a new cassette for the provider and model, replacing an older one at the same path
+        """
+        self.header = {"provider": provider, "model": model}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(self.header) + "\n")
+
+    def record(self, key: str, response: Optional[str]) -> None:
+        """
+        Appends a response to the cassette
+        """
+        if self.mode != "record" or response is None:
+            return
+
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "response": response}) + "\n")
+
+    def replay(self, key: str) -> str:
+        """
+        Returns the next recorded response for the request. Once the recorded ones are used up
+        the last one is repeated.
+        """
+        with self._lock:
+            responses = self._responses.get(key)
+            if not responses:
+                raise CassetteResponseNotFound(path=str(self.path), key=key)
+
+            index = min(self._replayed[key], len(responses) - 1)
+            self._replayed[key] += 1
+            return responses[index]
+
+    @staticmethod
+    def as_vertexai_response(response: str, response_format) -> SimpleNamespace:
+        """
+        Wraps a recorded response to look like the parts of a VertexAI chat reply the agents read
+        """
+        return SimpleNamespace(
+            text=response,
+            parsed=response_format.model_validate_json(response),
+            usage_metadata=None,
+        )
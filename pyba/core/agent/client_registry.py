@@ -0,0 +1,62 @@
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Hashable
+from weakref import WeakKeyDictionary
+
+
+class ClientRegistry:
+    """
+    Process-wide registry of the LLM clients.
+
+    Building an `AsyncOpenAI` or `genai.Client` sets up a new HTTP connection pool, so the clients
+    are created once per provider and credentials and then handed to every agent and engine that
+    asks for the same ones. The steps then reuse warm keep-alive connections.
+
+    The async clients are bound to the event loop their connections were opened in. Engines running
+    in separate threads (or in back to back `asyncio.run` calls) each have their own loop, so the
+    clients are kept per running loop and are dropped along with it.
+    """
+
+    _lock = threading.Lock()
+    _loop_clients: "WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Hashable, Any]]" = (
+        WeakKeyDictionary()
+    )
+    _thread_clients: Dict[Hashable, Any] = {}
+
+    @classmethod
+    def get_client(cls, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """
+        Returns the client registered under the key for the running loop, creating it if needed
+
+        Args:
+            `key`: The provider along with the credentials the client is built from
+            `factory`: Builds a new client when there isn't one yet
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        with cls._lock:
+            if loop is not None:
+                clients = cls._loop_clients.setdefault(loop, {})
+            else:
+                # Outside a loop the client can only be used synchronously, so it's kept per thread
+                clients = cls._thread_clients
+                key = (key, threading.get_ident())
+
+            client = clients.get(key)
+            if client is None:
+                client = factory()
+                clients[key] = client
+
+            return client
+
+    @classmethod
+    def clear(cls) -> None:
+        """
+        Forgets all the registered clients
+        """
+        with cls._lock:
+            cls._loop_clients.clear()
+            cls._thread_clients.clear()
@@ -0,0 +1,135 @@
+import json
+from typing import Dict, List, Optional, Tuple
+
+from pyba.utils.load_yaml import load_config
+
+config = load_config("general")["main_engine_configs"]["dom_delta"]
+
+# The list-like fields of the cleaned DOM which are diffed between steps, with their display names
+DELTA_FIELDS = {
+    "hyperlinks": "hyperlinks",
+    "input_fields": "input fields",
+    "clickable_fields": "clickable elements",
+    "actual_text": "text lines",
+}
+
+
+class DOMDelta:
+    """
+    Keeps the reference DOM snapshot for a session and encodes the following steps as changes
+    against it.
+
+    The reference is the last cleaned DOM that was sent to the model in full. Every later step only
+    sends the added and removed hyperlinks, input fields, clickables and text lines along with a count
+    of what stayed the same. A full snapshot is sent again (and becomes the new reference) when:
+
+    - there is no reference yet
+    - the page navigated to a different URL
+    - `full_snapshot_every` steps have passed since the last full snapshot
+    - more than `max_change_ratio` of the page changed, in which case the delta isn't worth it
+    """
+
+    def __init__(
+        self,
+        full_snapshot_every: int = config["full_snapshot_every"],
+        max_change_ratio: float = config["max_change_ratio"],
+    ):
+        """
+        Args:
+            `full_snapshot_every`: Maximum number of steps between two full snapshots
+            `max_change_ratio`: Fraction of changed items above which a full snapshot is sent instead
+        """
+        self.full_snapshot_every = full_snapshot_every
+        self.max_change_ratio = max_change_ratio
+
+        self.reference: Optional[Dict] = None
+        self.steps_since_full = 0
+
+    @staticmethod
+    def _key(item) -> str:
+        """
+        Hashable key for a DOM item. Input fields and clickables are dictionaries.
+        """
+        if isinstance(item, dict):
+            return json.dumps(item, sort_keys=True, default=str)
+        return str(item)
+
+    @classmethod
+    def _diff(cls, old: List, new: List) -> Tuple[List, List, int]:
+        """
+        Order preserving diff of two lists
+
+        Returns:
+            The added items, the removed items and the number of unchanged items
+        """
+        old = old or []
+        new = new or []
+        old_keys = {cls._key(item) for item in old}
+        new_keys = {cls._key(item) for item in new}
+
+        added = [item for item in new if cls._key(item) not in old_keys]
+        removed = [item for item in old if cls._key(item) not in new_keys]
+        unchanged = len(new_keys & old_keys)
+
+        return added, removed, unchanged
+
+    def reset(self) -> None:
+        """
+        Drops the reference so that the next step is sent in full
+        """
+        self.reference = None
+        self.steps_since_full = 0
+
+    def encode(self, cleaned_dom: Dict) -> Optional[Dict]:
+        """
+        Encodes the cleaned DOM against the reference snapshot
+
+        Args:
+            `cleaned_dom`: The cleaned DOM dictionary for the current step
+
+        Returns:
+            A dictionary with `added_*`, `removed_*` and `unchanged_summary` keys for the delta
+            prompt, or None if a full snapshot must be sent. In the latter case the given DOM becomes
+            the new reference.
+        """
+        if (
+            self.reference is None
+            or cleaned_dom.get("current_url") != self.reference.get("current_url")
+            or self.steps_since_full >= self.full_snapshot_every
+        ):
+            self._set_reference(cleaned_dom)
+            return None
+
+        delta = {}
+        summary = []
+        changed = 0
+        total = 0
+
+        for field_name, display_name in DELTA_FIELDS.items():
+            added, removed, unchanged = self._diff(
+                self.reference.get(field_name), cleaned_dom.get(field_name)
+            )
+            delta[f"added_{field_name}"] = added
+            delta[f"removed_{field_name}"] = removed
+            summary.append(f"{unchanged} {display_name}")
+
+            changed += len(added) + len(removed)
+            total += len(added) + len(removed) + unchanged
+
+        if total and changed / total > self.max_change_ratio:
+            self._set_reference(cleaned_dom)
+            return None
+
+        delta["unchanged_summary"] = (
+            "Unchanged since the reference snapshot: " + ", ".join(summary) + "."
+        )
+        self.steps_since_full += 1
+
+        return delta
+
+    def _set_reference(self, cleaned_dom: Dict) -> None:
+        self.reference = {
+            field_name: cleaned_dom.get(field_name)
+            for field_name in (*DELTA_FIELDS, "current_url")
+        }
+        self.steps_since_full = 0
@@ -0,0 +1,159 @@
+import json
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from pyba.logger import get_logger
+from pyba.utils.common import url_entropy
+
+# The fields which compete for the budget. Lower priority numbers win ties in relevance, so the
+# input fields (few and almost always needed) go in first and the visible text goes in last.
+RANKED_FIELDS = {
+    "input_fields": 0,
+    "clickable_fields": 1,
+    "hyperlinks": 2,
+    "actual_text": 3,
+}
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOP_WORDS = frozenset(
+    (
+        "a an and are as at be by for from go in into is it of on or the then this to with "
+        "get me my all any each find open search show visit www http https com"
+    ).split()
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count for a piece of text. We don't ship a tokenizer, so this uses the usual
+    ~4 characters per token approximation which is close enough for budgeting.
+    """
+    return math.ceil(len(text) / 4)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercases and splits text into the words used for the relevance ranking
+    """
+    return [word for word in WORD_PATTERN.findall(text.lower()) if word not in STOP_WORDS]
+
+
+class DOMSerializer:
+    """
+    Fits the cleaned DOM into a per-step token budget.
+
+    Every hyperlink, input field, clickable element and text line is scored with BM25 against the
+    user's prompt (or the current plan in the exploratory modes). The items are then added greedily,
+    most relevant first, until the budget is used up. What made it in is returned in the original
+    page order so that the visible text still reads top to bottom.
+
+    High entropy URLs (long random IDs) are not dropped, they are ranked lower instead.
+    """
+
+    def __init__(self, token_budget: int, k1: float = 1.2, b: float = 0.75):
+        """
+        Args:
+            `token_budget`: The maximum number of tokens the DOM fields may use in a prompt
+            `k1`, `b`: The BM25 parameters
+        """
+        self.token_budget = token_budget
+        self.k1 = k1
+        self.b = b
+
+        self.log = get_logger()
+        self.last_token_count = 0
+
+    @staticmethod
+    def _item_text(item) -> str:
+        if isinstance(item, dict):
+            return json.dumps(item, default=str)
+        return str(item)
+
+    def _bm25_scores(self, documents: List[List[str]], query: List[str]) -> List[float]:
+        """
+        Scores every tokenized document against the query terms
+        """
+        if not documents or not query:
+            return [0.0] * len(documents)
+
+        document_count = len(documents)
+        average_length = sum(len(doc) for doc in documents) / document_count or 1.0
+        document_frequency = Counter(word for doc in documents for word in set(doc))
+
+        idf = {
+            word: math.log(
+                1
+                + (document_count - document_frequency[word] + 0.5)
+                / (document_frequency[word] + 0.5)
+            )
+            for word in set(query)
+        }
+
+        scores = []
+        for doc in documents:
+            term_frequency = Counter(doc)
+            length_norm = self.k1 * (1 - self.b + self.b * len(doc) / average_length)
+            score = 0.0
+            for word in query:
+                tf = term_frequency.get(word)
+                if tf:
+                    score += idf[word] * tf * (self.k1 + 1) / (tf + length_norm)
+            scores.append(score)
+
+        return scores
+
+    def serialize(self, cleaned_dom: Dict, query: str) -> Tuple[Dict, int]:
+        """
+        Trims the ranked fields of the cleaned DOM to the token budget
+
+        Args:
+            `cleaned_dom`: The cleaned DOM dictionary
+            `query`: The user prompt or the current plan
+
+        Returns:
+            A copy of the cleaned DOM with the ranked fields trimmed, and the estimated number of
+            tokens those fields use
+        """
+        query_terms = tokenize(query or "")
+
+        candidates = []  # (score, field priority, position, field name, item, cost)
+        for field_name, priority in RANKED_FIELDS.items():
+            items = cleaned_dom.get(field_name) or []
+            if isinstance(items, str):
+                items = [items]
+
+            texts = [self._item_text(item) for item in items]
+            scores = self._bm25_scores([tokenize(text) for text in texts], query_terms)
+
+            for position, (item, text, score) in enumerate(zip(items, texts, scores)):
+                if field_name == "hyperlinks" and url_entropy(text) >= 5.0:
+                    score *= 0.5
+                # +2 accounts for the separators the list gets formatted with
+                candidates.append(
+                    (score, priority, position, field_name, item, estimate_tokens(text) + 2)
+                )
+
+        candidates.sort(key=lambda candidate: (-candidate[0], candidate[1], candidate[2]))
+
+        used = 0
+        selected = {field_name: [] for field_name in RANKED_FIELDS}
+        for score, priority, position, field_name, item, cost in candidates:
+            if used + cost > self.token_budget:
+                continue
+            selected[field_name].append((position, item))
+            used += cost
+
+        serialized = dict(cleaned_dom)
+        for field_name, items in selected.items():
+            serialized[field_name] = [item for position, item in sorted(items, key=lambda x: x[0])]
+
+        dropped = len(candidates) - sum(len(items) for items in selected.values())
+        self.last_token_count = used
+        self.log.info(
+            f"Serialized the DOM with ~{used}/{self.token_budget} tokens, dropped {dropped} low relevance items"
+        )
+
+        return serialized, used
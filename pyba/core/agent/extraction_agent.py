@@ -1,18 +1,130 @@
+import asyncio
 import json
-import threading
+from typing import Any, Dict, List, Optional, Union
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 
 from pyba.core.agent.base_agent import BaseAgent
+from pyba.core.agent.dom_serializer import estimate_tokens
+from pyba.utils.load_yaml import load_config
 from pyba.utils.prompts.extraction_prompts import extraction_general_instruction
 
+config = load_config("general")["main_engine_configs"]["extraction_chunking"]
+
+# Values the model fills in when a chunk doesn't have a field, they lose to any real value
+EMPTY_VALUES = ("", "nothing available", "n/a", "none", "null")
+
+
+def split_text(text: str, chunk_tokens: int, overlap_tokens: int = 0) -> List[str]:
+    """
+    Splits the page text into chunks of about `chunk_tokens` tokens on line boundaries
+
+    Args:
+        `text`: The page text
+        `chunk_tokens`: The size of each chunk
+        `overlap_tokens`: The trailing lines of a chunk repeated at the start of the next one, so
+            that an item cut at the boundary is still whole in one of them
+
+    A single line longer than a chunk is cut into chunk sized pieces.
+    """
+    chunk_chars = chunk_tokens * 4
+    # The overlap has to leave room for new text in every chunk
+    overlap_tokens = min(overlap_tokens, chunk_tokens // 2)
+    lines = []
+    for line in text.splitlines():
+        while len(line) > chunk_chars:
+            lines.append(line[:chunk_chars])
+            line = line[chunk_chars:]
+        lines.append(line)
+
+    chunks = []
+    current, current_tokens = [], 0
+    for line in lines:
+        line_tokens = estimate_tokens(line) + 1
+        if current and current_tokens + line_tokens > chunk_tokens:
+            chunks.append("\n".join(current))
+
+            # Carry the tail of the chunk over as the overlap
+            overlap, overlap_size = [], 0
+            for previous in reversed(current):
+                previous_tokens = estimate_tokens(previous) + 1
+                if overlap_size + previous_tokens > overlap_tokens:
+                    break
+                overlap.insert(0, previous)
+                overlap_size += previous_tokens
+            current, current_tokens = overlap, overlap_size
+
+        current.append(line)
+        current_tokens += line_tokens
+
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def _is_empty(value: Any) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, str):
+        return value.strip().lower() in EMPTY_VALUES
+    if isinstance(value, (list, dict)):
+        return not value
+    return False
+
+
+def _merge_values(values: List[Any]) -> Any:
+    filled = [value for value in values if not _is_empty(value)]
+    if not filled:
+        # Keeping the placeholder so that the merged object still validates against the format
+        return next((value for value in values if value is not None), None)
+    values = filled
+
+    if all(isinstance(value, list) for value in values):
+        # Lists are concatenated in chunk order, dropping the items repeated by the overlap
+        merged, seen = [], set()
+        for value in values:
+            for item in value:
+                key = json.dumps(item, sort_keys=True, default=str)
+                if key not in seen:
+                    seen.add(key)
+                    merged.append(item)
+        return merged
+
+    if all(isinstance(value, dict) for value in values):
+        return merge_extractions(values)
+
+    # Scalars keep the first real value found on the page
+    return values[0]
+
+
+def merge_extractions(parts: List[Any]) -> Dict:
+    """
+    Merges the objects extracted from the chunks of a page into one
+
+    Args:
+        `parts`: The chunk results, as dicts or pydantic models of the same format
+
+    List fields are concatenated and deduplicated, nested objects are merged field by field and
+    the other fields keep the first non empty value.
+    """
+    dicts = [part.model_dump() if isinstance(part, BaseModel) else part for part in parts]
+
+    fields = []
+    for part in dicts:
+        fields.extend(field for field in part if field not in fields)
+
+    return {field: _merge_values([part.get(field) for part in dicts]) for field in fields}
+
 
 class ExtractionAgent(BaseAgent):
     """
     This is a helper agent in all aspects. To use this, all other agents
     need to import and initialise this.
 
-    This agent allows for threaded infomation extraction to not hinder the main pipeline flow.
+    This agent allows for background infomation extraction to not hinder the main pipeline flow.
+
+    Long pages can be extracted in chunks (map-reduce) so that the latency and the prompt size
+    stay flat as the page grows, see `info_extraction`.
 
     Args:
         `extraction_format`: The format which should be fitted for the extraction
@@ -22,6 +134,7 @@ class ExtractionAgent(BaseAgent):
         super().__init__(engine=engine)  # Initialising the base params from BaseAgent
 
         self.extraction_format = extraction_format
+        self.chunk_tokens = self.engine.extraction_chunk_tokens
         self.agent = self.llm_factory.get_extraction_agent(
             extraction_format=self.extraction_format
         )  # Getting the extraction agent
@@ -36,39 +149,29 @@ class ExtractionAgent(BaseAgent):
         """
         return extraction_general_instruction.format(task=task, actual_text=actual_text)
 
-    def info_extraction(self, task: str, actual_text: str) -> None:
+    async def _extract(self, prompt: str) -> Optional[Any]:
         """
-        Function to extract data from the current page
+        Calls the extraction agent with a prompt and parses its reply
 
         Args:
-            `task`: The user's defined task
-            `actual_text`: The current page text
+            `prompt`: The extraction prompt for the page or one of its chunks
 
-        This function for now only Logs the value and doesn't return anything
+        Returns:
+            The extracted object (a dict for OpenAI, the `extraction_format` model otherwise), or
+            None if the response couldn't be parsed
         """
-
-        # THE FINAL PIECE OF THE PUZZLE
-        prompt = self._initialise_prompt(task=task, actual_text=actual_text)
-
         if self.engine.provider == "openai":
-            response = self.handle_openai_execution(
+            response = await self.handle_openai_execution(
                 agent=self.agent,
                 prompt=prompt,
             )
             try:
-                parsed_json = json.loads(response.choices[0].message.content)
-                self.log.info(f"Extracted content: {parsed_json}")
-                if self.engine.db_funcs:
-                    self.engine.db_funcs.push_to_semantic_memory(
-                        self.engine.session_id, logs=json.dumps(parsed_json)
-                    )
-                    self.log.info("Added to semantic memory")
+                return json.loads(response.choices[0].message.content)
             except Exception as e:
                 self.log.error(f"Unable to parse the outoput from OpenAI response: {e}")
                 return None
         elif self.engine.provider == "vertexai":
-            print("In here")
-            response = self.handle_vertexai_execution(agent=self.agent, prompt=prompt)
+            response = await self.handle_vertexai_execution(agent=self.agent, prompt=prompt)
 
             try:
                 parsed_object = getattr(
@@ -79,44 +182,113 @@ class ExtractionAgent(BaseAgent):
                     self.log.error("No parsed object found in VertexAI response.")
                     return None
 
-                self.log.info(f"Extracted content: {parsed_object}")
-                if self.engine.db_funcs:
-                    print("in here")
-                    self.engine.db_funcs.push_to_semantic_memory(
-                        self.engine.session_id, logs=parsed_object.json()
-                    )
-                    self.log.info("Added to semantic memory")
+                return parsed_object
 
             except Exception as e:
-                print(f"hit exception: {e}")
                 if not response:
                     self.log.error(f"Unable to parse the output from VertexAI response: {e}")
                 # If we have a response which cannot be parsed, it MUST be a None value
+                return None
         else:  # Using gemini
-            response = self.handle_gemini_execution(agent=self.agent, prompt=prompt)
-            parsed_object = self.agent["response_format"].model_validate_json(response.text)
-            self.log.info(f"Extracted content: {parsed_object}")
-            if self.engine.db_funcs:
-                self.engine.db_funcs.push_to_semantic_memory(
-                    self.engine.session_id, logs=parsed_object.json()
-                )
-                self.log.info("Added to semantic memory")
+            response = await self.handle_gemini_execution(agent=self.agent, prompt=prompt)
+            return self.agent["response_format"].model_validate_json(response.text)
+
+    async def _chunked_extraction(self, task: str, actual_text: str) -> Optional[Any]:
+        """
+        Extracts every chunk of a long page concurrently and merges the results
+
+        Args:
+            `task`: The user's defined task
+            `actual_text`: The current page text, longer than a single chunk
+
+        A chunk that fails is logged and left out, the rest of the page is still merged.
+        """
+        chunks = split_text(actual_text, self.chunk_tokens, config["overlap_tokens"])
+        self.log.info(f"Extracting from the page in {len(chunks)} chunks")
+        semaphore = asyncio.Semaphore(config["max_concurrency"])
+
+        async def extract_chunk(chunk: str) -> Optional[Any]:
+            async with semaphore:
+                return await self._extract(self._initialise_prompt(task=task, actual_text=chunk))
+
+        results = await asyncio.gather(
+            *(extract_chunk(chunk) for chunk in chunks), return_exceptions=True
+        )
+
+        parts = []
+        for result in results:
+            if isinstance(result, Exception):
+                self.log.error("Extraction failed for a chunk of the page", result)
+            elif result is not None:
+                parts.append(result)
+
+        if not parts:
+            return None
+
+        merged = merge_extractions(parts)
+        if self.engine.provider == "openai":
+            return merged
+
+        try:
+            return self.extraction_format.model_validate(merged)
+        except ValidationError as e:
+            self.log.warning(f"The merged extraction doesn't fit the format, using a chunk: {e}")
+            return parts[0]
+
+    async def info_extraction(
+        self, task: str, actual_text: Union[str, List[str]]
+    ) -> Optional[Any]:
+        """
+        Function to extract data from the current page
+
+        Args:
+            `task`: The user's defined task
+            `actual_text`: The current page text, or its lines as the cleaned_dom keeps them
 
-    def run_threaded_info_extraction(self, task: str, actual_text: str):
+        If the engine sets an `extraction_chunk_tokens` and the page is longer than that, the text
+        is split into chunks which are extracted concurrently and merged into a single object.
+
+        Returns:
+            The extracted object (a dict for OpenAI, the `extraction_format` model otherwise), or
+            None if the response couldn't be parsed
+        """
+        if isinstance(actual_text, list):
+            actual_text = "\n".join(actual_text)
+
+        if self.chunk_tokens and estimate_tokens(actual_text) > self.chunk_tokens:
+            extracted = await self._chunked_extraction(task=task, actual_text=actual_text)
+        else:
+            # THE FINAL PIECE OF THE PUZZLE
+            prompt = self._initialise_prompt(task=task, actual_text=actual_text)
+            extracted = await self._extract(prompt)
+
+        if extracted is None:
+            return None
+
+        self.log.info(f"Extracted content: {extracted}")
+        if self.engine.db_funcs:
+            logs = json.dumps(extracted) if isinstance(extracted, dict) else extracted.json()
+            self.engine.db_funcs.push_to_semantic_memory(self.engine.session_id, logs=logs)
+            self.log.info("Added to semantic memory")
+
+        return extracted
+
+    def run_async_info_extraction(
+        self, task: str, actual_text: Union[str, List[str]]
+    ) -> asyncio.Task:
         """
-                Fuction to thread the execution of the `info_extraction` function
+        Function to schedule the `info_extraction` coroutine on the engine's extraction pool
 
-                Args:
+        Args:
             `task`: The user's defined task
-            `actual_text`: The current page text
+            `actual_text`: The current page text, or its lines
 
-        This function creates a separate thread for calling the agent on the current page
-        and extracting the relevant information with the right format.
+        This function creates a background task for calling the agent on the current page
+        and extracting the relevant information with the right format. The main loop carries
+        on with the next action while the extraction waits on the model. The pool bounds how
+        many extractions run at once and collects their results for the end of the run.
         """
         self.log.info("Running the extractor on the current page")
-        thread = threading.Thread(
-            target=self.info_extraction,
-            args=(task, actual_text),
-            daemon=True,
+        return self.engine.extraction_pool.submit(
+            self.info_extraction(task=task, actual_text=actual_text)
         )
-        thread.start()
@@ -0,0 +1,118 @@
+import asyncio
+from typing import Any, Coroutine, List, Optional
+
+from pyba.logger import get_logger
+from pyba.utils.load_yaml import load_config
+
+config = load_config("general")["main_engine_configs"]["extraction_pool"]
+
+
+class ExtractionPool:
+    """
+    A bounded pool for the background extractions of one engine.
+
+    Every page with `extract_info` set schedules an extraction on the running event loop. At most
+    `max_in_flight` of them talk to the LLM at once, the rest wait on a semaphore in the order they
+    were scheduled. The extracted objects are collected as the tasks finish so that the engine can
+    hand them back to the caller once the run is over.
+
+    At shutdown `drain` waits for the outstanding extractions (up to `drain_timeout_seconds`) and
+    cancels whatever is still running after that, so nothing is left running after the event loop
+    is closed.
+    """
+
+    def __init__(self, max_in_flight: int = None, drain_timeout_seconds: Optional[float] = None):
+        """
+        Args:
+            `max_in_flight`: The maximum number of extractions calling the LLM at the same time
+            `drain_timeout_seconds`: How long `drain` waits before cancelling the extractions
+        """
+        self.max_in_flight = max_in_flight or config["max_in_flight"]
+        self.drain_timeout = (
+            drain_timeout_seconds
+            if drain_timeout_seconds is not None
+            else config["drain_timeout_seconds"]
+        )
+
+        # Built lazily because the semaphore has to belong to the loop the engine runs on
+        self.semaphore = None
+        self.tasks = set()
+        self.results: List[Any] = []
+        self.extracted = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.log = get_logger()
+
+    async def _run(self, coroutine: Coroutine) -> Any:
+        try:
+            async with self.semaphore:
+                result = await coroutine
+        except asyncio.CancelledError:
+            # Closing it as well in case the task was cancelled while waiting for a slot
+            coroutine.close()
+            raise
+        except Exception as e:
+            self.failed += 1
+            self.log.error("Background extraction failed", e)
+            return None
+
+        if result is not None:
+            self.results.append(result)
+            self.extracted += 1
+        return result
+
+    def submit(self, coroutine: Coroutine) -> asyncio.Task:
+        """
+        Schedules an extraction coroutine on the running event loop
+
+        Args:
+            `coroutine`: The extraction to run, it should return the extracted object or None
+
+        Returns:
+            The task for the extraction, it starts calling the LLM once a slot frees up
+        """
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        if len(self.tasks) >= self.max_in_flight:
+            self.log.info(f"{len(self.tasks)} extractions in flight, this one waits for a slot")
+
+        task = asyncio.get_running_loop().create_task(self._run(coroutine))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def drain(self) -> List[Any]:
+        """
+        Waits for the outstanding extractions and cancels the ones that outlive the drain timeout
+
+        Returns:
+            The objects extracted since the last drain, in the order they finished
+        """
+        pending = set(self.tasks)
+        if pending:
+            self.log.info(f"Waiting on {len(pending)} background extractions")
+            _, pending = await asyncio.wait(pending, timeout=self.drain_timeout)
+
+        if pending:
+            self.log.warning(f"Cancelling {len(pending)} extractions still running at shutdown")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            self.cancelled += len(pending)
+
+        # The next run may be on a new event loop, which the semaphore can't be shared with
+        self.semaphore = None
+        results, self.results = self.results, []
+        return results
+
+    def stats(self) -> dict:
+        """
+        Returns the extraction counts for the session
+        """
+        return {
+            "extracted": self.extracted,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "in_flight": len(self.tasks),
+        }
@@ -1,17 +1,22 @@
-from typing import Tuple, Dict, Optional
+import copy
+from typing import Tuple, Dict, List, Optional, Set
 
 # VertexAI and gemini
 from google import genai
 from google.genai.types import GenerateContentConfig
 
 # OpenAI
-from openai import OpenAI
+from openai import APIStatusError, AsyncOpenAI
 from pydantic import BaseModel
 
+from pyba.core.agent.client_registry import ClientRegistry
 from pyba.utils.exceptions import IncorrectMode
 from pyba.utils.load_yaml import load_config
 from pyba.utils.prompts import (
     system_instruction,
+    general_prompt_rules,
+    general_prompt_batch_rules,
+    compact_action_system_instruction,
     output_system_instruction,
     BFS_planner_system_instruction,
     DFS_planner_system_instruction,
@@ -19,6 +24,7 @@ from pyba.utils.prompts import (
 )
 from pyba.utils.structure import (
     PlaywrightResponse,
+    CompactPlaywrightResponse,
     OutputResponseFormat,
     PlannerAgentOutputBFS,
     PlannerAgentOutputDFS,
@@ -28,6 +34,59 @@ from pyba.utils.structure import (
 config = load_config("general")
 
 
+def _strict_json_schema(schema: Dict, root: Dict) -> Dict:
+    """
+    Rewrites a pydantic JSON schema in place into the strict form OpenAI's structured outputs
+    accept: every object closed and all of its properties required, `None` defaults dropped,
+    single-entry `allOf`s and `$ref`s with sibling keys inlined. These are the same rules
+    `chat.completions.parse` applies.
+
+    Args:
+        `schema`: The (sub)schema to rewrite
+        `root`: The whole schema, to resolve the `$ref`s against
+    """
+    for definition in schema.get("$defs", {}).values():
+        _strict_json_schema(definition, root)
+
+    if schema.get("type") == "object":
+        schema.setdefault("additionalProperties", False)
+
+    properties = schema.get("properties")
+    if isinstance(properties, dict):
+        schema["required"] = list(properties)
+        for prop in properties.values():
+            _strict_json_schema(prop, root)
+
+    if isinstance(schema.get("items"), dict):
+        _strict_json_schema(schema["items"], root)
+
+    for variant in schema.get("anyOf", []):
+        _strict_json_schema(variant, root)
+
+    all_of = schema.get("allOf")
+    if isinstance(all_of, list):
+        for entry in all_of:
+            _strict_json_schema(entry, root)
+        if len(all_of) == 1:
+            schema.pop("allOf")
+            schema.update(all_of[0])
+
+    if "default" in schema and schema["default"] is None:
+        schema.pop("default")
+
+    ref = schema.get("$ref")
+    if ref and len(schema) > 1:
+        resolved = root
+        for key in ref[2:].split("/"):
+            resolved = resolved[key]
+        # The keys next to the `$ref` take priority over the ones of the definition
+        schema.update({**copy.deepcopy(resolved), **schema})
+        schema.pop("$ref")
+        return _strict_json_schema(schema, root)
+
+    return schema
+
+
 class LLMFactory:
     """
     Class for handling different types of LLM. The supported LLMs are:
@@ -35,8 +94,24 @@ class LLMFactory:
     1. OpenAI - GPT-4o, GPT-3.5-turbo
     2. VertexAI - Gemini-2.5-pro
     3. Native gemini-2.5-pro API
+
+    All the agents handed out by the factory are backed by async clients (`AsyncOpenAI` and the
+    `aio` surface of `genai.Client`) so that they can be awaited from inside the engine's event loop.
+    The clients come from the process-wide `ClientRegistry` and the agent parameters are built once
+    per instruction and schema, so creating a factory per agent is cheap. The JSON schemas and the
+    provider configs derived from the response models are cached per model class in the same way.
     """
 
+    # (provider, model, system instruction, response schema) -> agent parameters
+    _agent_configs: Dict[tuple, Dict] = {}
+    # Pydantic model -> its JSON schema, and the OpenAI `response_format` built from it
+    _json_schemas: Dict[type, Dict] = {}
+    _openai_response_formats: Dict[type, Dict] = {}
+    # (cached content or system instruction, response schema) -> the VertexAI generation config
+    _vertexai_configs: Dict[tuple, GenerateContentConfig] = {}
+    # OpenAI compatible servers found to lack structured outputs, asked in JSON mode from then on
+    _json_mode_clients: Set[tuple] = set()
+
     def __init__(self, engine):
         """
         Initialise the engine parameters as given by the user
@@ -45,19 +120,186 @@ class LLMFactory:
                 engine: The LLM parameters provided by the user
         """
         self.engine = engine
-        self.vertexai_client = None
-        self.openai_client = None
-        self.gemini_client = None
 
         if self.engine.provider == "openai":
-            self.openai_client = self._initialize_openai_client()
+            self.client_key = ("openai", self.engine.openai_api_key, self.engine.openai_base_url)
+            self._initialize_client = self._initialize_openai_client
         elif self.engine.provider == "vertexai":
-            self.vertexai_client = self._initialize_vertexai_client()
+            self.client_key = ("vertexai", self.engine.vertexai_project_id, self.engine.location)
+            self._initialize_client = self._initialize_vertexai_client
         else:
-            self.gemini_client = self._initialize_gemini_client()
+            self.client_key = ("gemini", self.engine.gemini_api_key)
+            self._initialize_client = self._initialize_gemini_client
 
         self.mode = self.engine.mode  # Mode of operation for Exploratory, DFS|BFS
 
+    def get_client(self):
+        """
+        Returns the shared client for the provider and credentials of the engine. This is resolved
+        at call time so that the client belongs to the event loop making the call.
+        """
+        return ClientRegistry.get_client(self.client_key, self._initialize_client)
+
+    def uses_json_mode(self) -> bool:
+        """
+        Whether OpenAI requests should use JSON mode with local validation instead of the strict
+        `json_schema` response format
+        """
+        structured_output = config["main_engine_configs"]["openai"]["structured_output"]
+        return structured_output == "json" or self.client_key in self._json_mode_clients
+
+    def can_fall_back_to_json_mode(self, error: Exception) -> bool:
+        """
+        Whether a request rejected with the strict response format may be retried in JSON mode.
+        This is only done for OpenAI compatible servers, OpenAI itself always supports structured
+        outputs, and only when the server rejected the response format itself. Other failures such
+        as a wrong key or a context overflow would fail the same way in JSON mode.
+
+        Args:
+            `error`: The error the server rejected the request with
+        """
+        structured_output = config["main_engine_configs"]["openai"]["structured_output"]
+        return (
+            structured_output == "auto"
+            and self.engine.openai_base_url is not None
+            and not self.uses_json_mode()
+            and self._rejects_response_format(error)
+        )
+
+    @staticmethod
+    def _rejects_response_format(error: Exception) -> bool:
+        """
+        Whether the error is a bad request complaining about the `response_format` or the
+        `json_schema` in it
+        """
+        if not isinstance(error, APIStatusError) or error.status_code not in (400, 422):
+            return False
+        message = str(error).lower()
+        return "response_format" in message or "json_schema" in message
+
+    def fall_back_to_json_mode(self) -> None:
+        """
+        Remembers that the server behind this client has to be asked in JSON mode
+        """
+        self._json_mode_clients.add(self.client_key)
+
+    def create_chat(self, agent: Dict, history: List = None):
+        """
+        Opens the chat session for a VertexAI agent
+
+        Args:
+            `agent`: The VertexAI agent parameters
+            `history`: Earlier turns the chat starts with
+        """
+        return self.get_client().aio.chats.create(
+            model=agent["model"],
+            config=self.vertexai_config(
+                agent["response_format"], system_instruction=agent["system_instruction"]
+            ),
+            history=history,
+        )
+
+    def trim_chat(self, agent: Dict, turns: int) -> None:
+        """
+        Keeps only the last `turns` exchanges in a VertexAI agent's chat. The chat is reopened
+        with the shortened history, which is only held client side and sent with the next message.
+
+        Args:
+            `agent`: The VertexAI agent parameters, holding the chat
+            `turns`: The number of user and model exchanges to keep
+        """
+        history = agent["chat"].get_history(curated=True)
+        if len(history) <= 2 * turns:
+            return
+
+        history = history[-2 * turns :]
+        # A turn starts with the user's message, never with a dangling model reply
+        while history and history[0].role != "user":
+            history = history[1:]
+        agent["chat"] = self.create_chat(agent, history=history)
+
+    @classmethod
+    def json_schema(cls, response_schema) -> Dict:
+        """
+        Returns the JSON schema of a response model, generated once per process. The schema of
+        `PlaywrightResponse` alone is a few thousand tokens, so it isn't rebuilt for every call.
+
+        Args:
+            `response_schema`: The pydantic model of the response
+        """
+        schema = cls._json_schemas.get(response_schema)
+        if schema is None:
+            schema = response_schema.model_json_schema()
+            cls._json_schemas[response_schema] = schema
+        return schema
+
+    @classmethod
+    def openai_response_format(cls, response_schema) -> Dict:
+        """
+        Returns the strict `json_schema` response format OpenAI expects for a response model, built
+        once per process from the cached JSON schema. This is the conversion
+        `chat.completions.parse` would redo on every call.
+
+        Args:
+            `response_schema`: The pydantic model of the response
+        """
+        response_format = cls._openai_response_formats.get(response_schema)
+        if response_format is None:
+            schema = copy.deepcopy(cls.json_schema(response_schema))
+            response_format = {
+                "type": "json_schema",
+                "json_schema": {
+                    "schema": _strict_json_schema(schema, root=schema),
+                    "name": response_schema.__name__,
+                    "strict": True,
+                },
+            }
+            cls._openai_response_formats[response_schema] = response_format
+        return response_format
+
+    @classmethod
+    def vertexai_config(
+        cls, response_schema, system_instruction: str = None, cached_content: str = None
+    ) -> GenerateContentConfig:
+        """
+        Returns the VertexAI generation config for a response model, built once for each system
+        instruction (or explicit cache serving it) and response model
+
+        Args:
+            `response_schema`: The pydantic model of the response
+            `system_instruction`: The system instruction sent inline
+            `cached_content`: The name of the explicit cache holding the system instruction
+        """
+        key = (cached_content or system_instruction, response_schema)
+        generation_config = cls._vertexai_configs.get(key)
+        if generation_config is None:
+            generation_config = GenerateContentConfig(
+                temperature=0,
+                system_instruction=None if cached_content else system_instruction,
+                cached_content=cached_content,
+                response_schema=response_schema,
+                response_mime_type="application/json",
+            )
+            cls._vertexai_configs[key] = generation_config
+        return generation_config
+
+    def _cached_agent(self, system_instruction: str, response_schema, model: str) -> Dict:
+        """
+        Returns the agent parameters for the instruction and schema, built once per process. Each
+        caller gets its own copy so that per-agent state (the VertexAI chat) is never shared.
+        """
+        key = (self.engine.provider, model, system_instruction, response_schema)
+        agent = self._agent_configs.get(key)
+        if agent is None:
+            agent = {
+                "system_instruction": system_instruction,
+                "model": model,
+                "response_format": response_schema,
+            }
+            self._agent_configs[key] = agent
+
+        return dict(agent)
+
     def _initialize_vertexai_client(self):
         """
         Initialises the VertexAI client using engine parameters
@@ -69,55 +311,52 @@ class LLMFactory:
 
         return vertexai_client
 
-    def _initialize_vertexai_agent(self, system_instruction: str, response_schema):
+    def _initialize_vertexai_agent(self, system_instruction: str, response_schema, model=None):
         """
         Initiaises a VertexAI agent
 
         Args:
                 `system_instruction`: The system instruction for the agent
                 `response_schema`: The response schema for the Agent
+                `model`: The model for the agent, defaults to the engine's model
+
+        Returns:
+                Dictionary of the agent parameters along with a slot for the chat session
         """
         assert system_instruction is not None and response_schema is not None
 
-        agent = self.vertexai_client.chats.create(
-            model=self.engine.model,
-            config=GenerateContentConfig(
-                temperature=0,
-                system_instruction=system_instruction,
-                response_schema=response_schema,
-                response_mime_type="application/json",
-            ),
-        )
+        agent = self._cached_agent(system_instruction, response_schema, model or self.engine.model)
+        # The chat is opened on the first call, from inside the event loop that uses it
+        agent["chat"] = None
 
         return agent
 
     def _initialize_openai_client(self):
         """
-        Initialize the OpenAI client using engine parameters
+        Initialize the async OpenAI client using engine parameters. The `base_url` points it
+        at an OpenAI compatible server instead, if one is configured.
         """
-        openai_client = OpenAI(api_key=self.engine.openai_api_key)
+        openai_client = AsyncOpenAI(
+            api_key=self.engine.openai_api_key, base_url=self.engine.openai_base_url
+        )
         return openai_client
 
-    def _initialize_openai_agent(self, system_instruction: str, response_schema) -> Dict:
+    def _initialize_openai_agent(
+        self, system_instruction: str, response_schema, model: str = None
+    ) -> Dict:
         """
         Initialize the OpenAI agent
 
         Args:
                 `system_instruction`: The system instruction for the agent
                 `response_schema`: The response type for the agent
+                `model`: The model for the agent, defaults to the engine's model
 
         Returns:
                 Dictionary of the agent parameters
         """
 
-        agent = {
-            "client": self.openai_client,
-            "system_instruction": system_instruction,
-            "model": config["main_engine_configs"]["openai"]["model"],
-            "response_format": response_schema,
-        }
-
-        return agent
+        return self._cached_agent(system_instruction, response_schema, model or self.engine.model)
 
     def _initialize_gemini_client(self):
         """
@@ -126,25 +365,52 @@ class LLMFactory:
         gemini_client = genai.Client(vertexai=False, api_key=self.engine.gemini_api_key)
         return gemini_client
 
-    def _initialize_gemini_agent(self, system_instruction: str, response_schema) -> Dict:
+    def _initialize_gemini_agent(
+        self, system_instruction: str, response_schema, model: str = None
+    ) -> Dict:
         """
         Initilse the Gemini Agent
 
         Args:
             `system_instruction`: The system instruction for the agent
             `response_schema`: The response type for the agent
+            `model`: The model for the agent, defaults to the engine's model
 
         Returns:
             Dictionary of the agent parameters
         """
-        agent = {
-            "client": self.gemini_client,
-            "system_instruction": system_instruction,
-            "model": self.engine.model,
-            "response_format": response_schema,
-        }
+        return self._cached_agent(system_instruction, response_schema, model or self.engine.model)
 
-        return agent
+    def create_action_agent(self, init_method, model: str = None):
+        """
+        Create the action agent
+
+        Args:
+            `init_method`: Function to initialise the respective LLM agent
+            `model`: The model for the agent, defaults to the engine's model
+        """
+        # The rules for the action agent never change between steps, so they go into the system
+        # instruction. This keeps them at the front of every request where they can be cached.
+        if self.engine.use_compact_actions:
+            action_system_instruction = compact_action_system_instruction
+            response_schema = CompactPlaywrightResponse
+        else:
+            action_system_instruction = system_instruction + general_prompt_rules
+            response_schema = PlaywrightResponse
+
+        if self.engine.use_action_batching:
+            action_system_instruction += general_prompt_batch_rules.format(
+                max_actions=config["main_engine_configs"]["action_batching"]["max_actions"]
+            )
+
+        action_agent = init_method(
+            system_instruction=action_system_instruction,
+            response_schema=response_schema,
+            model=model,
+        )
+        action_agent["agent_type"] = "action"
+
+        return action_agent
 
     def create_agentic_pair(self, init_method) -> Tuple:
         """
@@ -157,12 +423,11 @@ class LLMFactory:
             A tuple containing the action and output agent
         """
 
-        action_agent = init_method(
-            system_instruction=system_instruction, response_schema=PlaywrightResponse
-        )
+        action_agent = self.create_action_agent(init_method)
         output_agent = init_method(
             system_instruction=output_system_instruction, response_schema=OutputResponseFormat
         )
+        output_agent["agent_type"] = "output"
 
         return (action_agent, output_agent)
 
@@ -186,6 +451,7 @@ class LLMFactory:
         planner_agent = init_method(
             system_instruction=system_instruction, response_schema=response_schema
         )
+        planner_agent["agent_type"] = "planner"
 
         return planner_agent
 
@@ -207,6 +473,7 @@ class LLMFactory:
                 system_instruction=extraction_system_instruction,
                 response_schema=GeneralExtractionResponse,
             )
+        extraction_agent["agent_type"] = "extraction"
 
         return extraction_agent
 
@@ -228,6 +495,22 @@ class LLMFactory:
 
         return agents
 
+    def get_fast_action_agent(self, model: str):
+        """
+        Endpoint to return an action agent backed by a smaller model, for the model router
+
+        Args:
+            `model`: The fast model's name for the provider
+        """
+        if self.engine.provider == "openai":
+            init_method = self._initialize_openai_agent
+        elif self.engine.provider == "vertexai":
+            init_method = self._initialize_vertexai_agent
+        else:
+            init_method = self._initialize_gemini_agent
+
+        return self.create_action_agent(init_method, model=model)
+
     def get_planner_agent(self):
         """
         Endpoint to return the planner agent depending on the LLM called for. If
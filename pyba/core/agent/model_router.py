@@ -0,0 +1,93 @@
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from pyba.utils.load_yaml import load_config
+
+config = load_config("general")["main_engine_configs"]["model_routing"]
+
+
+class ModelRouter:
+    """
+    Routes the action steps between a fast and a large model.
+
+    Every step goes to the fast model first. The step is escalated to the large model when:
+
+    - `action_failed`: the previous action failed, so the retry goes straight to the large model
+    - `invalid_response`: the fast model's reply errored or didn't validate against the schema
+    - `completion_check`: the fast model says the task is done, which would end the run
+    - `repeated_action`: the fast model repeats the last action, a sign that it is stuck
+
+    The router only decides and keeps count. The calls themselves are made by the
+    `PlaywrightAgent`, which reports each tier's latency back so that the split can be tuned.
+    """
+
+    def __init__(self, provider: str, large_model: str, fast_model: str = None):
+        """
+        Args:
+            `provider`: The provider the models belong to
+            `large_model`: The engine's model, used for the escalations
+            `fast_model`: The model tried first, defaults to the one configured for the provider
+        """
+        self.large_model = large_model
+        self.fast_model = fast_model or config["fast_models"][provider]
+
+        self.calls = Counter()
+        self.latency = Counter()
+        self.escalations = Counter()
+        self.last_action = None
+
+    @staticmethod
+    def _is_completion(action: Any) -> bool:
+        if isinstance(action, list):
+            return False
+        return all(value is None for value in vars(action).values())
+
+    @staticmethod
+    def _fields(action: Any):
+        if isinstance(action, list):
+            return [vars(single_action) for single_action in action]
+        return vars(action)
+
+    def escalation_reason(self, action: Any) -> Optional[str]:
+        """
+        Checks the fast model's action against the confidence rules
+
+        Args:
+            `action`: The action returned by the fast model
+
+        Returns:
+            The reason to escalate, or None if the action can be used as is
+        """
+        if action is None:
+            return "invalid_response"
+        if self._is_completion(action):
+            return "completion_check"
+        if self.last_action is not None and self._fields(action) == self._fields(self.last_action):
+            return "repeated_action"
+        return None
+
+    def record_call(self, tier: str, seconds: float) -> None:
+        """
+        Records the latency of a call to the `fast` or `large` tier
+        """
+        self.calls[tier] += 1
+        self.latency[tier] += seconds
+
+    def record_escalation(self, reason: str) -> None:
+        self.escalations[reason] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the per-tier call counts, average latencies and the escalation rate
+        """
+        steps = self.calls["fast"] + self.escalations["action_failed"]
+        return {
+            "fast_model": self.fast_model,
+            "large_model": self.large_model,
+            "calls": dict(self.calls),
+            "average_latency": {
+                tier: round(self.latency[tier] / count, 3) for tier, count in self.calls.items()
+            },
+            "escalations": dict(self.escalations),
+            "escalation_rate": round(sum(self.escalations.values()) / steps, 3) if steps else 0.0,
+        }
@@ -0,0 +1,176 @@
+import asyncio
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from pyba.database.models import LLMPlanCache
+from pyba.logger import get_logger
+from pyba.utils.load_yaml import load_config
+
+config = load_config("general")["main_engine_configs"]["plan_cache"]
+
+
+def normalise_task(task: str) -> str:
+    """
+    Lowercases the task and collapses its whitespace, so that the same task template doesn't miss
+    the cache over formatting
+    """
+    return " ".join(task.lower().split())
+
+
+class PlanCache:
+    """
+    Persistent cache for the plans of the planner agent.
+
+    The same task templates are run over and over in DFS and BFS mode, and each run starts by
+    asking the planner for the same plans. Those are answered from the cache instead, which takes
+    the plan generation off the critical path of repeated jobs. The key covers the normalised task,
+    the mode, the maximum breadth and the previous plan, so the chain of DFS plans is replayed
+    plan by plan.
+
+    Like the `ResponseCache`, it lives in the user's `Database` if one is configured, otherwise in
+    a standalone SQLite file. Plans expire after `ttl_seconds`, and `invalidate` drops them early
+    (for a task, or all of them) when a site changes under a template.
+    """
+
+    def __init__(
+        self,
+        database=None,
+        path: str = config["path"],
+        ttl_seconds: int = config["ttl_seconds"],
+    ):
+        """
+        Args:
+            `database`: An instance of the Database class. If None, a SQLite file at `path` is used
+            `path`: The SQLite file for the cache when no database is configured
+            `ttl_seconds`: Time after which a plan is considered stale
+        """
+        self.ttl_seconds = ttl_seconds
+        self.log = get_logger()
+
+        if database is not None:
+            connection_string = database.database_connection_string
+            engine_name = database.engine
+        else:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            connection_string = f"sqlite:///{path}"
+            engine_name = "sqlite"
+
+        connection_args = {"check_same_thread": False} if engine_name == "sqlite" else {}
+        db_engine = create_engine(connection_string, connect_args=connection_args)
+        LLMPlanCache.__table__.create(bind=db_engine, checkfirst=True)
+        self.Session = sessionmaker(bind=db_engine)
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def fingerprint(task: str, mode: str, max_breadth: int, old_plan: Optional[str]) -> str:
+        """
+        Hashes everything that decides the planner's reply into the cache key
+        """
+        payload = json.dumps([normalise_task(task), mode, max_breadth, old_plan])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _get(self, key: str) -> Optional[str]:
+        session = self.Session()
+        try:
+            entry = session.get(LLMPlanCache, key)
+            if entry is None:
+                return None
+
+            if time.time() - entry.created_at > self.ttl_seconds:
+                session.delete(entry)
+                session.commit()
+                return None
+
+            return entry.plan
+        except Exception as e:
+            session.rollback()
+            self.log.warning(f"Couldn't read from the plan cache: {e}")
+            return None
+        finally:
+            session.close()
+
+    def _put(self, key: str, task: str, mode: str, plan: str) -> None:
+        session = self.Session()
+        try:
+            session.merge(
+                LLMPlanCache(
+                    key=key,
+                    task=normalise_task(task),
+                    mode=mode,
+                    plan=plan,
+                    created_at=time.time(),
+                )
+            )
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            self.log.warning(f"Couldn't write to the plan cache: {e}")
+        finally:
+            session.close()
+
+    async def get(
+        self, task: str, mode: str, max_breadth: int, old_plan: Optional[str] = None
+    ) -> Optional[Union[str, List[str]]]:
+        """
+        Returns the cached plan (DFS) or plans (BFS) for the request, or None on a miss
+        """
+        key = self.fingerprint(task, mode, max_breadth, old_plan)
+        plan = await asyncio.to_thread(self._get, key)
+        if plan is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return json.loads(plan)
+
+    async def put(
+        self,
+        task: str,
+        mode: str,
+        max_breadth: int,
+        old_plan: Optional[str],
+        plan: Union[str, List[str], None],
+    ) -> None:
+        """
+        Stores the plan (DFS) or plans (BFS) for the request
+        """
+        if not plan:
+            return
+        key = self.fingerprint(task, mode, max_breadth, old_plan)
+        await asyncio.to_thread(self._put, key, task, mode, json.dumps(plan))
+
+    def invalidate(self, task: str = None) -> int:
+        """
+        Drops the cached plans of a task in every mode, or every cached plan if no task is given
+
+        Returns:
+            The number of plans dropped
+        """
+        session = self.Session()
+        try:
+            query = session.query(LLMPlanCache)
+            if task is not None:
+                query = query.filter(LLMPlanCache.task == normalise_task(task))
+            deleted = query.delete(synchronize_session=False)
+            session.commit()
+            return deleted
+        except Exception as e:
+            session.rollback()
+            self.log.warning(f"Couldn't invalidate the plan cache: {e}")
+            return 0
+        finally:
+            session.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the hit and miss counts for the session
+        """
+        return {"hits": self.hits, "misses": self.misses}
@@ -41,7 +41,7 @@ class PlannerAgent(BaseAgent):
         else:
             return planner_general_prompt_DFS.format(task=task, old_plan=old_plan)
 
-    def _call_model(self, agent: Any, prompt: str) -> Any:
+    async def _call_model(self, agent: Any, prompt: str) -> Any:
         """
         Generic method to call the correct LLM provider and parse the response.
 
@@ -55,7 +55,7 @@ class PlannerAgent(BaseAgent):
         Uses the attempt_number to give ou
         """
         if self.engine.provider == "openai":
-            response = self.handle_openai_execution(agent=agent, prompt=prompt)
+            response = await self.handle_openai_execution(agent=agent, prompt=prompt)
             parsed_json = json.loads(response.choices[0].message.content)
 
             if "plans" in list(parsed_json.keys()):
@@ -66,7 +66,7 @@ class PlannerAgent(BaseAgent):
             return None
 
         elif self.engine.provider == "vertexai":  # VertexAI logic
-            response = self.handle_vertexai_execution(agent=agent, prompt=prompt)
+            response = await self.handle_vertexai_execution(agent=agent, prompt=prompt)
             try:
                 parsed_object = getattr(
                     response, "output_parsed", getattr(response, "parsed", None)
@@ -90,7 +90,7 @@ class PlannerAgent(BaseAgent):
                 return None
 
         else:  # Using gemini
-            response = self.handle_gemini_execution(agent=agent, prompt=prompt)
+            response = await self.handle_gemini_execution(agent=agent, prompt=prompt)
             action = agent["response_format"].model_validate_json(response.text)
 
             if hasattr(action, "plan"):
@@ -103,7 +103,7 @@ class PlannerAgent(BaseAgent):
                 self.log.error("Parsed object has neither 'plans' nor 'plan' attribute.")
                 return None
 
-    def generate(
+    async def generate(
         self, task: str, old_plan: str = None
     ) -> Union[PlannerAgentOutputBFS, PlannerAgentOutputDFS]:
         """
@@ -116,6 +116,28 @@ class PlannerAgent(BaseAgent):
         Function:
             - Takes in the user prompt which serves as the task for the model to perform
             - Depending on DFS or BFS mode generates plan(s)
+
+        If the engine has a plan cache, a task planned before is answered from it without calling
+        the model.
         """
+        plan_cache = self.engine.plan_cache
+        if plan_cache:
+            plan = await plan_cache.get(
+                task=task, mode=self.mode, max_breadth=self.max_breadth, old_plan=old_plan
+            )
+            if plan is not None:
+                self.log.info("Using the cached plan for this task")
+                return plan
+
         prompt = self._initialise_prompt(task=task, old_plan=old_plan)
-        return self._call_model(agent=self.agent, prompt=prompt)
+        plan = await self._call_model(agent=self.agent, prompt=prompt)
+
+        if plan_cache:
+            await plan_cache.put(
+                task=task,
+                mode=self.mode,
+                max_breadth=self.max_breadth,
+                old_plan=old_plan,
+                plan=plan,
+            )
+        return plan
@@ -1,13 +1,20 @@
 import json
+import time
 from types import SimpleNamespace
-from typing import Dict, List, Union, Any
+from typing import Dict, List, Union, Any, Optional, Tuple
 
 from pydantic import BaseModel
 
 from pyba.core.agent.base_agent import BaseAgent
+from pyba.core.agent.dom_delta import DOMDelta
+from pyba.core.agent.dom_serializer import DOMSerializer
 from pyba.core.agent.extraction_agent import ExtractionAgent
-from pyba.utils.prompts import general_prompt, output_prompt
-from pyba.utils.structure import PlaywrightResponse
+from pyba.core.agent.model_router import ModelRouter
+from pyba.utils.load_yaml import load_config
+from pyba.utils.prompts import general_prompt, general_prompt_delta, output_prompt
+from pyba.utils.structure import PlaywrightResponse, expand_action
+
+config = load_config("general")["main_engine_configs"]
 
 
 class PlaywrightAgent(BaseAgent):
@@ -17,6 +24,22 @@ class PlaywrightAgent(BaseAgent):
     Provides two endpoints:
         - `process_action`: for returning the right action on a page
         - `get_output`: for summarizing the chat and returning a string
+
+    If the engine sets a `dom_token_budget`, the DOM fields are ranked by relevance to the task and
+    trimmed to the budget before they go into any prompt.
+
+    If the engine enables `use_compact_actions`, the action agent answers with the compact
+    discriminated-union actions, which are expanded into `PlaywrightAction`s once parsed.
+
+    If the engine enables `use_action_batching`, the action agent may return an ordered list of
+    actions for the page, which is handed back as a list instead of a single action.
+
+    If the engine enables `use_model_routing`, the action steps go to a fast model first and are
+    escalated to the engine's model by the `ModelRouter`.
+
+    If the engine enables `use_dom_delta`, the action prompts after a full snapshot only carry the
+    changes to the DOM. The last full prompt is replayed before the delta as a reference snapshot
+    for the stateless providers, and is already part of the chat history for VertexAI.
     """
 
     def __init__(self, engine) -> None:
@@ -27,6 +50,26 @@ class PlaywrightAgent(BaseAgent):
         super().__init__(engine=engine)  # Initialising the base params from BaseAgent
         self.action_agent, self.output_agent = self.llm_factory.get_agent()
 
+        self.dom_serializer = (
+            DOMSerializer(token_budget=self.engine.dom_token_budget)
+            if self.engine.dom_token_budget is not None
+            else None
+        )
+        self.dom_delta = DOMDelta() if self.engine.use_dom_delta else None
+        self.reference_prompt = None  # The last full snapshot prompt sent to the action agent
+        self.extractor = None  # Built on the first step and reused while the format is unchanged
+        self.extract_info_requested = False  # Whether the last action response asked to extract
+        self.max_batch_actions = config["action_batching"]["max_actions"]
+
+        self.model_router = None
+        if self.engine.use_model_routing:
+            self.model_router = ModelRouter(
+                provider=self.engine.provider, large_model=self.action_agent["model"]
+            )
+            self.fast_action_agent = self.llm_factory.get_fast_action_agent(
+                model=self.model_router.fast_model
+            )
+
     def _initialise_prompt(
         self,
         cleaned_dom: Dict[str, Union[List, str]],
@@ -51,6 +94,8 @@ class PlaywrightAgent(BaseAgent):
         # Adding the user_prompt to the DOM to make it easier to format the prompt
         cleaned_dom["user_prompt"] = user_prompt
         cleaned_dom["history"] = history
+        # The full or the compact response, whichever the action agent was built with
+        cleaned_dom["response_type"] = self.action_agent["response_format"].__name__
 
         if fail_reason:
             cleaned_dom["action_output"] = fail_reason
@@ -63,8 +108,82 @@ class PlaywrightAgent(BaseAgent):
 
         return prompt
 
-    def _call_model(
-        self, agent: Any, prompt: str, agent_type: str, cleaned_dom: Dict = None
+    def _fit_to_budget(self, cleaned_dom: Dict, user_prompt: str) -> Dict:
+        """
+        Trims the cleaned DOM to the token budget if one is set. The original dictionary is left
+        untouched so that the extraction agent still sees the full page text.
+        """
+        if self.dom_serializer is None:
+            return cleaned_dom
+
+        serialized_dom, _ = self.dom_serializer.serialize(cleaned_dom, query=user_prompt)
+        return serialized_dom
+
+    def _initialise_action_prompt(
+        self,
+        cleaned_dom: Dict[str, Union[List, str]],
+        user_prompt: str,
+        history: List[str] = None,
+        fail_reason: str = None,
+    ) -> Tuple[str, Optional[List[str]]]:
+        """
+        Builds the prompt for the action agent, either as a full snapshot or as a delta against the
+        reference snapshot
+
+        Args:
+            `cleaned_dom`: A dictionary containing nicely formatted DOM elements
+            `user_prompt`: The instructions given by the user
+            `history`: An episodic memory of all the successfully executed tasks
+            `fail_reason`: The reason for the failure of the previous action
+
+        Returns:
+            The prompt and the context messages which must be sent before it
+        """
+        delta = self.dom_delta.encode(cleaned_dom) if self.dom_delta else None
+
+        if delta is None:
+            prompt = self._initialise_prompt(
+                cleaned_dom=cleaned_dom,
+                user_prompt=user_prompt,
+                main_instruction=general_prompt,
+                history=history,
+                fail_reason=fail_reason,
+            )
+            if self.dom_delta:
+                self.reference_prompt = prompt
+            return prompt, None
+
+        delta["current_url"] = cleaned_dom.get("current_url")
+        prompt = self._initialise_prompt(
+            cleaned_dom=delta,
+            user_prompt=user_prompt,
+            main_instruction=general_prompt_delta,
+            history=history,
+            fail_reason=fail_reason,
+        )
+        context = [f"Reference snapshot of the page:\n{self.reference_prompt}"]
+
+        return prompt, context
+
+    def _pick_actions(self, actions: List) -> Union[Any, List]:
+        """
+        Returns the first action, or the whole batch (capped) if the engine batches actions.
+        Compact actions are expanded into `PlaywrightAction`s here, so the rest of the engine only
+        ever sees the flat format.
+        """
+        actions = [expand_action(action) for action in actions]
+        if self.engine.use_action_batching and len(actions) > 1:
+            return list(actions[: self.max_batch_actions])
+        return actions[0]
+
+    async def _call_model(
+        self,
+        agent: Any,
+        prompt: str,
+        agent_type: str,
+        cleaned_dom: Dict = None,
+        context: List[str] = None,
+        schedule_extraction: bool = True,
     ) -> Any:
         """
         Generic method to call the correct LLM provider and parse the response.
@@ -74,36 +193,42 @@ class PlaywrightAgent(BaseAgent):
             `prompt`: The fully formatted prompt string
             `agent_type`: "action" or "output", to determine parsing logic
             `cleaned_dom`: A dictionary that holds the `actual_text` from which the data is to be extracted
+            `context`: Earlier user messages to be sent before the prompt
+            `schedule_extraction`: Schedule the extraction the response asks for right away. The
+                router turns this off and schedules it once it knows which response it keeps
 
         Returns:
             The parsed response (SimpleNamespace for action, str for output)
         """
 
         # If this guy gives me an output which says I need to extract the relevant data from this page,
-        # Then I call the extraction agent here and extract information in a separate thread? Separate thread is easier,
-        # I don't have to write my functions as async then
+        # then the extraction agent is scheduled as a background task on the same event loop
+        self.extract_info_requested = False
 
         if self.engine.provider == "openai":
-            response = self.handle_openai_execution(
+            response = await self.handle_openai_execution(
                 agent=agent,
                 prompt=prompt,
+                context=context,
             )
             parsed_json = json.loads(response.choices[0].message.content)
 
             # Parse based on agent type
             if agent_type == "action":
-                actions = SimpleNamespace(**parsed_json.get("actions")[0])
-                extract_info_flag = parsed_json.get("extract_info")
-                if extract_info_flag:
-                    self.extractor.run_threaded_info_extraction(
-                        task=self.user_prompt, actual_text=cleaned_dom["actual_text"]
-                    )
+                actions = self._pick_actions(
+                    [SimpleNamespace(**action) for action in parsed_json.get("actions")]
+                )
+                self.extract_info_requested = bool(parsed_json.get("extract_info"))
+                if schedule_extraction:
+                    self._schedule_extraction(cleaned_dom)
                 return actions
             elif agent_type == "output":
                 return str(parsed_json.get("output"))
 
         elif self.engine.provider == "vertexai":  # VertexAI logic
-            response = self.handle_vertexai_execution(agent=agent, prompt=prompt)
+            response = await self.handle_vertexai_execution(
+                agent=agent, prompt=prompt, context=context
+            )
             try:
                 parsed_object = getattr(
                     response, "output_parsed", getattr(response, "parsed", None)
@@ -116,12 +241,10 @@ class PlaywrightAgent(BaseAgent):
                 # Parse based on agent type
                 if agent_type == "action":
                     if hasattr(parsed_object, "actions") and parsed_object.actions:
-                        actions = parsed_object.actions[0]
-                        extract_info_flag = parsed_object.extract_info
-                        if extract_info_flag:
-                            self.extractor.run_threaded_info_extraction(
-                                task=self.user_prompt, actual_text=cleaned_dom["actual_text"]
-                            )
+                        actions = self._pick_actions(parsed_object.actions)
+                        self.extract_info_requested = bool(parsed_object.extract_info)
+                        if schedule_extraction:
+                            self._schedule_extraction(cleaned_dom)
                         return actions
                     raise IndexError("No 'actions' found in VertexAI response.")
                 elif agent_type == "output":
@@ -135,17 +258,27 @@ class PlaywrightAgent(BaseAgent):
                 # If we have a response which cannot be parsed, it MUST be a None value
 
         else:  # Using gemini
-            response = self.handle_gemini_execution(agent=agent, prompt=prompt)
+            response = await self.handle_gemini_execution(
+                agent=agent, prompt=prompt, context=context
+            )
             parsed_object = agent["response_format"].model_validate_json(response.text)
-            actions = parsed_object.actions[0]
-            extract_info_flag = parsed_object.extract_info
-            if extract_info_flag:
-                self.extractor.run_threaded_info_extraction(
-                    task=self.user_prompt, actual_text=cleaned_dom["actual_text"]
-                )
+            actions = self._pick_actions(parsed_object.actions)
+            self.extract_info_requested = bool(parsed_object.extract_info)
+            if schedule_extraction:
+                self._schedule_extraction(cleaned_dom)
             return actions
 
-    def process_action(
+    def _schedule_extraction(self, cleaned_dom: Dict) -> None:
+        """
+        Schedules the extraction of the page on the engine's extraction pool if the last action
+        response asked for it
+        """
+        if self.extract_info_requested:
+            self.extractor.run_async_info_extraction(
+                task=self.user_prompt, actual_text=cleaned_dom["actual_text"]
+            )
+
+    async def process_action(
         self,
         cleaned_dom: Dict[str, Union[List, str]],
         user_prompt: str,
@@ -173,28 +306,95 @@ class PlaywrightAgent(BaseAgent):
             output: A predefined pydantic model
         """
 
-        prompt = self._initialise_prompt(
-            cleaned_dom=cleaned_dom,
+        prompt, context = self._initialise_action_prompt(
+            cleaned_dom=self._fit_to_budget(cleaned_dom, user_prompt),
             user_prompt=user_prompt,
-            main_instruction=general_prompt,
             history=history,
             fail_reason=fail_reason,
         )
 
         self.user_prompt = user_prompt
-        self.extractor = ExtractionAgent(engine=self.engine, extraction_format=extraction_format)
+        # The extractor is kept for as long as the format stays the same so that its agent carries
+        # over between steps. The extractions themselves run on the engine's extraction pool
+        if self.extractor is None or self.extractor.extraction_format is not extraction_format:
+            self.extractor = ExtractionAgent(
+                engine=self.engine, extraction_format=extraction_format
+            )
 
-        return self._call_model(
-            agent=self.action_agent, prompt=prompt, agent_type="action", cleaned_dom=cleaned_dom
+        if self.model_router is None:
+            return await self._call_model(
+                agent=self.action_agent,
+                prompt=prompt,
+                agent_type="action",
+                cleaned_dom=cleaned_dom,
+                context=context,
+            )
+
+        return await self._route_action(
+            prompt=prompt, cleaned_dom=cleaned_dom, context=context, fail_reason=fail_reason
         )
 
-    def get_output(self, cleaned_dom: Dict[str, Union[List, str]], user_prompt: str) -> str:
+    async def _route_action(
+        self,
+        prompt: str,
+        cleaned_dom: Dict[str, Union[List, str]],
+        context: Optional[List[str]],
+        fail_reason: Optional[str],
+    ):
+        """
+        Gets the action from the fast model and escalates to the large model if the router asks
+        for it. Arguments are the same as for `_call_model`.
+        """
+        if fail_reason:
+            reason = "action_failed"
+        else:
+            started_at = time.perf_counter()
+            try:
+                action = await self._call_model(
+                    agent=self.fast_action_agent,
+                    prompt=prompt,
+                    agent_type="action",
+                    cleaned_dom=cleaned_dom,
+                    context=context,
+                    schedule_extraction=False,
+                )
+            except Exception as e:
+                self.log.warning(f"The fast model's response was unusable: {e}")
+                action = None
+            self.model_router.record_call("fast", time.perf_counter() - started_at)
+
+            # The extraction is only scheduled for the response which is kept
+            reason = self.model_router.escalation_reason(action)
+            if reason is None:
+                self.model_router.last_action = action
+                self._schedule_extraction(cleaned_dom)
+                return action
+
+        self.log.info(f"Escalating the step to {self.model_router.large_model}: {reason}")
+        self.model_router.record_escalation(reason)
+
+        started_at = time.perf_counter()
+        action = await self._call_model(
+            agent=self.action_agent,
+            prompt=prompt,
+            agent_type="action",
+            cleaned_dom=cleaned_dom,
+            context=context,
+        )
+        self.model_router.record_call("large", time.perf_counter() - started_at)
+
+        self.model_router.last_action = action
+        return action
+
+    async def get_output(self, cleaned_dom: Dict[str, Union[List, str]], user_prompt: str) -> str:
         """
         Method to get the final output from the model if the user requested for one
         """
 
         prompt = self._initialise_prompt(
-            cleaned_dom=cleaned_dom, user_prompt=user_prompt, main_instruction=output_prompt
+            cleaned_dom=self._fit_to_budget(cleaned_dom, user_prompt),
+            user_prompt=user_prompt,
+            main_instruction=output_prompt,
         )
 
-        return self._call_model(agent=self.output_agent, prompt=prompt, agent_type="output")
+        return await self._call_model(agent=self.output_agent, prompt=prompt, agent_type="output")
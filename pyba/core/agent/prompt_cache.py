@@ -0,0 +1,155 @@
+import hashlib
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.genai.types import CreateCachedContentConfig
+
+from pyba.logger import get_logger
+from pyba.utils.load_yaml import load_config
+
+config = load_config("general")["main_engine_configs"]["prompt_caching"]
+
+
+class PromptCache:
+    """
+    Per-session bookkeeping for provider side prompt caching.
+
+    The static part of every request (the system instruction and, for the action agent, the rules
+    block) is kept at the front of the prompt so that the providers can reuse it:
+
+    - OpenAI caches identical prefixes automatically. We only send a stable `prompt_cache_key` so that
+      requests with the same prefix get routed to the same cache.
+    - Gemini and VertexAI support explicit `cached_content`. The system instruction is uploaded once
+      per (model, instruction) and referenced by name on every call. If the provider refuses to cache
+      it (for example because it is below the minimum cacheable size) we silently fall back to sending
+      it inline, where the implicit cache still applies. The explicit caches are billed for as long
+      as they live, so the engine deletes the ones it created when it shuts down.
+
+    Hits and misses are counted from the usage fields returned by the providers.
+    """
+
+    def __init__(
+        self, enabled: bool = config["enabled"], ttl_seconds: int = config["ttl_seconds"]
+    ):
+        """
+        Args:
+            `enabled`: Turn prompt caching on or off for the session
+            `ttl_seconds`: Lifetime of the explicit Gemini/VertexAI caches
+        """
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.log = get_logger()
+
+        # (model, instruction hash) -> (cached content name or None, expiry timestamp)
+        self._cached_contents: Dict[tuple, tuple] = {}
+        # The explicit caches created in this session with the client that created them
+        self._created: List[Tuple[Any, str]] = []
+
+        self.hits = 0
+        self.misses = 0
+        self.cached_tokens = 0
+        self.input_tokens = 0
+
+    @staticmethod
+    def fingerprint(text: str) -> str:
+        """
+        Returns a short stable hash for the static prefix
+        """
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+    def openai_cache_key(self, system_instruction: str) -> Optional[str]:
+        """
+        The `prompt_cache_key` for OpenAI requests sharing the same static prefix
+        """
+        if not self.enabled:
+            return None
+        return f"pyba-{self.fingerprint(system_instruction)}"
+
+    async def get_cached_content(self, client: Any, model: str, system_instruction: str):
+        """
+        Returns the name of an explicit cache holding the `system_instruction` for Gemini/VertexAI,
+        creating it the first time it is asked for. Returns None when caching is disabled or the
+        provider refused to create the cache.
+
+        Args:
+            `client`: The genai client (VertexAI or Gemini)
+            `model`: The model name the cache is created for
+            `system_instruction`: The static prefix to cache
+        """
+        if not self.enabled:
+            return None
+
+        key = (model, self.fingerprint(system_instruction))
+        cached = self._cached_contents.get(key)
+
+        # Refreshing a bit before the provider expires the cache
+        if cached and (cached[1] is None or cached[1] - 60 > time.time()):
+            return cached[0]
+
+        try:
+            cached_content = await client.aio.caches.create(
+                model=model,
+                config=CreateCachedContentConfig(
+                    system_instruction=system_instruction,
+                    ttl=f"{self.ttl_seconds}s",
+                ),
+            )
+            self._cached_contents[key] = (cached_content.name, time.time() + self.ttl_seconds)
+            self._created.append((client, cached_content.name))
+            return cached_content.name
+        except Exception as e:
+            # Never retrying the creation for this prefix, the implicit cache is still used
+            self.log.warning(f"Couldn't create an explicit prompt cache, sending it inline: {e}")
+            self._cached_contents[key] = (None, None)
+            return None
+
+    async def delete_cached_contents(self) -> None:
+        """
+        Deletes the explicit caches created in this session instead of leaving them on the provider
+        until their TTL runs out. A cache which can't be deleted is only logged.
+        """
+        created, self._created = self._created, []
+        self._cached_contents.clear()
+        for client, name in created:
+            try:
+                await client.aio.caches.delete(name=name)
+            except Exception as e:
+                self.log.warning(f"Couldn't delete the prompt cache {name}: {e}")
+
+    def record_openai_usage(self, usage: Any) -> None:
+        """
+        Counts a hit or a miss from an OpenAI `usage` object
+        """
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", None) or 0
+        self._record(cached_tokens, getattr(usage, "prompt_tokens", None) or 0)
+
+    def record_gemini_usage(self, usage_metadata: Any) -> None:
+        """
+        Counts a hit or a miss from a Gemini/VertexAI `usage_metadata` object
+        """
+        if usage_metadata is None:
+            return
+        cached_tokens = getattr(usage_metadata, "cached_content_token_count", None) or 0
+        self._record(cached_tokens, getattr(usage_metadata, "prompt_token_count", None) or 0)
+
+    def _record(self, cached_tokens: int, input_tokens: int) -> None:
+        if cached_tokens:
+            self.hits += 1
+        else:
+            self.misses += 1
+        self.cached_tokens += cached_tokens
+        self.input_tokens += input_tokens
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the cache statistics for the session
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "cached_tokens": self.cached_tokens,
+            "input_tokens": self.input_tokens,
+        }
@@ -0,0 +1,164 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+
+from pyba.logger import get_logger
+from pyba.utils.load_yaml import load_config
+
+config = load_config("general")["main_engine_configs"]["rate_limits"]
+
+
+class TokenBucket:
+    """
+    A token bucket refilled continuously at `capacity` units per minute.
+
+    Acquiring never fails, it only tells the caller how long to wait. The units are taken up front
+    and the balance is allowed to go negative, so concurrent callers queue up behind each other in
+    the order they asked instead of all waking up at the same time.
+    """
+
+    def __init__(self, capacity: float):
+        self.capacity = capacity
+        self.rate = capacity / 60.0  # units per second
+        self.level = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """
+        Takes `amount` units out of the bucket and returns the seconds until they are covered
+        """
+        self._refill(now)
+        # A single request larger than the bucket would never fit, so it waits for a full bucket
+        amount = min(amount, self.capacity)
+        self.level -= amount
+        return max(0.0, -self.level / self.rate)
+
+    def adjust(self, amount: float) -> None:
+        """
+        Corrects the balance once the real cost of a request is known
+        """
+        self.level = min(self.capacity, self.level - amount)
+
+
+class RateLimiter:
+    """
+    Shared per-provider limiter for requests per minute and tokens per minute.
+
+    Every `handle_*_execution` call waits on the limiter of its provider before it goes out. One
+    limiter is shared by all the agents and engines in the process (including engines running in
+    other threads), so parallel runs stay just under the provider's ceiling instead of all hitting
+    429s together and backing off in lockstep.
+
+    Token costs are estimated from the prompt before the call and corrected with the usage the
+    provider reports. Retries of a call take another request but not its tokens again, since the
+    usage is only settled once. A limit set to `None` is not enforced.
+    """
+
+    _lock = threading.Lock()
+    _limiters: Dict[str, "RateLimiter"] = {}
+
+    def __init__(
+        self,
+        provider: str,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+    ):
+        """
+        Args:
+            `provider`: The provider the limits apply to
+            `requests_per_minute`: The maximum number of requests a minute
+            `tokens_per_minute`: The maximum number of input and output tokens a minute
+        """
+        self.provider = provider
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.log = get_logger()
+
+        # Buckets are shared between threads, the waiting itself happens on each caller's loop
+        self._bucket_lock = threading.Lock()
+
+        self.requests_made = 0
+        self.delayed_requests = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    @classmethod
+    def for_provider(cls, provider: str) -> "RateLimiter":
+        """
+        Returns the process-wide limiter for the provider, built from the config on first use
+        """
+        with cls._lock:
+            limiter = cls._limiters.get(provider)
+            if limiter is None:
+                limits = config.get(provider) or {}
+                limiter = cls(
+                    provider=provider,
+                    requests_per_minute=limits.get("requests_per_minute"),
+                    tokens_per_minute=limits.get("tokens_per_minute"),
+                )
+                cls._limiters[provider] = limiter
+            return limiter
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests is not None or self.tokens is not None
+
+    async def acquire(self, estimated_tokens: int = 0) -> float:
+        """
+        Waits until a request of `estimated_tokens` fits within the limits
+
+        Returns:
+            The number of seconds spent waiting in the queue
+        """
+        if not self.enabled:
+            return 0.0
+
+        with self._bucket_lock:
+            now = time.monotonic()
+            wait_time = 0.0
+            if self.requests:
+                wait_time = max(wait_time, self.requests.reserve(1, now))
+            if self.tokens:
+                wait_time = max(wait_time, self.tokens.reserve(estimated_tokens, now))
+
+            self.requests_made += 1
+            if wait_time > 0:
+                self.delayed_requests += 1
+                self.total_wait_seconds += wait_time
+                self.max_wait_seconds = max(self.max_wait_seconds, wait_time)
+
+        if wait_time > 0:
+            self.log.info(f"Waiting {wait_time:.2f}s for the {self.provider} rate limit")
+            await asyncio.sleep(wait_time)
+
+        return wait_time
+
+    def settle(self, estimated_tokens: int, used_tokens: Optional[int]) -> None:
+        """
+        Replaces the estimated token cost of a request with what the provider reported
+
+        Args:
+            `estimated_tokens`: The number of tokens taken when acquiring
+            `used_tokens`: The total tokens from the response usage, None if it wasn't reported
+        """
+        if self.tokens is None or used_tokens is None:
+            return
+
+        with self._bucket_lock:
+            self.tokens.adjust(used_tokens - estimated_tokens)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the queueing statistics of the limiter
+        """
+        return {
+            "requests": self.requests_made,
+            "delayed_requests": self.delayed_requests,
+            "total_wait_seconds": round(self.total_wait_seconds, 2),
+            "max_wait_seconds": round(self.max_wait_seconds, 2),
+        }
@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import json
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+
+from pyba.core.agent.llm_factory import LLMFactory
+from pyba.database.models import LLMResponseCache
+from pyba.logger import get_logger
+from pyba.utils.load_yaml import load_config
+
+config = load_config("general")["main_engine_configs"]["response_cache"]
+
+
+class ResponseCache:
+    """
+    Persistent cache for the structured LLM responses, keyed by a fingerprint of the request.
+
+    Reruns of the same task (nightly regressions, retries after a crash) produce byte-identical
+    prompts for a lot of steps. Those are answered from the cache instead of paying for the model
+    again. The key covers the provider, model, system instruction, response schema, any context
+    messages and the prompt, so a change to any of them is a miss.
+
+    The cache lives in the user's `Database` if one is configured, otherwise in a standalone SQLite
+    file. Entries expire after `ttl_seconds`, and the least recently used ones are evicted once the
+    stored responses grow beyond `max_size_mb`.
+
+    Note: VertexAI chat sessions are not cached because their replies depend on the chat history
+    and not only on the prompt.
+    """
+
+    def __init__(
+        self,
+        database=None,
+        path: str = config["path"],
+        ttl_seconds: int = config["ttl_seconds"],
+        max_size_mb: float = config["max_size_mb"],
+    ):
+        """
+        Args:
+            `database`: An instance of the Database class. If None, a SQLite file at `path` is used
+            `path`: The SQLite file for the cache when no database is configured
+            `ttl_seconds`: Time after which an entry is considered stale
+            `max_size_mb`: Size of the stored responses above which old entries are evicted
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.log = get_logger()
+
+        if database is not None:
+            connection_string = database.database_connection_string
+            engine_name = database.engine
+        else:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            connection_string = f"sqlite:///{path}"
+            engine_name = "sqlite"
+
+        connection_args = {"check_same_thread": False} if engine_name == "sqlite" else {}
+        db_engine = create_engine(connection_string, connect_args=connection_args)
+        LLMResponseCache.__table__.create(bind=db_engine, checkfirst=True)
+        self.Session = sessionmaker(bind=db_engine)
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def fingerprint(
+        provider: str,
+        model: str,
+        system_instruction: str,
+        response_format: Any,
+        prompt: str,
+        context: List[str] = None,
+    ) -> str:
+        """
+        Hashes everything that decides the model's reply into the cache key
+        """
+        schema = LLMFactory.json_schema(response_format) if response_format is not None else None
+        payload = json.dumps(
+            [provider, model, system_instruction, schema, context or [], prompt],
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _get(self, key: str) -> Optional[str]:
+        session = self.Session()
+        try:
+            entry = session.get(LLMResponseCache, key)
+            if entry is None:
+                return None
+
+            now = time.time()
+            if now - entry.created_at > self.ttl_seconds:
+                session.delete(entry)
+                session.commit()
+                return None
+
+            entry.last_accessed = now
+            session.commit()
+            return entry.response
+        except Exception as e:
+            session.rollback()
+            self.log.warning(f"Couldn't read from the response cache: {e}")
+            return None
+        finally:
+            session.close()
+
+    def _put(self, key: str, provider: str, model: str, response: str) -> None:
+        session = self.Session()
+        try:
+            now = time.time()
+            session.merge(
+                LLMResponseCache(
+                    key=key,
+                    provider=provider,
+                    model=model,
+                    response=response,
+                    size=len(response.encode("utf-8")),
+                    created_at=now,
+                    last_accessed=now,
+                )
+            )
+            session.commit()
+            self._evict(session)
+        except Exception as e:
+            session.rollback()
+            self.log.warning(f"Couldn't write to the response cache: {e}")
+        finally:
+            session.close()
+
+    def _evict(self, session) -> None:
+        """
+        Drops the expired entries and then the least recently used ones until the cache fits
+        """
+        session.query(LLMResponseCache).filter(
+            LLMResponseCache.created_at < time.time() - self.ttl_seconds
+        ).delete(synchronize_session=False)
+
+        total_size = session.query(func.coalesce(func.sum(LLMResponseCache.size), 0)).scalar()
+        if total_size > self.max_size_bytes:
+            oldest_first = session.query(LLMResponseCache.key, LLMResponseCache.size).order_by(
+                LLMResponseCache.last_accessed
+            )
+            to_delete = []
+            for key, size in oldest_first:
+                if total_size <= self.max_size_bytes:
+                    break
+                to_delete.append(key)
+                total_size -= size
+
+            session.query(LLMResponseCache).filter(LLMResponseCache.key.in_(to_delete)).delete(
+                synchronize_session=False
+            )
+        session.commit()
+
+    async def get(self, key: str) -> Optional[str]:
+        """
+        Returns the cached response text for the key, or None on a miss
+        """
+        response = await asyncio.to_thread(self._get, key)
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    async def put(self, key: str, provider: str, model: str, response: Optional[str]) -> None:
+        """
+        Stores the response text for the key
+        """
+        if not response:
+            return
+        await asyncio.to_thread(self._put, key, provider, model, response)
+
+    @staticmethod
+    def as_openai_response(response: str) -> SimpleNamespace:
+        """
+        Wraps a cached response to look like the parts of an OpenAI completion the agents read
+        """
+        message = SimpleNamespace(content=response)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+    @staticmethod
+    def as_gemini_response(response: str) -> SimpleNamespace:
+        """
+        Wraps a cached response to look like the parts of a Gemini response the agents read
+        """
+        return SimpleNamespace(text=response, usage_metadata=None)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the hit and miss counts for the session
+        """
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,160 @@
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+import httpx
+import openai
+from google.genai import errors as genai_errors
+from pydantic import ValidationError
+
+from pyba.logger import get_logger
+from pyba.utils.exceptions import LLMRequestFailed, LLMRetriesExhausted
+from pyba.utils.load_yaml import load_config
+
+config = load_config("general")["main_engine_configs"]["retry_policy"]
+
+# Status codes worth another attempt: request timeout, conflict, rate limit and the server errors
+RETRYABLE_STATUS_CODES = frozenset((408, 409, 429))
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Sorts a provider error into retryable (rate limits, server errors, timeouts, dropped
+    connections) or fatal (auth, bad requests such as a context overflow, schema mismatches)
+
+    Args:
+        `error`: The exception raised by the provider call
+    """
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, httpx.TransportError)):
+        return True
+
+    # OpenAI raises these when the model stopped early or the output didn't match the schema,
+    # retrying the same request gives the same answer
+    if isinstance(
+        error,
+        (
+            openai.LengthFinishReasonError,
+            openai.ContentFilterFinishReasonError,
+            openai.APIResponseValidationError,
+            ValidationError,
+        ),
+    ):
+        return False
+
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+
+    status_code = None
+    if isinstance(error, openai.APIStatusError):
+        status_code = error.status_code
+    elif isinstance(error, genai_errors.APIError):
+        status_code = error.code
+
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES or status_code >= 500
+
+    # Anything we can't classify keeps the old behaviour of retrying, now within the limits
+    return True
+
+
+class RetryPolicy:
+    """
+    Bounded retries with exponential backoff for the LLM calls.
+
+    A call is retried only for retryable errors, at most `max_attempts` times and within
+    `max_elapsed_seconds` of wall-clock time, and each attempt is cut off after
+    `call_timeout_seconds`. Fatal errors raise `LLMRequestFailed` straight away and running out of
+    attempts raises `LLMRetriesExhausted`, so a stuck engine gives up and frees its browser
+    instead of backing off forever.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = config["max_attempts"],
+        max_elapsed_seconds: float = config["max_elapsed_seconds"],
+        call_timeout_seconds: Optional[float] = config["call_timeout_seconds"],
+        base: int = 2,
+        base_timeout: float = 1,
+        max_backoff_time: float = 60,
+    ):
+        """
+        Args:
+            `max_attempts`: The maximum number of attempts for a single call
+            `max_elapsed_seconds`: The wall-clock budget for a call, including the backoff
+            `call_timeout_seconds`: The timeout for a single attempt, None to wait indefinitely
+            `base`: The exponential base for the backoff
+            `base_timeout`: The first backoff in seconds
+            `max_backoff_time`: The cap on a single backoff in seconds
+        """
+        self.max_attempts = max_attempts
+        self.max_elapsed_seconds = max_elapsed_seconds
+        self.call_timeout_seconds = call_timeout_seconds
+        self.base = base
+        self.base_timeout = base_timeout
+        self.max_backoff_time = max_backoff_time
+
+        self.log = get_logger()
+
+    def calculate_next_time(self, attempt_number: int) -> float:
+        """
+        Function to calculate the next wait time in seconds
+
+        Args:
+                `attempt_number`: The number of failed attempts
+        """
+        delay = self.base_timeout * (self.base ** (attempt_number - 1))
+        delay = min(delay, self.max_backoff_time)
+        jitter = random.uniform(0, delay / 2)
+        return delay + jitter
+
+    async def run(
+        self,
+        provider: str,
+        call: Callable[[], Awaitable[Any]],
+        before_attempt: Callable[[], Awaitable[Any]] = None,
+        on_backoff: Callable[[float], None] = None,
+    ) -> Any:
+        """
+        Runs the call under the policy
+
+        Args:
+            `provider`: The provider name, used in the logs and exceptions
+            `call`: Makes a fresh provider request each time it is called
+            `before_attempt`: Awaited before every attempt (the rate limiter)
+            `on_backoff`: Called with the wait time in seconds before every backoff (telemetry)
+
+        Returns:
+            The result of the first successful attempt
+        """
+        started_at = time.monotonic()
+        attempt_number = 1
+        while True:
+            if before_attempt is not None:
+                await before_attempt()
+            try:
+                if self.call_timeout_seconds:
+                    return await asyncio.wait_for(call(), timeout=self.call_timeout_seconds)
+                return await call()
+            except Exception as e:
+                if not is_retryable(e):
+                    self.log.error(f"{provider} call failed with a non-retryable error: {e}")
+                    raise LLMRequestFailed(provider=provider, error=e) from e
+
+                wait_time = self.calculate_next_time(attempt_number)
+                elapsed = time.monotonic() - started_at
+                if (
+                    attempt_number >= self.max_attempts
+                    or elapsed + wait_time > self.max_elapsed_seconds
+                ):
+                    raise LLMRetriesExhausted(
+                        provider=provider, attempts=attempt_number, error=e
+                    ) from e
+
+                self.log.warning(
+                    f"Retryable error from {provider} ({type(e).__name__}), retrying in {wait_time:.1f} seconds"
+                )
+                if on_backoff is not None:
+                    on_backoff(wait_time)
+                await asyncio.sleep(wait_time)
+                attempt_number += 1
@@ -0,0 +1,226 @@
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from pyba.logger import get_logger
+from pyba.utils.load_yaml import load_config
+
+config = load_config("general")["main_engine_configs"]["telemetry"]
+
+
+@dataclass
+class LLMCallRecord:
+    """
+    The telemetry of a single LLM call
+
+    Args:
+        `session_id`: The session of the engine which made the call
+        `step`: The engine's step number when the call was made (0 before the first step)
+        `agent_type`: action, output, planner or extraction
+        `provider`, `model`: Where the call went
+        `source`: `provider` for a real call, `cache` or `cassette` when answered locally
+        `started_at`: Unix timestamp of the start of the call
+        `wall_seconds`: The time from the start of the call to the parsed response
+        `queue_seconds`: The part of it spent waiting on the rate limiter
+        `backoff_seconds`: The part of it spent backing off between retries
+        `attempts`: The number of requests sent
+        `input_tokens`, `output_tokens`, `cached_tokens`: From the provider's usage fields
+        `cost`: The estimated cost in USD, None if the model has no price configured
+        `error`: The error the call failed with, if it did
+    """
+
+    session_id: Optional[str]
+    step: int
+    agent_type: str
+    provider: str
+    model: str
+    source: str = "provider"
+    started_at: float = field(default_factory=time.time)
+    wall_seconds: float = 0.0
+    queue_seconds: float = 0.0
+    backoff_seconds: float = 0.0
+    attempts: int = 0
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+    cost: Optional[float] = None
+    error: Optional[str] = None
+
+    def add_backoff(self, seconds: float) -> None:
+        self.backoff_seconds += seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Telemetry:
+    """
+    Per-engine telemetry of the LLM calls.
+
+    Every `handle_*_execution` call of every agent produces an `LLMCallRecord` with its latency,
+    the time spent queueing on the rate limiter and backing off, the token usage reported by the
+    provider and an estimated cost. The records are:
+
+    - kept in `records` and summarised per agent type by `stats` (calls, p50/p95 latency, tokens,
+      cost), which the engine logs at the end of a run
+    - handed to every hook added with `add_hook`, as soon as the call finishes
+    - stored in the `LLMCallTelemetry` table if the engine has a database and `store_in_database`
+      is set
+
+    The prices for the cost estimate are read from the config, per million tokens.
+    """
+
+    def __init__(self, engine, store_in_database: bool = config["store_in_database"]):
+        """
+        Args:
+            `engine`: The engine the calls are made for, read for its session and database
+            `store_in_database`: Write the records to the engine's database, if it has one
+        """
+        self.engine = engine
+        self.store_in_database = store_in_database
+        self.step = 0
+        self.records: List[LLMCallRecord] = []
+        self.hooks: List[Callable[[LLMCallRecord], None]] = []
+        self.log = get_logger()
+
+    def add_hook(self, hook: Callable[[LLMCallRecord], None]) -> None:
+        """
+        Registers a callable which receives every `LLMCallRecord` once its call finishes
+        """
+        self.hooks.append(hook)
+
+    def next_step(self) -> None:
+        """
+        Moves on to the engine's next step, the following calls are tagged with it
+        """
+        self.step += 1
+
+    def start(self, agent: Dict, provider: str) -> LLMCallRecord:
+        """
+        Opens the record for a call
+
+        Args:
+            `agent`: The agent parameters of the call
+            `provider`: The provider the call goes to
+        """
+        return LLMCallRecord(
+            session_id=getattr(self.engine, "session_id", None),
+            step=self.step,
+            agent_type=agent.get("agent_type", "unknown"),
+            provider=provider,
+            model=agent["model"],
+        )
+
+    @staticmethod
+    def openai_usage(usage: Any) -> Dict[str, Optional[int]]:
+        """
+        Reads the token counts from an OpenAI `usage` object
+        """
+        details = getattr(usage, "prompt_tokens_details", None)
+        return {
+            "input_tokens": getattr(usage, "prompt_tokens", None),
+            "output_tokens": getattr(usage, "completion_tokens", None),
+            "cached_tokens": getattr(details, "cached_tokens", None),
+        }
+
+    @staticmethod
+    def gemini_usage(usage_metadata: Any) -> Dict[str, Optional[int]]:
+        """
+        Reads the token counts from a Gemini/VertexAI `usage_metadata` object
+        """
+        return {
+            "input_tokens": getattr(usage_metadata, "prompt_token_count", None),
+            "output_tokens": getattr(usage_metadata, "candidates_token_count", None),
+            "cached_tokens": getattr(usage_metadata, "cached_content_token_count", None),
+        }
+
+    @staticmethod
+    def estimate_cost(record: LLMCallRecord) -> Optional[float]:
+        """
+        Estimates the cost of a call in USD from the configured prices, cached input tokens are
+        charged at the cached rate
+        """
+        prices = (config["prices"] or {}).get(record.model)
+        if not prices or record.input_tokens is None:
+            return None
+
+        cached_tokens = record.cached_tokens or 0
+        cost = (
+            (record.input_tokens - cached_tokens) * prices["input"]
+            + cached_tokens * prices.get("cached_input", prices["input"])
+            + (record.output_tokens or 0) * prices["output"]
+        )
+        return round(cost / 1_000_000, 6)
+
+    def finish(
+        self,
+        record: LLMCallRecord,
+        started_at: float,
+        usage: Dict[str, Optional[int]] = None,
+        error: Exception = None,
+    ) -> None:
+        """
+        Closes a record and publishes it to the hooks and the database
+
+        Args:
+            `record`: The record opened by `start`
+            `started_at`: The `time.perf_counter()` reading taken when the call started
+            `usage`: The token counts from `openai_usage` or `gemini_usage`
+            `error`: The exception the call failed with
+        """
+        record.wall_seconds = round(time.perf_counter() - started_at, 4)
+        if usage:
+            record.input_tokens = usage["input_tokens"]
+            record.output_tokens = usage["output_tokens"]
+            record.cached_tokens = usage["cached_tokens"]
+        record.cost = self.estimate_cost(record)
+        if error is not None:
+            record.error = f"{type(error).__name__}: {error}"
+
+        self.records.append(record)
+
+        for hook in self.hooks:
+            try:
+                hook(record)
+            except Exception as e:
+                self.log.warning(f"A telemetry hook failed: {e}")
+
+        db_funcs = getattr(self.engine, "db_funcs", None)
+        if self.store_in_database and db_funcs:
+            # Best effort like the hooks, a failed write must not fail the call it describes
+            try:
+                db_funcs.push_llm_call(record.to_dict())
+            except Exception as e:
+                self.log.warning(f"Couldn't store the LLM call in the database: {e}")
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns the calls, p50/p95 latency, tokens and cost of the session per agent type
+        """
+        by_agent: Dict[str, List[LLMCallRecord]] = {}
+        for record in self.records:
+            by_agent.setdefault(record.agent_type, []).append(record)
+
+        stats = {}
+        for agent_type, records in by_agent.items():
+            latencies = [record.wall_seconds for record in records]
+            costs = [record.cost for record in records if record.cost is not None]
+            stats[agent_type] = {
+                "calls": len(records),
+                "errors": sum(1 for record in records if record.error),
+                "p50_seconds": round(_percentile(latencies, 50), 3),
+                "p95_seconds": round(_percentile(latencies, 95), 3),
+                "queue_seconds": round(sum(record.queue_seconds for record in records), 3),
+                "backoff_seconds": round(sum(record.backoff_seconds for record in records), 3),
+                "input_tokens": sum(record.input_tokens or 0 for record in records),
+                "output_tokens": sum(record.output_tokens or 0 for record in records),
+                "cached_tokens": sum(record.cached_tokens or 0 for record in records),
+                "cost": round(sum(costs), 4) if costs else None,
+            }
+        return stats
@@ -1,5 +1,6 @@
 import asyncio
 import re
+from typing import List, Union
 from urllib.parse import urljoin
 
 from playwright._impl._errors import Error
@@ -9,7 +10,7 @@ import pyba.core.helpers as global_vars
 from pyba.core.helpers.jitters import MouseMovements, ScrollMovements
 from pyba.logger import get_logger
 from pyba.utils.common import is_absolute_url
-from pyba.utils.structure import PlaywrightAction
+from pyba.utils.structure import PlaywrightAction, expand_action
 
 
 class PlaywrightActionPerformer:
@@ -456,10 +457,83 @@ class PlaywrightActionPerformer:
             return await self.handle_switch_page()
 
 
-async def perform_action(page: Page, action: PlaywrightAction):
+# Fields naming an element on the page, checked to still be there before a batched action runs
+SELECTOR_FIELDS = (
+    "click",
+    "dblclick",
+    "hover",
+    "right_click",
+    "dropdown_field_id",
+    "fill_selector",
+    "type_selector",
+    "press_selector",
+    "check",
+    "uncheck",
+    "select_selector",
+    "upload_selector",
+    "download_selector",
+)
+
+
+async def perform_actions(page: Page, actions: List[PlaywrightAction]):
     """
-    The entry point function
+    Performs a batch of actions in order and stops at the first failure
+
+    Before every action after the first, two cheap guards are checked: the page must still be on
+    the URL the batch started on, and the element the action targets must still be present. If a
+    guard trips the page has changed under the plan, so the rest of the batch is dropped (this
+    isn't a failure) and the next step plans again from the fresh DOM.
+
+    Returns:
+        The same `(value, fail_reason)` pair as `perform_action`, followed by the actions of the
+        batch which were performed, as they were given
+    """
+    log = get_logger()
+    start_url = page.url
+    performed = []
+
+    for index, given_action in enumerate(actions):
+        action = expand_action(given_action)
+        if index > 0:
+            if page.url != start_url:
+                log.info(f"The page navigated, skipping the last {len(actions) - index} actions")
+                break
+
+            selector = next(
+                (
+                    getattr(action, field, None)
+                    for field in SELECTOR_FIELDS
+                    if getattr(action, field, None)
+                ),
+                None,
+            )
+            try:
+                present = selector is None or await page.query_selector(selector) is not None
+            except Error:
+                present = False
+            if not present:
+                log.info(f"{selector} is gone, skipping the last {len(actions) - index} actions")
+                break
+
+        value, fail_reason = await perform_action(page, action)
+        if value is None:
+            return None, fail_reason, performed
+        performed.append(given_action)
+
+    return True, None, performed
+
+
+async def perform_action(page: Page, action: Union[PlaywrightAction, List[PlaywrightAction]]):
     """
+    The entry point function. A list of actions (from the batch mode) is run with `perform_actions`
+    and compact actions are expanded into a `PlaywrightAction` first
+    """
+    if isinstance(action, list):
+        value, fail_reason, _ = await perform_actions(page, action)
+        return value, fail_reason
+
+    action = expand_action(action)
+
     # assert isinstance(action, PlaywrightAction), "the input type for action is incorrect!"
     performer = PlaywrightActionPerformer(page, action)
 
@@ -0,0 +1,142 @@
+import re
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+from urllib.parse import quote_plus
+
+from pyba.logger import get_logger
+from pyba.utils.common import START_PAGE
+from pyba.utils.load_yaml import load_config
+from pyba.utils.structure import PlaywrightAction
+
+config = load_config("general")["main_engine_configs"]["fast_path"]
+
+URL_PATTERN = re.compile(r"\b(?:https?://|www\.)[^\s<>\"'`]+", re.IGNORECASE)
+
+# A rule looks at the current state and either returns the action to take or None
+FastPathRule = Callable[["FastPath", Dict, str], Optional[PlaywrightAction]]
+
+
+class FastPath:
+    """
+    Deterministic rules for the steps which don't need a model.
+
+    The rules run before the action agent is asked. The first rule to return an action wins, and
+    the step is performed without an LLM call. Rules are registered on the class with the
+    `register` decorator:
+
+    ```python3
+    @FastPath.register("my_site_search")
+    def my_site_search(fast_path, cleaned_dom, user_prompt):
+        if cleaned_dom.get("current_url") == "https://example.com/":
+            return PlaywrightAction(goto="https://example.com/search?q=...")
+        return None
+    ```
+
+    Each engine keeps its own instance, which counts the LLM calls saved by every rule.
+    """
+
+    rules: Dict[str, FastPathRule] = {}
+
+    def __init__(self, max_search_words: int = config["max_search_words"]):
+        """
+        Args:
+            `max_search_words`: The longest prompt that is sent to the search engine as is
+        """
+        self.max_search_words = max_search_words
+        self.saved_calls = Counter()
+        self.visited_urls = set()
+        self.log = get_logger()
+
+    @classmethod
+    def register(cls, name: str) -> Callable[[FastPathRule], FastPathRule]:
+        """
+        Decorator to add a rule to the registry under a name
+        """
+
+        def decorator(rule: FastPathRule) -> FastPathRule:
+            cls.rules[name] = rule
+            return rule
+
+        return decorator
+
+    def get_action(self, cleaned_dom: Dict, user_prompt: str) -> Optional[PlaywrightAction]:
+        """
+        Runs the rules in the order they were registered
+
+        Args:
+            `cleaned_dom`: The DOM for the current page
+            `user_prompt`: The user's task (or the current plan in the exploratory modes)
+
+        Returns:
+            The action from the first rule that fires, or None to ask the model
+        """
+        for name, rule in self.rules.items():
+            try:
+                action = rule(self, cleaned_dom, user_prompt)
+            except Exception as e:
+                self.log.warning(f"Fast path rule {name} failed: {e}")
+                continue
+
+            if action is not None:
+                self.saved_calls[name] += 1
+                self.log.info(f"Fast path rule {name} chose the action, skipping the model")
+                return action
+
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the number of LLM calls each rule saved
+        """
+        return {"saved_calls": sum(self.saved_calls.values()), "by_rule": dict(self.saved_calls)}
+
+
+def on_start_page(cleaned_dom: Dict) -> bool:
+    """
+    Whether the page is still the untouched start page from `initial_page_setup`
+    """
+    return cleaned_dom.get("current_url") == START_PAGE and not cleaned_dom.get("actual_text")
+
+
+def find_urls(text: str) -> List[str]:
+    """
+    Returns the URLs written out literally in the text, in order
+    """
+    urls = []
+    for match in URL_PATTERN.findall(text):
+        url = match.rstrip(".,;:!?)]}")
+        if url.lower().startswith("www."):
+            url = f"https://{url}"
+        urls.append(url)
+    return urls
+
+
+@FastPath.register("literal_url")
+def literal_url(fast_path: FastPath, cleaned_dom: Dict, user_prompt: str):
+    """
+    Starting out, go straight to the first URL written in the prompt
+    """
+    if not on_start_page(cleaned_dom):
+        return None
+
+    for url in find_urls(user_prompt):
+        if url not in fast_path.visited_urls:
+            fast_path.visited_urls.add(url)
+            return PlaywrightAction(goto=url)
+    return None
+
+
+@FastPath.register("start_page_search")
+def start_page_search(fast_path: FastPath, cleaned_dom: Dict, user_prompt: str):
+    """
+    Starting out with a short prompt and no URL, search for the prompt itself. Going to the
+    results URL does in one action what the model does by filling `#searchbox` and pressing Enter.
+    """
+    if not on_start_page(cleaned_dom) or find_urls(user_prompt):
+        return None
+
+    if len(user_prompt.split()) > fast_path.max_search_words:
+        # Longer tasks need the model to pick out the search query
+        return None
+
+    return PlaywrightAction(goto=f"{START_PAGE}/search?q={quote_plus(user_prompt.strip())}")
@@ -1,6 +1,6 @@
 import asyncio
 import uuid
-from typing import List, Union
+from typing import Callable, List, Literal, Union
 
 from pyba.core.agent import PlannerAgent
 from pyba.core.lib.mode.base import BaseEngine
@@ -33,6 +33,22 @@ class BFS(BaseEngine):
         `trace_save_directory`: The directory where you want the .zip file to be saved
 
         `database`: An instance of the Database class which will define all database specific configs
+        `use_dom_delta`: Choose if you want to send only the DOM changes between steps to the model
+        `use_dom_bundle`: Choose if you want the DOM to be extracted inside the browser in a single round-trip
+        `use_incremental_dom`: Choose if you want the DOM to be indexed inside the browser and only its changes extracted after each step
+        `dom_token_budget`: The number of tokens the DOM may take up in each prompt, filled by relevance to the task
+        `use_response_cache`: Choose if you want identical LLM requests from earlier runs to be answered from a persistent cache
+        `use_plan_cache`: Choose if you want the plans for a task planned in an earlier run to be reused from a persistent cache
+        `cassette_path`: A file to record the LLM responses of the run to, or to replay them from for an offline run
+        `cassette_mode`: Either `record` or `replay`, used only with a `cassette_path`
+        `openai_base_url`: The URL of an OpenAI compatible server (vLLM, llama.cpp) to use instead of OpenAI
+        `openai_model`: The model name to request from OpenAI or the compatible server
+        `use_model_routing`: Choose if you want the steps to go to a fast model first, escalating to the main model when needed
+        `use_fast_path`: Choose if you want obvious steps (like opening a URL from the prompt) to be taken without the model
+        `use_action_batching`: Choose if you want the model to return several actions per step for pages like forms
+        `use_compact_actions`: Choose if you want the model to answer with the compact action format (fewer output tokens)
+        `extraction_chunk_tokens`: Pages longer than this many tokens are extracted in concurrent chunks which are then merged
+        `telemetry_hook`: A callable which receives the `LLMCallRecord` (latency, tokens, cost) of every LLM call
 
     Find these default values at `pyba/config.yaml`.
     """
@@ -51,6 +67,24 @@ class BFS(BaseEngine):
         enable_tracing: bool = config["main_engine_configs"]["enable_tracing"],
         trace_save_directory: str = None,
         database: Database = None,
+        use_dom_delta: bool = config["main_engine_configs"]["dom_delta"]["enabled"],
+        use_dom_bundle: bool = config["main_engine_configs"]["dom_bundle"]["enabled"],
+        use_incremental_dom: bool = config["main_engine_configs"]["incremental_dom"]["enabled"],
+        dom_token_budget: int = config["main_engine_configs"]["dom_serializer"]["token_budget"],
+        use_response_cache: bool = config["main_engine_configs"]["response_cache"]["enabled"],
+        use_plan_cache: bool = config["main_engine_configs"]["plan_cache"]["enabled"],
+        cassette_path: str = None,
+        cassette_mode: Literal["record", "replay"] = "record",
+        openai_base_url: str = config["main_engine_configs"]["openai"]["base_url"],
+        openai_model: str = None,
+        use_model_routing: bool = config["main_engine_configs"]["model_routing"]["enabled"],
+        use_fast_path: bool = config["main_engine_configs"]["fast_path"]["enabled"],
+        use_action_batching: bool = config["main_engine_configs"]["action_batching"]["enabled"],
+        use_compact_actions: bool = config["main_engine_configs"]["compact_actions"]["enabled"],
+        extraction_chunk_tokens: int = config["main_engine_configs"]["extraction_chunking"][
+            "chunk_tokens"
+        ],
+        telemetry_hook: Callable = None,
     ):
         self.mode = "DFS"
         # Passing the common setup to the BaseEngine
@@ -65,6 +99,22 @@ class BFS(BaseEngine):
             vertexai_project_id=vertexai_project_id,
             vertexai_server_location=vertexai_server_location,
             gemini_api_key=gemini_api_key,
+            use_dom_delta=use_dom_delta,
+            use_dom_bundle=use_dom_bundle,
+            use_incremental_dom=use_incremental_dom,
+            dom_token_budget=dom_token_budget,
+            use_response_cache=use_response_cache,
+            use_plan_cache=use_plan_cache,
+            cassette_path=cassette_path,
+            cassette_mode=cassette_mode,
+            openai_base_url=openai_base_url,
+            openai_model=openai_model,
+            use_model_routing=use_model_routing,
+            use_fast_path=use_fast_path,
+            use_action_batching=use_action_batching,
+            use_compact_actions=use_compact_actions,
+            extraction_chunk_tokens=extraction_chunk_tokens,
+            telemetry_hook=telemetry_hook,
         )
 
         # session_id stays here becasue BaseEngine will be inherited by many
@@ -81,7 +131,7 @@ class BFS(BaseEngine):
         """
         Run pyba in DFS mode.
         """
-        plan = self.planner_agent.generate(task=prompt)
+        plan = await self.planner_agent.generate(task=prompt)
         self.log.info(f"This is the plan for a DFS: {plan}")
 
         # TODO: Finish this
@@ -1,13 +1,12 @@
 import asyncio
 import uuid
-from typing import List, Union
+from typing import Callable, List, Literal, Union
 
 from playwright.async_api import async_playwright
 from playwright_stealth import Stealth
 from pydantic import BaseModel
 
 from pyba.core.agent import PlannerAgent
-from pyba.core.lib.action import perform_action
 from pyba.core.lib.mode.base import BaseEngine
 from pyba.database import Database
 from pyba.utils.common import initial_page_setup
@@ -39,6 +38,22 @@ class DFS(BaseEngine):
         `trace_save_directory`: The directory where you want the .zip file to be saved
 
         `database`: An instance of the Database class which will define all database specific configs
+        `use_dom_delta`: Choose if you want to send only the DOM changes between steps to the model
+        `use_dom_bundle`: Choose if you want the DOM to be extracted inside the browser in a single round-trip
+        `use_incremental_dom`: Choose if you want the DOM to be indexed inside the browser and only its changes extracted after each step
+        `dom_token_budget`: The number of tokens the DOM may take up in each prompt, filled by relevance to the task
+        `use_response_cache`: Choose if you want identical LLM requests from earlier runs to be answered from a persistent cache
+        `use_plan_cache`: Choose if you want the plans for a task planned in an earlier run to be reused from a persistent cache
+        `cassette_path`: A file to record the LLM responses of the run to, or to replay them from for an offline run
+        `cassette_mode`: Either `record` or `replay`, used only with a `cassette_path`
+        `openai_base_url`: The URL of an OpenAI compatible server (vLLM, llama.cpp) to use instead of OpenAI
+        `openai_model`: The model name to request from OpenAI or the compatible server
+        `use_model_routing`: Choose if you want the steps to go to a fast model first, escalating to the main model when needed
+        `use_fast_path`: Choose if you want obvious steps (like opening a URL from the prompt) to be taken without the model
+        `use_action_batching`: Choose if you want the model to return several actions per step for pages like forms
+        `use_compact_actions`: Choose if you want the model to answer with the compact action format (fewer output tokens)
+        `extraction_chunk_tokens`: Pages longer than this many tokens are extracted in concurrent chunks which are then merged
+        `telemetry_hook`: A callable which receives the `LLMCallRecord` (latency, tokens, cost) of every LLM call
 
     Find these default values at `pyba/config.yaml`.
     """
@@ -58,6 +73,24 @@ class DFS(BaseEngine):
         enable_tracing: bool = config["main_engine_configs"]["enable_tracing"],
         trace_save_directory: str = None,
         database: Database = None,
+        use_dom_delta: bool = config["main_engine_configs"]["dom_delta"]["enabled"],
+        use_dom_bundle: bool = config["main_engine_configs"]["dom_bundle"]["enabled"],
+        use_incremental_dom: bool = config["main_engine_configs"]["incremental_dom"]["enabled"],
+        dom_token_budget: int = config["main_engine_configs"]["dom_serializer"]["token_budget"],
+        use_response_cache: bool = config["main_engine_configs"]["response_cache"]["enabled"],
+        use_plan_cache: bool = config["main_engine_configs"]["plan_cache"]["enabled"],
+        cassette_path: str = None,
+        cassette_mode: Literal["record", "replay"] = "record",
+        openai_base_url: str = config["main_engine_configs"]["openai"]["base_url"],
+        openai_model: str = None,
+        use_model_routing: bool = config["main_engine_configs"]["model_routing"]["enabled"],
+        use_fast_path: bool = config["main_engine_configs"]["fast_path"]["enabled"],
+        use_action_batching: bool = config["main_engine_configs"]["action_batching"]["enabled"],
+        use_compact_actions: bool = config["main_engine_configs"]["compact_actions"]["enabled"],
+        extraction_chunk_tokens: int = config["main_engine_configs"]["extraction_chunking"][
+            "chunk_tokens"
+        ],
+        telemetry_hook: Callable = None,
     ):
         self.mode = "DFS"
         # Passing the common setup to the BaseEngine
@@ -73,6 +106,22 @@ class DFS(BaseEngine):
             vertexai_project_id=vertexai_project_id,
             vertexai_server_location=vertexai_server_location,
             gemini_api_key=gemini_api_key,
+            use_dom_delta=use_dom_delta,
+            use_dom_bundle=use_dom_bundle,
+            use_incremental_dom=use_incremental_dom,
+            dom_token_budget=dom_token_budget,
+            use_response_cache=use_response_cache,
+            use_plan_cache=use_plan_cache,
+            cassette_path=cassette_path,
+            cassette_mode=cassette_mode,
+            openai_base_url=openai_base_url,
+            openai_model=openai_model,
+            use_model_routing=use_model_routing,
+            use_fast_path=use_fast_path,
+            use_action_batching=use_action_batching,
+            use_compact_actions=use_compact_actions,
+            extraction_chunk_tokens=extraction_chunk_tokens,
+            telemetry_hook=telemetry_hook,
         )
 
         # session_id stays here becasue BaseEngine will be inherited by many
@@ -113,7 +162,7 @@ class DFS(BaseEngine):
 
                 for steps in range(0, self.max_breadth):
                     # The breadth specifies the number of different plans we can execute
-                    plan = self.planner_agent.generate(task=prompt, old_plan=self.old_plan)
+                    plan = await self.planner_agent.generate(task=prompt, old_plan=self.old_plan)
                     self.log.info(f"This is the plan for a DFS: {plan}")
 
                     for _ in range(0, self.max_depth):
@@ -126,7 +175,7 @@ class DFS(BaseEngine):
                             continue
                         # Get an actionable element from the playwright agent
                         history = self.fetch_history()
-                        action = self.fetch_action(
+                        action = await self.fetch_action(
                             cleaned_dom=cleaned_dom.to_dict(),
                             user_prompt=plan,
                             history=history,
@@ -142,13 +191,7 @@ class DFS(BaseEngine):
                             return output
                         # If not, store the action and perform the action
                         self.log.action(action)
-                        if self.db_funcs:
-                            self.db_funcs.push_to_episodic_memory(
-                                session_id=self.session_id,
-                                action=str(action),
-                                page_url=str(self.page.url),
-                            )
-                        value, fail_reason = await perform_action(self.page, action)
+                        value, fail_reason = await self.perform_and_remember(action)
                         if value is None:
                             # This means the action failed due to whatever reason. The best bet is to
                             # pass in the latest cleaned_dom and get the output again
@@ -171,8 +214,10 @@ class DFS(BaseEngine):
                     )
                     self.old_plan = plan
         finally:
+            await self.finish_extractions()
             await self.save_trace()
             await self.shut_down()
+            self.log_session_stats()
 
     def sync_run(
         self,
@@ -1,22 +1,38 @@
 import asyncio
 import json
-from typing import Dict, Optional, Literal
+from typing import Callable, Dict, Optional, Literal
 
 from playwright.async_api import TimeoutError
 from pydantic import BaseModel
 
 import pyba.core.helpers as global_vars
 from pyba.core.agent import PlaywrightAgent
+from pyba.core.agent.cassette import Cassette
+from pyba.core.agent.extraction_pool import ExtractionPool
+from pyba.core.agent.plan_cache import PlanCache
+from pyba.core.agent.prompt_cache import PromptCache
+from pyba.core.agent.rate_limiter import RateLimiter
+from pyba.core.agent.response_cache import ResponseCache
+from pyba.core.agent.telemetry import Telemetry
 from pyba.core.helpers.jitters import MouseMovements, ScrollMovements
 from pyba.core.lib import HandleDependencies
-from pyba.core.lib.action import perform_action
+from pyba.core.lib.action import perform_action, perform_actions
 from pyba.core.lib.code_generation import CodeGeneration
+from pyba.core.lib.fast_path import FastPath
 from pyba.core.provider import Provider
 from pyba.core.scripts import ExtractionEngines
 from pyba.core.tracing import Tracing
 from pyba.database import DatabaseFunctions
 from pyba.logger import setup_logger, get_logger
-from pyba.utils.exceptions import DatabaseNotInitialised
+from pyba.utils.exceptions import (
+    CassetteResponseNotFound,
+    DatabaseNotInitialised,
+    LLMRequestFailed,
+    LLMRetriesExhausted,
+)
+
+# The errors which end the run instead of being treated as an unusable response
+FATAL_LLM_ERRORS = (LLMRequestFailed, LLMRetriesExhausted, CassetteResponseNotFound)
 
 
 class BaseEngine:
@@ -29,6 +45,15 @@ class BaseEngine:
         - `db_funcs`: The database functions to be used for inserting and querying logs
         - `mode`: The mode of operation (DFS, BFS or Normal)
         - `provider_instance`: This will detect the provider you're using
+        - `prompt_cache`: Provider side prompt caching along with its hit/miss counts for the session
+        - `response_cache`: The persistent LLM response cache, if enabled
+        - `plan_cache`: The persistent cache of the planner's plans, if enabled (DFS and BFS)
+        - `cassette`: Records the LLM responses of the run or replays them, if a cassette path is given
+        - `fast_path`: The deterministic rules tried before the model, if enabled
+        - `incremental_extractions`: The incremental DOM extraction of each page, if enabled
+        - `extraction_pool`: The bounded pool the background extractions run on
+        - `extracted_data`: The objects extracted during the last run
+        - `telemetry`: The per-call telemetry of the LLM calls, passed to the `telemetry_hook` if given
         - `playwright_agent`: The actual playwright brains of the operation
     """
 
@@ -46,6 +71,22 @@ class BaseEngine:
         vertexai_project_id: str = None,
         vertexai_server_location: str = None,
         gemini_api_key: str = None,
+        use_dom_delta: bool = None,
+        use_dom_bundle: bool = None,
+        use_incremental_dom: bool = None,
+        dom_token_budget: int = None,
+        use_response_cache: bool = None,
+        use_plan_cache: bool = None,
+        cassette_path: str = None,
+        cassette_mode: Literal["record", "replay"] = None,
+        openai_base_url: str = None,
+        openai_model: str = None,
+        use_model_routing: bool = None,
+        use_fast_path: bool = None,
+        use_action_batching: bool = None,
+        use_compact_actions: bool = None,
+        extraction_chunk_tokens: int = None,
+        telemetry_hook: Callable = None,
     ):
         self.headless_mode = headless
         self.tracing = enable_tracing
@@ -56,6 +97,16 @@ class BaseEngine:
         self.db_funcs = DatabaseFunctions(self.database) if database else None
 
         self.automated_login_engine_classes = []
+        self.use_dom_delta = use_dom_delta if use_dom_delta else False
+        self.use_dom_bundle = use_dom_bundle if use_dom_bundle else False
+        self.use_incremental_dom = use_incremental_dom if use_incremental_dom else False
+        self.incremental_extractions = {}
+        self.dom_token_budget = dom_token_budget
+        self.use_model_routing = use_model_routing if use_model_routing else False
+        self.use_action_batching = use_action_batching if use_action_batching else False
+        self.use_compact_actions = use_compact_actions if use_compact_actions else False
+        self.extraction_chunk_tokens = extraction_chunk_tokens
+        self.fast_path = FastPath() if use_fast_path else None
 
         self.use_random_flag = (
             use_random if use_random else False
@@ -67,11 +118,16 @@ class BaseEngine:
         setup_logger(use_logger=use_logger)
         self.log = get_logger()
 
+        self.cassette = Cassette(path=cassette_path, mode=cassette_mode) if cassette_path else None
+
         provider_instance = Provider(
             openai_api_key=openai_api_key,
             gemini_api_key=gemini_api_key,
             vertexai_project_id=vertexai_project_id,
             vertexai_server_location=vertexai_server_location,
+            cassette=self.cassette,
+            openai_base_url=openai_base_url,
+            openai_model=openai_model,
         )
 
         self.provider = provider_instance.provider
@@ -80,6 +136,21 @@ class BaseEngine:
         self.gemini_api_key = provider_instance.gemini_api_key
         self.vertexai_project_id = provider_instance.vertexai_project_id
         self.location = provider_instance.location
+        self.openai_base_url = provider_instance.openai_base_url
+
+        if self.cassette and self.cassette.mode == "record":
+            self.cassette.start_recording(provider=self.provider, model=self.model)
+
+        self.prompt_cache = PromptCache()
+        self.response_cache = ResponseCache(database=self.database) if use_response_cache else None
+        self.plan_cache = PlanCache(database=self.database) if use_plan_cache else None
+
+        self.extraction_pool = ExtractionPool()
+        self.extracted_data = []
+
+        self.telemetry = Telemetry(engine=self)
+        if telemetry_hook:
+            self.telemetry.add_hook(telemetry_hook)
 
         # Defining the playwright agent with the defined configs
         self.playwright_agent = PlaywrightAgent(engine=self)
@@ -101,6 +172,11 @@ class BaseEngine:
         self.mouse = MouseMovements(page=self.page)
         self.scroll_manager = ScrollMovements(page=self.page)
 
+        if self.use_incremental_dom:
+            return await self.extract_dom_incremental()
+        if self.use_dom_bundle:
+            return await self.extract_dom_bundle()
+
         try:
             await self.wait_till_loaded()
             page_html = await self.page.content()
@@ -136,6 +212,7 @@ class BaseEngine:
             elements=elements,
             base_url=base_url,
             page=self.page,
+            rank_by_budget=self.dom_token_budget is not None,
         )
 
         # Perform an all out extraction
@@ -143,6 +220,61 @@ class BaseEngine:
         cleaned_dom.current_url = base_url
         return cleaned_dom
 
+    async def extract_dom_bundle(self):
+        """
+        `extract_dom` in a single round-trip: the bundled extraction script is evaluated inside the
+        page and returns the filtered DOM as one payload, instead of the page HTML, body text and
+        input elements being fetched separately and parsed in python.
+        """
+        extraction_engine = ExtractionEngines(
+            page=self.page,
+            rank_by_budget=self.dom_token_budget is not None,
+            use_bundle=True,
+        )
+        return await self._extract_in_page(extraction_engine)
+
+    async def extract_dom_incremental(self):
+        """
+        `extract_dom` from the index the incremental DOM script keeps inside the page: only the
+        elements which changed since the last step are judged and merged into the page's last
+        cleaned_dom. A page which navigated is scanned in full.
+        """
+        incremental_extraction = self.incremental_extractions.get(self.page)
+        if incremental_extraction is None:
+            incremental_extraction = ExtractionEngines.incremental(
+                page=self.page,
+                clickable_fields_flag=self.dom_token_budget is not None,
+                filter_by_entropy=self.dom_token_budget is None,
+            )
+            self.incremental_extractions[self.page] = incremental_extraction
+
+        extraction_engine = ExtractionEngines(
+            page=self.page,
+            rank_by_budget=self.dom_token_budget is not None,
+            incremental_extraction=incremental_extraction,
+        )
+        return await self._extract_in_page(extraction_engine)
+
+    async def _extract_in_page(self, extraction_engine: ExtractionEngines):
+        """
+        Runs an extraction which is evaluated inside the page, once the page has loaded
+        """
+        try:
+            await self.wait_till_loaded()
+            cleaned_dom = await extraction_engine.extract_all()
+        except Exception:
+            # The evaluate fails the same way as `page.content()` if the page navigates under it,
+            # see `extract_dom`
+            try:
+                await self.wait_till_loaded()
+            except Exception:
+                await asyncio.sleep(3)
+
+            cleaned_dom = await extraction_engine.extract_all()
+
+        cleaned_dom.current_url = self.page.url
+        return cleaned_dom
+
     async def generate_output(self, action, cleaned_dom, prompt):
         """
         Helper function to generate the output if the action
@@ -153,18 +285,22 @@ class BaseEngine:
             `cleaned_dom`: The latest cleaned_dom for the model to read
             `prompt`: The prompt which was given to the model
         """
-        if action is None or all(value is None for value in vars(action).values()):
+        if action is None or (
+            not isinstance(action, list) and all(value is None for value in vars(action).values())
+        ):
             self.log.success("Automation completed, agent has returned None")
             try:
-                output = self.playwright_agent.get_output(
+                output = await self.playwright_agent.get_output(
                     cleaned_dom=cleaned_dom.to_dict(), user_prompt=prompt
                 )
                 self.log.info(f"This is the output given by the model: {output}")
                 return output
+            except FATAL_LLM_ERRORS:
+                raise
             except Exception:
                 # This should rarely happen
                 await asyncio.sleep(10)
-                output = self.playwright_agent.get_output(
+                output = await self.playwright_agent.get_output(
                     cleaned_dom=cleaned_dom.to_dict(), user_prompt=prompt
                 )
                 self.log.info(f"This is the output given by the model: {output}")
@@ -189,7 +325,12 @@ class BaseEngine:
         """
         Function to cleanly close the existing browsers and contexts. This also saves
         the traces in the provided trace_dir by the user or the default.
+
+        The explicit prompt caches of the session are deleted here as well, they would otherwise
+        stay billable on the provider until they expire.
         """
+        await self.prompt_cache.delete_cached_contents()
+
         try:
             await self.context.close()
             await self.browser.close()
@@ -197,6 +338,46 @@ class BaseEngine:
             # Context/browser have already been closed
             pass
 
+    async def finish_extractions(self):
+        """
+        Waits for the background extractions of the run to finish (cancelling the ones which take
+        too long) and keeps their results in `extracted_data` for the caller
+        """
+        self.extracted_data = await self.extraction_pool.drain()
+        if self.extracted_data:
+            self.log.info(f"Extracted {len(self.extracted_data)} objects during this run")
+
+    def log_session_stats(self):
+        """
+        Logs the LLM statistics collected over the session
+        """
+        self.log.info(f"Prompt cache stats for this session: {self.prompt_cache.stats()}")
+        if self.response_cache:
+            self.log.info(f"Response cache stats for this session: {self.response_cache.stats()}")
+        if self.plan_cache:
+            self.log.info(f"Plan cache stats for this session: {self.plan_cache.stats()}")
+
+        self.log.info(f"Extraction stats for this session: {self.extraction_pool.stats()}")
+        self.log.info(f"LLM call stats for this session: {self.telemetry.stats()}")
+
+        if self.incremental_extractions:
+            incremental_stats = {}
+            for incremental_extraction in self.incremental_extractions.values():
+                for key, value in incremental_extraction.stats().items():
+                    incremental_stats[key] = incremental_stats.get(key, 0) + value
+            self.log.info(f"Incremental DOM stats for this session: {incremental_stats}")
+
+        if self.fast_path:
+            self.log.info(f"Fast path stats for this session: {self.fast_path.stats()}")
+
+        model_router = self.playwright_agent.model_router
+        if model_router:
+            self.log.info(f"Model routing stats for this session: {model_router.stats()}")
+
+        rate_limiter = RateLimiter.for_provider(self.provider)
+        if rate_limiter.enabled:
+            self.log.info(f"Rate limiter stats for {self.provider}: {rate_limiter.stats()}")
+
     def generate_code(self, output_path: str) -> bool:
         """
         Function end-point for code generation
@@ -232,6 +413,11 @@ class BaseEngine:
         self.trace_dir = tracing.trace_dir
         context = await tracing.initialize_context()
 
+        if self.use_incremental_dom:
+            # Added before any page is opened so that every document starts with its index
+            await context.add_init_script(script=ExtractionEngines.incremental.init_script)
+            self.incremental_extractions = {}
+
         return context
 
     async def attempt_login(self) -> bool:
@@ -291,6 +477,11 @@ class BaseEngine:
         except Exception:
             await asyncio.sleep(2)
 
+        if self.use_incremental_dom:
+            return await self.extract_dom_incremental()
+        if self.use_dom_bundle:
+            return await self.extract_dom_bundle()
+
         page_html = await self.page.content()
         body_text = await self.page.inner_text("body")
         elements = await self.page.query_selector_all(self.combined_selector)
@@ -302,6 +493,7 @@ class BaseEngine:
             elements=elements,
             base_url=base_url,
             page=self.page,
+            rank_by_budget=self.dom_token_budget is not None,
         )
         cleaned_dom = await extraction_engine.extract_all()
         cleaned_dom.current_url = base_url
@@ -331,7 +523,7 @@ class BaseEngine:
 
         return history
 
-    def fetch_action(
+    async def fetch_action(
         self,
         cleaned_dom: Dict,
         user_prompt: str,
@@ -349,18 +541,30 @@ class BaseEngine:
 
         For an explanation of the `extraction_format` read the main file documentation.
 
+        If the fast path is enabled its rules are tried first, and the model is only asked when
+        none of them fire.
+
         Returns:
             `action`: An actionable playwrightresponse element
         """
+        self.telemetry.next_step()
+
+        if self.fast_path:
+            action = self.fast_path.get_action(cleaned_dom=cleaned_dom, user_prompt=user_prompt)
+            if action is not None:
+                return action
 
         try:
-            action = self.playwright_agent.process_action(
+            action = await self.playwright_agent.process_action(
                 cleaned_dom=cleaned_dom,
                 user_prompt=user_prompt,
                 history=history,
                 extraction_format=extraction_format,
             )
+        except FATAL_LLM_ERRORS:
+            raise
         except Exception as e:
+            # A response which couldn't be parsed into an action
             self.log.error(f"something went wrong in obtaining the response: {e}")
             action = None
 
@@ -393,7 +597,7 @@ class BaseEngine:
         """
 
         self.log.warning("The previous action failed, checking the latest page")
-        action = self.playwright_agent.process_action(
+        action = await self.playwright_agent.process_action(
             cleaned_dom=cleaned_dom,
             user_prompt=prompt,
             history=history,
@@ -407,16 +611,46 @@ class BaseEngine:
             return output
 
         self.log.action(action)
+        await self.perform_and_remember(action)
+
+    async def perform_and_remember(self, action):
+        """
+        Performs the action and stores it in the episodic memory. Of a batch only the actions which
+        were performed are stored, the ones skipped or cut off by a failure never ran and must not
+        end up in the history or the generated script.
+
+        Args:
+            `action`: The action, or the list of actions in batch mode
+
+        Returns:
+            The `(value, fail_reason)` pair of `perform_action`
+        """
+        if isinstance(action, list):
+            value, fail_reason, performed = await perform_actions(self.page, action)
+            self.push_to_memory(performed)
+            return value, fail_reason
 
-        if self.db_funcs:
+        self.push_to_memory(action)
+        return await perform_action(self.page, action)
+
+    def push_to_memory(self, action) -> None:
+        """
+        Stores the action in the episodic memory if a database is in use. A batch is stored one
+        action at a time so that the history and the code generation see single actions.
+
+        Args:
+            `action`: The action, or the list of actions in batch mode
+        """
+        if not self.db_funcs:
+            return
+
+        for single_action in action if isinstance(action, list) else [action]:
             self.db_funcs.push_to_episodic_memory(
                 session_id=self.session_id,
-                action=str(action),
+                action=str(single_action),
                 page_url=str(self.page.url),
             )
 
-        await perform_action(self.page, action)
-
     async def wait_till_loaded(self):
         """
         Helper function to wait till load state while applying
@@ -1,3 +1,6 @@
+import os
+
+from pyba.core.agent.cassette import Cassette
 from pyba.logger import get_logger
 from pyba.utils.exceptions import ServiceNotSelected, ServerLocationUndefined
 from pyba.utils.load_yaml import load_config
@@ -16,12 +19,18 @@ class Provider:
         gemini_api_key: str = None,
         vertexai_project_id: str = None,
         vertexai_server_location: str = None,
+        cassette: Cassette = None,
+        openai_base_url: str = None,
+        openai_model: str = None,
     ):
         """
         Args:
                 openai_api_key: API key for OpenAI models should you want to use that
                 vertexai_project_id: Create a VertexAI project to use that instead of OpenAI
                 vertexai_server_location: VertexAI server location
+                cassette: A cassette to replay the responses from instead of calling a provider
+                openai_base_url: The URL of an OpenAI compatible server, such as a local vLLM
+                openai_model: The model to ask the OpenAI compatible server for
                 logger: The logger instance
         """
 
@@ -31,12 +40,32 @@ class Provider:
         self.vertexai_project_id: str | None = vertexai_project_id
         self.gemini_api_key: str | None = gemini_api_key
         self.location: str | None = vertexai_server_location
+        self.cassette = cassette
+        self.openai_base_url: str | None = openai_base_url or config["openai"]["base_url"]
+        self.openai_model: str | None = openai_model
+
+        if (
+            self.openai_base_url
+            and self.openai_api_key is None
+            and self.vertexai_project_id is None
+            and self.gemini_api_key is None
+        ):
+            # Local servers don't check the key but the client refuses to start without one. A key
+            # in the environment is still used, a server behind a gateway may need it
+            self.openai_api_key = os.environ.get("OPENAI_API_KEY") or "EMPTY"
 
         self.log = get_logger()
 
         self.handle_keys()
 
     def handle_keys(self):
+        if self.cassette is not None and self.cassette.mode == "replay":
+            # No provider is contacted on replay, the cassette decides which one the responses
+            # are parsed as
+            self.provider = self.cassette.header["provider"]
+            self.model = self.cassette.header["model"]
+            return
+
         if (
             self.openai_api_key is None
             and self.vertexai_project_id is None
@@ -57,7 +86,7 @@ class Provider:
                 "You've defined more than one LLM keys, we're choosing to go with openai!"
             )
             self.provider = config["openai"]["provider"]
-            self.model = config["openai"]["model"]
+            self.model = self.openai_model or config["openai"]["model"]
             self.vertexai_project_id = None
             self.location = None
 
@@ -67,7 +96,7 @@ class Provider:
             self.model = config["vertexai"]["model"]
         elif self.openai_api_key:
             self.provider = config["openai"]["provider"]
-            self.model = config["openai"]["model"]
+            self.model = self.openai_model or config["openai"]["model"]
         else:
             self.provider = config["gemini"]["provider"]
             self.model = config["gemini"]["model"]
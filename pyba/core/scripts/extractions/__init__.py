@@ -1,5 +1,7 @@
 from playwright.async_api import Page
+from pyba.core.scripts.extractions.bundle import BundleDOMExtraction
 from pyba.core.scripts.extractions.general import GeneralDOMExtraction
+from pyba.core.scripts.extractions.incremental import IncrementalDOMExtraction
 from pyba.core.scripts.extractions.youtube_ import YouTubeDOMExtraction
 
 import asyncio
@@ -11,18 +13,43 @@ class ExtractionEngines:
     """
 
     general = GeneralDOMExtraction
+    bundle = BundleDOMExtraction
+    incremental = IncrementalDOMExtraction
     youtube = YouTubeDOMExtraction
 
     @classmethod
     def available_engines(cls):
         return [name for name, value in vars(cls).items() if isinstance(value, type)]
 
-    def __init__(self, html: str, body_text: str, elements: list, base_url: str, page: Page):
+    def __init__(
+        self,
+        html: str = None,
+        body_text: str = None,
+        elements: list = None,
+        base_url: str = None,
+        page: Page = None,
+        rank_by_budget: bool = False,
+        use_bundle: bool = False,
+        incremental_extraction: IncrementalDOMExtraction = None,
+    ):
+        """
+        Args:
+            `rank_by_budget`: Set when the DOM is later trimmed to a token budget by relevance. The
+            general extraction then keeps every clickable and high entropy URL and leaves the
+            choosing to the ranking.
+            `use_bundle`: Run the general extraction inside the page in a single round-trip. The
+            `html`, `body_text` and `elements` aren't needed then.
+            `incremental_extraction`: The incremental extraction kept for the page, used instead of
+            the general extraction when given.
+        """
         self.html = html
         self.body_text = body_text
         self.elements = elements
         self.base_url = base_url
         self.page = page
+        self.rank_by_budget = rank_by_budget
+        self.use_bundle = use_bundle
+        self.incremental_extraction = incremental_extraction
 
         self.output = {}
 
@@ -30,12 +57,24 @@ class ExtractionEngines:
         """
         Create the all encompassing extraction engine
         """
-        general = ExtractionEngines.general(
-            html=self.html,
-            body_text=self.body_text,
-            elements=self.elements,
-            base_url=self.base_url,
-        )
+        if self.incremental_extraction is not None:
+            general = self.incremental_extraction
+        elif self.use_bundle:
+            general = ExtractionEngines.bundle(
+                page=self.page,
+                clickable_fields_flag=self.rank_by_budget,
+                filter_by_entropy=not self.rank_by_budget,
+            )
+        else:
+            general = ExtractionEngines.general(
+                html=self.html,
+                body_text=self.body_text,
+                elements=self.elements,
+                base_url=self.base_url,
+                clickable_fields_flag=self.rank_by_budget,
+                filter_by_entropy=not self.rank_by_budget,
+                page=self.page,
+            )
         general_output = await general.extract()
         self.output = general_output
 
@@ -0,0 +1,81 @@
+from pathlib import Path
+
+from playwright.async_api import Page
+
+from pyba.core.scripts.extractions.filters import extraction_filters
+from pyba.logger import get_logger
+from pyba.utils.load_yaml import load_config
+from pyba.utils.structure import CleanedDOM
+
+general_config = load_config("general")
+config = load_config("extraction")["general"]
+
+
+class BundleDOMExtraction:
+    """
+    The general extraction in a single round-trip to the browser.
+
+    The general extraction reads `page.content()`, `inner_text("body")` and the input elements
+    separately, parses the HTML with BeautifulSoup and probes the input elements in another
+    evaluate. This one injects `js/dom_bundle.js` with a single `page.evaluate`, which collects the
+    hyperlinks, clickables, input field metadata and visible text inside the page, already filtered
+    with the rules of the general extraction, and returns them as one compact JSON payload.
+
+    Input fields are judged with the same in-page probe as the general extraction. The clickables
+    are listed in the same order as well (the clickable tags first, then the button inputs and the
+    [onclick], [role] and [tabindex] elements), so the cap on them keeps the same ones.
+    """
+
+    def __init__(
+        self,
+        page: Page,
+        clickable_fields_flag: bool = False,
+        filter_by_entropy: bool = True,
+    ) -> None:
+        """
+        Args:
+            `page`: The page to extract from
+            `clickable_fields_flag`: Keep all the clickables instead of the first few
+            `filter_by_entropy`: Drop the high entropy hyperlinks
+        """
+        self.page = page
+        self.clickable_fields_flag = clickable_fields_flag
+        self.filter_by_entropy = filter_by_entropy
+        self.log = get_logger()
+
+        # The bundle takes the rules and the input probe as functions, they can't be passed to
+        # evaluate
+        js_directory = Path(__file__).parent.parent / "js"
+        bundle = (js_directory / "dom_bundle.js").read_text().strip()
+        dom_rules = (js_directory / "dom_rules.js").read_text().strip()
+        input_probe = (js_directory / "input_probe.js").read_text().strip()
+        self.js_function_string = f"(config) => ({bundle})(config, {dom_rules}, {input_probe})"
+        self.bundle_config = {
+            "rules": config["extraction_configs"],
+            "input_selector": ", ".join(general_config["process_config"]["selectors"]),
+        }
+
+    async def extract(self) -> CleanedDOM:
+        """
+        Runs the bundle in the page and returns the cleaned_dom
+        """
+        payload = await self.page.evaluate(self.js_function_string, self.bundle_config)
+
+        cleaned_dom = CleanedDOM()
+
+        hyperlinks = payload["hyperlinks"]
+        if self.filter_by_entropy:
+            hyperlinks = extraction_filters.drop_high_entropy(hyperlinks, threshold=5.0)
+        cleaned_dom.hyperlinks = hyperlinks
+
+        clickables = payload["clickables"]
+        cleaned_dom.clickable_fields = (
+            clickables if self.clickable_fields_flag else clickables[:10]
+        )
+
+        cleaned_dom.actual_text = [
+            line.strip() for line in payload["body_text"].split("\n") if line.strip()
+        ]
+        cleaned_dom.input_fields = payload["input_fields"]
+
+        return cleaned_dom
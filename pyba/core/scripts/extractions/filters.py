@@ -0,0 +1,137 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urljoin, urlsplit
+
+from pyba.utils.load_yaml import load_config
+
+config = load_config("extraction")["general"]["extraction_configs"]
+
+# The scheme of an href if it has one (RFC 3986), relative hrefs take the page's scheme
+_SCHEME = re.compile(r"^([a-z][a-z0-9+.\-]*):")
+
+# c * log2(c) for the character counts of a URL, the only logarithms the entropy needs
+_XLOGX = [0.0] + [c * math.log2(c) for c in range(1, 4096)]
+
+
+def _substring_matcher(substrings: Iterable[str]) -> Optional[re.Pattern]:
+    """
+    One alternation over all the substrings, None if there are none
+    """
+    substrings = [s.lower() for s in substrings]
+    if not substrings:
+        return None
+    return re.compile("|".join(re.escape(s) for s in sorted(substrings, key=len, reverse=True)))
+
+
+class ExtractionFilters:
+    """
+    The filter rules of `extraction_configs.yaml`, compiled once per process.
+
+    The hot loops of the general extraction test every hyperlink and clickable against these
+    rules. They are held here as frozensets and one combined regex per substring list, so that
+    each test is a hash lookup or a single scan of the string instead of rebuilding a set from the
+    config and looping over its items.
+    """
+
+    def __init__(self, rules: Dict = config):
+        """
+        Args:
+            `rules`: The `extraction_configs` of the general extraction
+        """
+        clickables = rules["clickables"]
+        hyperlinks = rules["hyperlinks"]
+
+        self.clickable_tags = list(clickables["clickable_field_selectors"])
+        self.dead_hrefs = frozenset(clickables["invalid_selector_field_hyperlinks"])
+        self.button_types = frozenset(clickables["valid_button_types_for_clickables"])
+        self.junk_keywords = _substring_matcher(clickables["junk_keywords"])
+        self.links_to_avoid = _substring_matcher(hyperlinks["links_to_avoid"])
+        self.valid_schemas = frozenset(hyperlinks["valid_schemas"])
+
+    def is_dead_href(self, href_lower: str) -> bool:
+        """
+        True for the hrefs which don't go anywhere (empty, `#...`, `javascript:...`)
+        """
+        return (
+            not href_lower
+            or href_lower in self.dead_hrefs
+            or href_lower.startswith(("javascript:", "#"))
+        )
+
+    def is_junk(self, text_lower: str) -> bool:
+        """
+        True for the clickables whose text marks them as carousel or navigation controls
+        """
+        return self.junk_keywords is not None and self.junk_keywords.search(text_lower) is not None
+
+    def filter_hyperlinks(self, hrefs: Iterable[str], base_url: Optional[str]) -> List[str]:
+        """
+        Drops the dead, avoided and invalid scheme hyperlinks and makes the rest absolute, in a
+        single pass
+
+        The scheme is read off the href itself (or the page for relative ones), so only the links
+        which are kept are joined with the page URL, and each distinct href is joined once.
+
+        Args:
+            `hrefs`: The stripped href attributes of the page
+            `base_url`: The URL of the page, for the relative links
+        """
+        base_scheme = urlsplit(base_url).scheme if base_url else ""
+        joined: Dict[str, str] = {}
+        clean_hrefs = []
+        for href in hrefs:
+            full_url = joined.get(href)
+            if full_url is None:
+                href_lower = href.lower()
+                if self.is_dead_href(href_lower):
+                    continue
+                if self.links_to_avoid is not None and self.links_to_avoid.search(href_lower):
+                    continue
+
+                scheme = _SCHEME.match(href_lower)
+                if (scheme.group(1) if scheme else base_scheme) not in self.valid_schemas:
+                    continue
+
+                full_url = urljoin(base_url, href)
+                joined[href] = full_url
+            clean_hrefs.append(full_url)
+        return clean_hrefs
+
+    @staticmethod
+    def entropy(url: str) -> float:
+        """
+        The shannon entropy of the URL's characters, the same value as `url_entropy`
+        """
+        length = len(url)
+        if length == 0:
+            return 0.0
+        total = 0.0
+        for count in Counter(url).values():
+            total += _XLOGX[count] if count < len(_XLOGX) else count * math.log2(count)
+        return math.log2(length) - total / length
+
+    def drop_high_entropy(self, urls: List[str], threshold: float = 5.0) -> List[str]:
+        """
+        Keeps the URLs whose entropy is below the threshold, for the whole list at once
+
+        The entropy of a string is at most log2 of its number of distinct characters, so a URL
+        with fewer than 2**threshold distinct characters is kept without computing it. Repeated
+        URLs are computed once.
+        """
+        distinct_bound = 2**threshold
+        decided: Dict[str, bool] = {}
+        kept = []
+        for url in urls:
+            keep = decided.get(url)
+            if keep is None:
+                keep = len(set(url)) < distinct_bound or self.entropy(url) < threshold
+                decided[url] = keep
+            if keep:
+                kept.append(url)
+        return kept
+
+
+# Built once when the extractions are imported and shared by all of them
+extraction_filters = ExtractionFilters()
@@ -1,20 +1,28 @@
-import asyncio
+from functools import cached_property
+from pathlib import Path
 from typing import List
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urljoin
 
 from bs4 import BeautifulSoup
-from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from playwright.async_api import Page
 
+from pyba.core.scripts.extractions.filters import extraction_filters
 from pyba.logger import get_logger
-from pyba.utils.common import url_entropy
 from pyba.utils.load_yaml import load_config
 from pyba.utils.structure import CleanedDOM
 
-general_config = load_config("general")
 config = load_config("extraction")[
     "general"
 ]  # This means we're referring to the general extraction class
 
+# lxml parses large pages several times faster than the builtin parser, it's used when installed
+try:
+    import lxml  # noqa: F401
+
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
 
 class GeneralDOMExtraction:
     """
@@ -38,49 +46,54 @@ class GeneralDOMExtraction:
         elements: str,
         base_url: str = None,
         clickable_fields_flag: bool = False,
+        filter_by_entropy: bool = True,
+        page: Page = None,
+        parser: str = HTML_PARSER,
     ) -> None:
         """
-        We'll take the entire dom, the text_body and the elements for sure
+        We'll take the entire dom, the text_body and the elements for sure, along with the page the
+        elements are probed in
+
+        `clickable_fields_flag` keeps all the clickables instead of the first few,
+        `filter_by_entropy` drops the high entropy hyperlinks and `parser` is the BeautifulSoup
+        backend the page is parsed with (lxml if installed).
         """
 
         self.html = html
         self.body_text = body_text
         self.elements = elements
         self.base_url = base_url
+        self.page = page
+        self.parser = parser
 
         self.log = get_logger()
         self.clickable_fields_flag = clickable_fields_flag
-        # For testing fields
-        self.test_value = general_config["main_engine_configs"]["input_field_test_value"]
+        self.filter_by_entropy = filter_by_entropy
+
+        # The in-page probe for the input fields
+        js_file_path = Path(__file__).parent.parent / "js/input_probe.js"
+        self.input_probe_js = js_file_path.read_text()
+
+    @cached_property
+    def soup(self) -> BeautifulSoup:
+        """
+        The parse tree of the page, built once and shared by all the extractions
+        """
+        return BeautifulSoup(self.html, self.parser)
 
     def _extract_clickables(self) -> List[dict]:
-        soup = BeautifulSoup(self.html, "html.parser")
+        soup = self.soup
         candidates = []
 
-        for tag in soup.find_all(
-            list(config["extraction_configs"]["clickables"]["clickable_field_selectors"])
-        ):
-            if tag.name == "a":
-                href = tag.get("href", "").strip().lower()
-                if (
-                    not href
-                    or href
-                    in set(
-                        config["extraction_configs"]["clickables"][
-                            "invalid_selector_field_hyperlinks"
-                        ]
-                    )
-                    or href.startswith("javascript:")
-                    or href.startswith("#")
-                ):
-                    continue
+        for tag in soup.find_all(extraction_filters.clickable_tags):
+            if tag.name == "a" and extraction_filters.is_dead_href(
+                tag.get("href", "").strip().lower()
+            ):
+                continue
             candidates.append(tag)
 
         for tag in soup.find_all("input"):
-            t = tag.get("type", "").lower()
-            if t in tuple(
-                config["extraction_configs"]["clickables"]["valid_button_types_for_clickables"]
-            ):
+            if tag.get("type", "").lower() in extraction_filters.button_types:
                 candidates.append(tag)
 
         candidates += soup.find_all(attrs={"onclick": True})
@@ -89,13 +102,13 @@ class GeneralDOMExtraction:
         )
         candidates += soup.find_all(attrs={"tabindex": True})
 
+        # The same node can be found by several of the queries above
         seen = set()
         results = []
         for el in candidates:
-            key = (el.name, str(el))
-            if key in seen:
+            if id(el) in seen:
                 continue
-            seen.add(key)
+            seen.add(id(el))
 
             href = el.get("href")
             onclick = el.get("onclick")
@@ -110,8 +123,7 @@ class GeneralDOMExtraction:
                 href = urljoin(self.base_url, href)
 
             # Not sure how junk these are but dropping them for now to avoid explosion of context
-            junk_keywords = config["extraction_configs"]["clickables"]["junk_keywords"]
-            if any(k in text.lower() for k in junk_keywords):
+            if extraction_filters.is_junk(text.lower()):
                 continue
 
             results.append(
@@ -122,57 +134,22 @@ class GeneralDOMExtraction:
                     "onclick": onclick,
                     "role": role,
                     "tabindex": tabindex,
-                    "outer_html": str(el)[:1000],
                 }
             )
 
-        # Cleaning this up based on outer_html
-
         cleaned = []
         for el in results:
-            data = {k: v for k, v in el.items() if v and k != "outer_html"}
+            data = {k: v for k, v in el.items() if v}
             cleaned.append(data)
 
         return cleaned
 
     def _extract_href(self) -> List[str]:
-        soup = BeautifulSoup(str(self.html), "html.parser")
-        hrefs = [a["href"].strip() for a in soup.find_all("a", href=True)]
-
-        clean_hrefs = []
-        for href in hrefs:
-            href_lower = href.lower()
-
-            # If we do a raw extraction, all this junk will make it through
-            if (
-                not href_lower
-                or href_lower
-                in set(
-                    config["extraction_configs"]["clickables"]["invalid_selector_field_hyperlinks"]
-                )
-                or href_lower.startswith("javascript:")
-                or href_lower.startswith("#")
-            ):
-                continue
+        hrefs = [a["href"].strip() for a in self.soup.find_all("a", href=True)]
 
-            # Have to figure out a bettery way to handle these
-            # In the case where we do have relative URLs, we just make it absolute
-            full_url = urljoin(self.base_url, href)
-
-            if any(
-                x in href_lower
-                for x in list(config["extraction_configs"]["hyperlinks"]["links_to_avoid"])
-            ):
-                continue
-
-            # Skipping any other type of URL. Will have to make this a confugrable parameter
-            parsed = urlparse(full_url)
-            if parsed.scheme not in set(
-                config["extraction_configs"]["hyperlinks"]["valid_schemas"]
-            ):
-                continue
-
-            clean_hrefs.append(full_url)
+        # If we do a raw extraction, all the junk links (empty, javascript:, tracking, other
+        # schemes) will make it through. The relative ones are made absolute
+        clean_hrefs = extraction_filters.filter_hyperlinks(hrefs, self.base_url)
 
         # Before moving forward, we can filter them based on entropy
         """
@@ -184,8 +161,10 @@ class GeneralDOMExtraction:
         such URLs are almost always greater than 5. Its interesting...
         """
 
-        output = [href for href in clean_hrefs if url_entropy(href) < 5.0]
-        return output
+        if not self.filter_by_entropy:
+            return clean_hrefs
+
+        return extraction_filters.drop_high_entropy(clean_hrefs, threshold=5.0)
 
     async def _extract_all_text(self) -> List:
         lines = self.body_text.split("\n")
@@ -197,12 +176,17 @@ class GeneralDOMExtraction:
         known_fields: List = None,
     ) -> List[dict]:
         """
-        Extracts and verifies fillable input fields. We're passing to it all the valid fields we already know
-        of so that it caches it and doesn't mess with the actual DOM during execution.
+        Extracts the fillable input fields. We're passing to it all the valid fields we already know
+        of so that they are kept and not reported twice.
+
+        All the candidate elements are probed in a single evaluate (`js/input_probe.js`), which reads
+        their visibility, disabled and read-only state and attributes and infers from those whether
+        they can be filled. Nothing is typed into the page, so the probe doesn't set off the site's
+        autocomplete or validation and costs one round-trip however many fields there are.
 
         Args:
             known_fields : List[Dict], optional
-            Previously detected valid fields (to avoid duplicate fills).
+            Previously detected valid fields (to avoid duplicates).
 
         Returns:
             List[Dict]
@@ -212,78 +196,19 @@ class GeneralDOMExtraction:
         valid_fields = [] if known_fields is None else known_fields.copy()
         seen_selectors = {f["selector"] for f in valid_fields if f.get("selector")}
 
-        for el in self.elements:
-            try:
-                is_visible = await el.is_visible()
-                is_enabled = await el.is_enabled()
-                if not (is_visible and is_enabled):
-                    continue
-
-                tag = (await el.evaluate("e => e.tagName.toLowerCase()")).strip()
-                input_type = await el.get_attribute("type")
-                input_type = (input_type or "text").lower().strip()
-                existing_value = await el.input_value() if tag in ["input", "textarea"] else ""
-
-                if tag not in set(config["extraction_configs"]["input_fields"]["valid_tags"]):
-                    continue
-                if input_type in set(
-                    config["extraction_configs"]["input_fields"]["invalid_input_types"]
-                ):
-                    continue
-
-                field_info = {
-                    "tag": tag,
-                    "type": input_type,
-                    "id": await el.get_attribute("id"),
-                    "name": await el.get_attribute("name"),
-                    "placeholder": await el.get_attribute("placeholder"),
-                    "aria_label": await el.get_attribute("aria-label"),
-                    "selector": None,
-                }
+        if not self.elements:
+            return valid_fields
 
-                if field_info["id"]:
-                    selector = f"#{field_info['id']}"
-                elif field_info["name"]:
-                    selector = f"{field_info['tag']}[name='{field_info['name']}']"
-                elif field_info["placeholder"]:
-                    selector = f"{field_info['tag']}[placeholder='{field_info['placeholder']}']"
-                elif field_info["aria_label"]:
-                    selector = f"{field_info['tag']}[aria-label='{field_info['aria_label']}']"
-                else:
-                    selector = f"{field_info['tag']}:nth-of-type(unknown)"
-
-                field_info["selector"] = selector
-
-                # If the field is already filled or we've seen it before,
-                # Then we can skip it
-                if selector in seen_selectors:
-                    continue
-
-                if existing_value and existing_value.strip():
-                    valid_fields.append(field_info)
-                    seen_selectors.add(selector)
-                    continue
-
-                # Filling it and seein
-                await el.fill(self.test_value, timeout=1500)
-                await asyncio.sleep(0.05)
-                new_value = await el.input_value()
-
-                if self.test_value in new_value:
-                    valid_fields.append(field_info)
-                    seen_selectors.add(selector)
-
-                    # TODO: This is failing in some cases because some websites re-render them so we need the selectors again!
-                    # This means cleanup requires its own set of elements.
-                    # Atleast we understand the problem now
-                    await el.fill("")  # clearing the field after testing it
-                else:
-                    pass  # ignore false positives
-
-            except PlaywrightTimeoutError:
-                continue
-            except Exception:
+        probed_fields = await self.page.evaluate(
+            self.input_probe_js,
+            {"elements": self.elements, "rules": config["extraction_configs"]["input_fields"]},
+        )
+
+        for field_info in probed_fields:
+            if field_info is None or field_info["selector"] in seen_selectors:
                 continue
+            valid_fields.append(field_info)
+            seen_selectors.add(field_info["selector"])
 
         return valid_fields
 
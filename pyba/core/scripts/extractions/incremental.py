@@ -0,0 +1,216 @@
+import json
+from pathlib import Path
+from typing import Dict, List
+
+from playwright.async_api import Page
+
+from pyba.core.scripts.extractions.filters import extraction_filters
+from pyba.logger import get_logger
+from pyba.utils.load_yaml import load_config
+from pyba.utils.structure import CleanedDOM
+
+general_config = load_config("general")
+config = load_config("extraction")["general"]
+
+
+def _build_scripts():
+    """
+    The init script which installs the in-page index and the function which collects from it
+    """
+    js_directory = Path(__file__).parent.parent / "js"
+    observer = (js_directory / "dom_observer.js").read_text().strip()
+    dom_rules = (js_directory / "dom_rules.js").read_text().strip()
+    input_probe = (js_directory / "input_probe.js").read_text().strip()
+    observer_config = json.dumps(
+        {
+            "rules": config["extraction_configs"],
+            "input_selector": ", ".join(general_config["process_config"]["selectors"]),
+        }
+    )
+
+    # Init scripts take no arguments, so the config is written into the script
+    init_script = (
+        "if (!window.__pybaDomIndex) {"
+        f" window.__pybaDomIndex = ({observer})({observer_config}, {dom_rules}, {input_probe}); "
+        "}"
+    )
+    collect_function = (
+        "(full) => window.__pybaDomIndex ? window.__pybaDomIndex.collect(full) : null"
+    )
+    return init_script, collect_function
+
+
+INIT_SCRIPT, COLLECT_FUNCTION = _build_scripts()
+
+
+class IncrementalDOMExtraction:
+    """
+    The general extraction kept up to date step by step instead of redone from scratch.
+
+    `js/dom_observer.js` is added to the browser context with `add_init_script`, so every document
+    gets a MutationObserver which keeps a running index of its hyperlinks, clickables and input
+    fields (judged with the same rules as `js/dom_bundle.js`). Each `extract` only judges the
+    elements which were added, removed or changed since the last one, and this object merges those
+    changes into the index it keeps on the python side, so the in-page cost follows the size of the
+    change and not the size of the page. The visible text is only read again when the page's text
+    or layout changed.
+
+    The entries are listed in document order, except for the clickables which are grouped by the
+    query of the general extraction which finds them like in the bundle, so that the clickables cut
+    off by the cap are the same ones. The page places new and moved elements into its ordered index
+    and sends each one with the id of the entry it now follows, so only the arriving ids cross the
+    wire and not the whole order.
+
+    A navigation loads a new document with a new index, which is scanned in full on its first
+    collect. So is a page which was opened before the init script was added, after installing the
+    index into it.
+    """
+
+    init_script = INIT_SCRIPT
+
+    def __init__(
+        self,
+        page: Page,
+        clickable_fields_flag: bool = False,
+        filter_by_entropy: bool = True,
+    ) -> None:
+        """
+        Args:
+            `page`: The page to extract from
+            `clickable_fields_flag`: Keep all the clickables instead of the first few
+            `filter_by_entropy`: Drop the high entropy hyperlinks
+        """
+        self.page = page
+        self.clickable_fields_flag = clickable_fields_flag
+        self.filter_by_entropy = filter_by_entropy
+        self.log = get_logger()
+
+        # The index of the current document, by the ids the in-page index gives its entries
+        self.document_id = None
+        self.hyperlinks: Dict[int, str] = {}
+        self.clickables: Dict[int, Dict] = {}
+        self.clickable_groups: Dict[int, int] = {}
+        self.input_fields: Dict[int, Dict] = {}
+        self.order: List[int] = []
+        self.actual_text: List[str] = []
+
+        self.full_scans = 0
+        self.incremental_steps = 0
+        self.changed_entries = 0
+
+    async def extract(self) -> CleanedDOM:
+        """
+        Collects the changes since the last step from the page and returns the cleaned_dom
+        """
+        payload = await self.page.evaluate(COLLECT_FUNCTION, False)
+
+        if payload is None:
+            # The page has no index yet, it was opened before the init script was added
+            await self.page.evaluate(f"() => {{ {INIT_SCRIPT} }}")
+            payload = await self.page.evaluate(COLLECT_FUNCTION, True)
+        elif not payload["full"] and payload["document_id"] != self.document_id:
+            # The changes are against a state of the page this object never saw
+            payload = await self.page.evaluate(COLLECT_FUNCTION, True)
+
+        self._apply(payload)
+        return self._cleaned_dom()
+
+    def _apply(self, payload: Dict) -> None:
+        """
+        Merges the changed and removed entries of a collect into the index
+        """
+        if payload["full"]:
+            self.hyperlinks.clear()
+            self.clickables.clear()
+            self.clickable_groups.clear()
+            self.input_fields.clear()
+            self.order = payload["order"]
+            self.full_scans += 1
+        else:
+            self.incremental_steps += 1
+
+        self.document_id = payload["document_id"]
+        self.changed_entries += len(payload["changed"]) + len(payload["removed"])
+
+        for entry_id in payload["removed"]:
+            self.hyperlinks.pop(entry_id, None)
+            self.clickables.pop(entry_id, None)
+            self.clickable_groups.pop(entry_id, None)
+            self.input_fields.pop(entry_id, None)
+            self.order.remove(entry_id)
+
+        # Replayed in the order the page placed them, the entry each one follows is already placed
+        for entry_id, after in payload["placed"]:
+            if self._indexed(entry_id):
+                # Moved within the page
+                self.order.remove(entry_id)
+            position = self.order.index(after) + 1 if after is not None else 0
+            self.order.insert(position, entry_id)
+
+        for entry in payload["changed"]:
+            for value, index in (
+                (entry["hyperlink"], self.hyperlinks),
+                (entry["clickable"], self.clickables),
+                (entry["input_field"], self.input_fields),
+            ):
+                if value:
+                    index[entry["id"]] = value
+                else:
+                    index.pop(entry["id"], None)
+            if entry["clickable"]:
+                self.clickable_groups[entry["id"]] = entry["clickable_group"]
+            else:
+                self.clickable_groups.pop(entry["id"], None)
+
+        if payload["body_text"] is not None:
+            self.actual_text = [
+                line.strip() for line in payload["body_text"].split("\n") if line.strip()
+            ]
+
+    def _indexed(self, entry_id: int) -> bool:
+        return (
+            entry_id in self.hyperlinks
+            or entry_id in self.clickables
+            or entry_id in self.input_fields
+        )
+
+    def _cleaned_dom(self) -> CleanedDOM:
+        """
+        The cleaned_dom of the index, in the same shape as the bundled extraction's
+        """
+        cleaned_dom = CleanedDOM()
+
+        hyperlinks = [self.hyperlinks[i] for i in self.order if i in self.hyperlinks]
+        if self.filter_by_entropy:
+            hyperlinks = extraction_filters.drop_high_entropy(hyperlinks, threshold=5.0)
+        cleaned_dom.hyperlinks = hyperlinks
+
+        # The sort is stable, so each group stays in document order
+        clickable_ids = sorted(
+            (i for i in self.order if i in self.clickables), key=self.clickable_groups.get
+        )
+        clickables = [self.clickables[i] for i in clickable_ids]
+        if not self.clickable_fields_flag:
+            clickables = clickables[:10]
+        cleaned_dom.clickable_fields = clickables
+
+        cleaned_dom.actual_text = list(self.actual_text)
+
+        input_fields = {}
+        for i in self.order:
+            field = self.input_fields.get(i)
+            if field is not None:
+                input_fields.setdefault(field["selector"], field)
+        cleaned_dom.input_fields = list(input_fields.values())
+
+        return cleaned_dom
+
+    def stats(self) -> Dict:
+        """
+        The number of full scans and incremental steps, and the entries the steps changed
+        """
+        return {
+            "full_scans": self.full_scans,
+            "incremental_steps": self.incremental_steps,
+            "changed_entries": self.changed_entries,
+        }
@@ -0,0 +1,37 @@
+(config, makeRules, probeInputs) => {
+    // Everything the general extraction needs from the page in a single evaluate, filtered with
+    // the rules from `extraction_configs.yaml` so that only the compact result crosses the wire
+    const rules = makeRules(config, probeInputs);
+
+    // Hyperlinks
+    const hyperlinks = [];
+    for (const el of document.querySelectorAll(rules.hyperlinkSelector)) {
+        const url = rules.hyperlink(el);
+        if (url) hyperlinks.push(url);
+    }
+
+    // Clickables, grouped by the query of the general extraction which finds them and in document
+    // order within a group, so that the cap keeps the same ones
+    const groups = Array.from({ length: rules.clickableGroups }, () => []);
+    for (const el of document.querySelectorAll(rules.clickableSelector)) {
+        const item = rules.clickable(el);
+        if (item) groups[rules.clickableGroup(el)].push(item);
+    }
+    const clickables = groups.flat();
+
+    // Input fields, with the same probe as the general extraction
+    const inputFields = [];
+    const seenSelectors = new Set();
+    for (const field of rules.inputFields(Array.from(document.querySelectorAll(rules.inputSelector)))) {
+        if (field === null || seenSelectors.has(field.selector)) continue;
+        seenSelectors.add(field.selector);
+        inputFields.push(field);
+    }
+
+    return {
+        hyperlinks: hyperlinks,
+        clickables: clickables,
+        input_fields: inputFields,
+        body_text: document.body ? document.body.innerText : "",
+    };
+}
@@ -0,0 +1,178 @@
+(config, makeRules, probeInputs) => {
+    // A running index of the hyperlinks, clickables and input fields of the document, kept up to
+    // date by a MutationObserver so that each collect only judges the elements which changed since
+    // the last one. Installed with `add_init_script`, so every new document starts a fresh index.
+    const rules = makeRules(config, probeInputs);
+    const candidateSelector = [rules.hyperlinkSelector, rules.clickableSelector, rules.inputSelector].join(",");
+
+    // Attributes which change how the element itself is judged
+    const ownAttributes = [
+        "href", "onclick", "role", "tabindex", "type", "id", "name", "placeholder", "aria-label",
+        "disabled", "readonly", "aria-disabled", "aria-readonly",
+    ];
+    // Attributes which can show or hide a whole subtree, and with it the input fields inside
+    const layoutAttributes = ["style", "class", "hidden"];
+
+    const documentId = `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+    let entries = new Map();    // element -> {id, hyperlink, clickable, clickable_group, input_field}
+    let entryKeys = new Map();  // element -> the serialized entry, to skip the unchanged ones
+    let ordered = [];           // the indexed elements in document order
+    let dirty = new Set();
+    let inserted = new Set();   // the candidates of added subtrees, new or moved
+    let nextId = 0;
+    let scanned = false;
+    let textChanged = true;
+
+    const markSubtree = (node, selector, marked = dirty) => {
+        if (node.nodeType !== Node.ELEMENT_NODE) return;
+        if (node.matches(selector)) marked.add(node);
+        for (const el of node.querySelectorAll(selector)) marked.add(el);
+    };
+
+    // A clickable's text is the text of all its descendants, so text changes mark the clickables
+    // around them
+    const markEnclosing = (node) => {
+        const closestClickable = (el) => (el ? el.closest(rules.clickableSelector) : null);
+        let clickable = closestClickable(node.nodeType === Node.ELEMENT_NODE ? node : node.parentElement);
+        while (clickable) {
+            dirty.add(clickable);
+            clickable = closestClickable(clickable.parentElement);
+        }
+    };
+
+    const observer = new MutationObserver((records) => {
+        // Until the first collect the page is still loading, and that collect scans it whole
+        if (!scanned) return;
+        for (const record of records) {
+            if (record.type === "childList") {
+                record.addedNodes.forEach((node) => markSubtree(node, candidateSelector));
+                record.addedNodes.forEach((node) => markSubtree(node, candidateSelector, inserted));
+                record.removedNodes.forEach((node) => markSubtree(node, candidateSelector));
+                markEnclosing(record.target);
+                textChanged = true;
+            } else if (record.type === "characterData") {
+                markEnclosing(record.target);
+                textChanged = true;
+            } else if (layoutAttributes.includes(record.attributeName)) {
+                markSubtree(record.target, rules.inputSelector);
+                textChanged = true;
+            } else {
+                dirty.add(record.target);
+            }
+        }
+    });
+    observer.observe(document, {
+        childList: true,
+        subtree: true,
+        characterData: true,
+        attributes: true,
+        attributeFilter: [...ownAttributes, ...layoutAttributes],
+    });
+
+    const classify = (el) => {
+        const entry = {
+            hyperlink: rules.hyperlink(el),
+            clickable: rules.clickable(el),
+            input_field: el.matches(rules.inputSelector) ? rules.inputFields([el])[0] : null,
+        };
+        entry.clickable_group = entry.clickable ? rules.clickableGroup(el) : null;
+        return entry.hyperlink || entry.clickable || entry.input_field ? entry : null;
+    };
+
+    const keep = (el, entry, changed) => {
+        const key = JSON.stringify(entry);
+        const old = entries.get(el);
+        if (old && entryKeys.get(el) === key) return;
+        entry.id = old ? old.id : nextId++;
+        entries.set(el, entry);
+        entryKeys.set(el, key);
+        changed.push(entry);
+    };
+
+    // Puts an element into `ordered` with a binary search over the document positions. Returns
+    // the id of the element it now follows, null if it comes first
+    const place = (el) => {
+        let low = 0;
+        let high = ordered.length;
+        while (low < high) {
+            const mid = (low + high) >> 1;
+            if (ordered[mid].compareDocumentPosition(el) & Node.DOCUMENT_POSITION_FOLLOWING) low = mid + 1;
+            else high = mid;
+        }
+        ordered.splice(low, 0, el);
+        return low > 0 ? entries.get(ordered[low - 1]).id : null;
+    };
+
+    const unplace = (el) => {
+        const index = ordered.indexOf(el);
+        if (index >= 0) ordered.splice(index, 1);
+    };
+
+    const fullScan = () => {
+        entries = new Map();
+        entryKeys = new Map();
+        ordered = [];
+        dirty = new Set();
+        inserted = new Set();
+        const changed = [];
+        for (const el of document.querySelectorAll(candidateSelector)) {
+            const entry = classify(el);
+            if (entry) {
+                keep(el, entry, changed);
+                ordered.push(el);
+            }
+        }
+        scanned = true;
+        const order = ordered.map((el) => entries.get(el).id);
+        return { changed: changed, removed: [], order: order, placed: [] };
+    };
+
+    // Judges only the elements the observer marked, detached ones drop out of the index. New and
+    // moved elements are placed in the document order, and each is sent with the id it follows
+    const applyChanges = () => {
+        const changed = [];
+        const removed = [];
+        const arriving = [];
+        for (const el of dirty) {
+            const indexed = entries.has(el);
+            const entry = el.isConnected ? classify(el) : null;
+            if (entry) {
+                keep(el, entry, changed);
+                if (!indexed || inserted.has(el)) {
+                    if (indexed) unplace(el);
+                    arriving.push(el);
+                }
+            } else if (indexed) {
+                removed.push(entries.get(el).id);
+                entries.delete(el);
+                entryKeys.delete(el);
+                unplace(el);
+            }
+        }
+        // In the order they are placed, so that each one's predecessor is already in place
+        const placed = arriving.map((el) => [entries.get(el).id, place(el)]);
+        dirty = new Set();
+        inserted = new Set();
+        return { changed: changed, removed: removed, order: null, placed: placed };
+    };
+
+    return {
+        documentId: documentId,
+        collect: (full) => {
+            const isFull = full || !scanned;
+            const delta = isFull ? fullScan() : applyChanges();
+            // The visible text is only read again when the page's text or layout changed
+            const bodyText = isFull || textChanged ? (document.body ? document.body.innerText : "") : null;
+            textChanged = false;
+            return {
+                document_id: documentId,
+                full: isFull,
+                changed: delta.changed,
+                removed: delta.removed,
+                order: delta.order,
+                placed: delta.placed,
+                body_text: bodyText,
+            };
+        },
+    };
+}
@@ -0,0 +1,92 @@
+(config, probeInputs) => {
+    // The rules of the general extraction (`extraction_configs.yaml`) as per-element tests, shared
+    // by the DOM bundle and the incremental DOM index
+    const rules = config.rules;
+    const invalidHrefs = new Set(rules.clickables.invalid_selector_field_hyperlinks);
+    const clickableTags = rules.clickables.clickable_field_selectors;
+    const buttonTypes = new Set(rules.clickables.valid_button_types_for_clickables);
+    const junkKeywords = rules.clickables.junk_keywords;
+    const linksToAvoid = rules.hyperlinks.links_to_avoid;
+    const validSchemas = new Set(rules.hyperlinks.valid_schemas);
+
+    const isDeadHref = (href) =>
+        !href || invalidHrefs.has(href) || href.startsWith("javascript:") || href.startsWith("#");
+
+    const absolute = (href) => {
+        try {
+            return new URL(href, document.baseURI).href;
+        } catch (e) {
+            return null;
+        }
+    };
+
+    const hyperlinkSelector = "a[href]";
+    const clickableSelector = [...clickableTags, "input", "[onclick]", "[role]", "[tabindex]"].join(",");
+    const inputSelector = config.input_selector;
+
+    // The absolute URL of a link which passes the hyperlink rules, or null
+    const hyperlink = (el) => {
+        if (!el.matches(hyperlinkSelector)) return null;
+        const raw = el.getAttribute("href").trim();
+        const lower = raw.toLowerCase();
+        if (isDeadHref(lower) || linksToAvoid.some((x) => lower.includes(x))) return null;
+
+        const url = absolute(raw);
+        if (!url || !validSchemas.has(new URL(url).protocol.slice(0, -1))) return null;
+        return url;
+    };
+
+    // The general extraction lists the clickables query by query: the clickable tags, the button
+    // inputs, then the [onclick], [role] and [tabindex] elements. This is the first of those queries
+    // which finds the element, or -1 if none does
+    const clickableGroup = (el) => {
+        const tag = el.tagName.toLowerCase();
+        if (clickableTags.includes(tag)) {
+            if (tag !== "a" || !isDeadHref((el.getAttribute("href") || "").trim().toLowerCase())) return 0;
+        }
+        if (tag === "input" && buttonTypes.has((el.getAttribute("type") || "").toLowerCase())) return 1;
+        if (el.hasAttribute("onclick")) return 2;
+        const role = (el.getAttribute("role") || "").toLowerCase();
+        if (role === "button" || role === "link") return 3;
+        if (el.hasAttribute("tabindex")) return 4;
+        return -1;
+    };
+    const clickableGroups = 5;
+
+    // The clickable's entry with its falsy values dropped, or null
+    const clickable = (el) => {
+        if (!el.matches(clickableSelector) || clickableGroup(el) < 0) return null;
+
+        const text = (el.textContent || "").replace(/\s+/g, " ").trim();
+        const rawHref = el.getAttribute("href");
+        const onclick = el.getAttribute("onclick");
+        if (!(text || rawHref || onclick)) return null;
+
+        const lowerText = text.toLowerCase();
+        if (junkKeywords.some((k) => lowerText.includes(k))) return null;
+
+        const item = {
+            tag: el.tagName.toLowerCase(),
+            text: text,
+            href: rawHref ? absolute(rawHref) : null,
+            onclick: onclick,
+            role: el.getAttribute("role"),
+            tabindex: el.getAttribute("tabindex"),
+        };
+        return Object.fromEntries(Object.entries(item).filter(([, v]) => v));
+    };
+
+    // The probed input fields of a list of elements, null for the ones which can't be filled
+    const inputFields = (elements) => probeInputs({ elements: elements, rules: rules.input_fields });
+
+    return {
+        hyperlinkSelector,
+        clickableSelector,
+        inputSelector,
+        hyperlink,
+        clickable,
+        clickableGroup,
+        clickableGroups,
+        inputFields,
+    };
+}
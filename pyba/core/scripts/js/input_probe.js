@@ -0,0 +1,46 @@
+({ elements, rules }) => {
+    // Judges for every candidate element whether it can be filled, from the DOM alone and without
+    // typing into it, and builds its metadata and selector. Returns null for the rejected ones.
+    const validTags = new Set(rules.valid_tags);
+    const invalidTypes = new Set(rules.invalid_input_types);
+    const fillableTypes = new Set(rules.fillable_input_types);
+
+    // The same test as playwright's `is_visible`: a non-empty box and not visibility:hidden
+    const isVisible = (el) => {
+        const rect = el.getBoundingClientRect();
+        return rect.width > 0 && rect.height > 0 && getComputedStyle(el).visibility !== "hidden";
+    };
+
+    return elements.map((el) => {
+        const tag = el.tagName.toLowerCase();
+        const type = (el.getAttribute("type") || "text").toLowerCase().trim();
+        if (!validTags.has(tag) || invalidTypes.has(type)) return null;
+
+        // `:disabled` also covers the fields inside a disabled fieldset
+        if (el.matches(":disabled") || el.getAttribute("aria-disabled") === "true") return null;
+        if (el.readOnly || el.getAttribute("aria-readonly") === "true") return null;
+        if (!isVisible(el)) return null;
+
+        // A field which already holds a value is kept whatever its type, like the fill test did.
+        // Otherwise checkboxes, dates, numbers and the like can't take the text `fill` would type
+        const hasValue = (tag === "input" || tag === "textarea") && (el.value || "").trim() !== "";
+        if (tag === "input" && !hasValue && !fillableTypes.has(type)) return null;
+
+        const field = {
+            tag: tag,
+            type: type,
+            id: el.getAttribute("id"),
+            name: el.getAttribute("name"),
+            placeholder: el.getAttribute("placeholder"),
+            aria_label: el.getAttribute("aria-label"),
+        };
+
+        if (field.id) field.selector = `#${field.id}`;
+        else if (field.name) field.selector = `${tag}[name='${field.name}']`;
+        else if (field.placeholder) field.selector = `${tag}[placeholder='${field.placeholder}']`;
+        else if (field.aria_label) field.selector = `${tag}[aria-label='${field.aria_label}']`;
+        else field.selector = `${tag}:nth-of-type(unknown)`;
+
+        return field;
+    });
+}
@@ -1,9 +1,9 @@
 import json
 import time
-from typing import Optional
+from typing import Any, Dict, Optional
 
 from pyba.database.database import Database
-from pyba.database.models import EpisodicMemory, SemanticMemory
+from pyba.database.models import EpisodicMemory, LLMCallTelemetry, SemanticMemory
 
 
 class DatabaseFunctions:
@@ -189,3 +189,25 @@ class DatabaseFunctions:
             return memory
         except Exception:
             return None
+
+    def push_llm_call(self, record: Dict[str, Any]) -> bool:
+        """
+        Stores the telemetry of one LLM call
+
+        Args:
+            `record`: The `LLMCallRecord` of the call as a dictionary
+
+        Returns:
+            A boolean to indicate the success or failure of the operation
+        """
+        if not hasattr(self, "session"):
+            return False
+
+        try:
+            self.session.add(LLMCallTelemetry(**record))
+            return self.submit_query_with_retry()
+        except Exception:
+            self.session.rollback()
+            return False
+        finally:
+            self.session.close()
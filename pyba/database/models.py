@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Text
+from sqlalchemy import Column, Float, Integer, String, Text
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
@@ -45,3 +45,105 @@ class SemanticMemory(Base):
 
     def __repr__(self):
         return ("ExtractedData(session_id: {0}, logs: {1})").format(self.session_id, self.logs)
+
+
+class LLMResponseCache(Base):
+    """
+    Cache for the structured responses of the LLMs
+
+    Arguments:
+            - `key`: The fingerprint of the provider, model, system instruction, response schema and prompt
+            - `provider`: The provider which generated the response
+            - `model`: The model which generated the response
+            - `response`: The structured response text (JSON)
+            - `size`: The size of the response in bytes, used for eviction
+            - `created_at`: Unix timestamp of the insertion, used for the TTL
+            - `last_accessed`: Unix timestamp of the last hit, used for eviction
+    """
+
+    __tablename__ = "LLMResponseCache"
+
+    key = Column(String(64), primary_key=True)
+    provider = Column(Text, nullable=False)
+    model = Column(Text, nullable=False)
+    response = Column(Text, nullable=False)
+    size = Column(Integer, nullable=False)
+    created_at = Column(Float, nullable=False, index=True)
+    last_accessed = Column(Float, nullable=False, index=True)
+
+    def __repr__(self):
+        return ("LLMResponseCache(key: {0}, provider: {1}, model: {2}, size: {3})").format(
+            self.key, self.provider, self.model, self.size
+        )
+
+
+class LLMCallTelemetry(Base):
+    """
+    Telemetry of the LLM calls, one row per call
+
+    Arguments:
+            - `id`: Autoincrementing row ID
+            - `session_id`: The session which made the call
+            - `step`: The engine's step number when the call was made
+            - `agent_type`: action, output, planner or extraction
+            - `provider`, `model`: Where the call went
+            - `source`: `provider` for a real call, `cache` or `cassette` when answered locally
+            - `started_at`: Unix timestamp of the start of the call
+            - `wall_seconds`: The latency of the call
+            - `queue_seconds`, `backoff_seconds`: The rate limiter wait and the retry backoff
+            - `attempts`: The number of requests sent
+            - `input_tokens`, `output_tokens`, `cached_tokens`: The usage reported by the provider
+            - `cost`: The estimated cost in USD
+            - `error`: The error the call failed with, if it did
+    """
+
+    __tablename__ = "LLMCallTelemetry"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(Text, nullable=True, index=True)
+    step = Column(Integer, nullable=False)
+    agent_type = Column(Text, nullable=False)
+    provider = Column(Text, nullable=False)
+    model = Column(Text, nullable=False)
+    source = Column(Text, nullable=False)
+    started_at = Column(Float, nullable=False)
+    wall_seconds = Column(Float, nullable=False)
+    queue_seconds = Column(Float, nullable=False)
+    backoff_seconds = Column(Float, nullable=False)
+    attempts = Column(Integer, nullable=False)
+    input_tokens = Column(Integer, nullable=True)
+    output_tokens = Column(Integer, nullable=True)
+    cached_tokens = Column(Integer, nullable=True)
+    cost = Column(Float, nullable=True)
+    error = Column(Text, nullable=True)
+
+    def __repr__(self):
+        return (
+            "LLMCallTelemetry(session_id: {0}, step: {1}, agent_type: {2}, wall_seconds: {3})"
+        ).format(self.session_id, self.step, self.agent_type, self.wall_seconds)
+
+
+class LLMPlanCache(Base):
+    """
+    Cache for the plans of the planner agent
+
+    Arguments:
+            - `key`: The fingerprint of the normalised task, mode, maximum breadth and previous plan
+            - `task`: The normalised task, used to invalidate all the plans of a task
+            - `mode`: The mode the plan was generated for (DFS or BFS)
+            - `plan`: The plan (DFS) or list of plans (BFS) as JSON
+            - `created_at`: Unix timestamp of the insertion, used for the TTL
+    """
+
+    __tablename__ = "LLMPlanCache"
+
+    key = Column(String(64), primary_key=True)
+    task = Column(Text, nullable=False, index=True)
+    mode = Column(Text, nullable=False)
+    plan = Column(Text, nullable=False)
+    created_at = Column(Float, nullable=False, index=True)
+
+    def __repr__(self):
+        return ("LLMPlanCache(key: {0}, mode: {1}, task: {2})").format(
+            self.key, self.mode, self.task
+        )
@@ -7,6 +7,9 @@ from playwright.async_api import Page
 
 from pyba.utils.structure import CleanedDOM
 
+# Every run starts on this search page, see `initial_page_setup`
+START_PAGE = "https://search.brave.com"
+
 
 def url_entropy(url) -> int:
     """
@@ -31,7 +34,7 @@ async def initial_page_setup(page: Page) -> CleanedDOM:
     """
     Helper function for main: goto for the initial page -> Optimisation
     """
-    start_page = "https://search.brave.com"
+    start_page = START_PAGE
 
     await page.goto(start_page)
 
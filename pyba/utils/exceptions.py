@@ -68,3 +68,52 @@ class IncorrectMode(Exception):
         super().__init__(
             f"Mode {mode} is not supported. Please choose between DFS or BFS and enter as a string"
         )
+
+
+class LLMRequestFailed(Exception):
+    """
+    Exception raised when a provider call fails with an error that retrying won't fix, such as an
+    invalid API key, a context overflow or a response that doesn't match the schema
+    """
+
+    def __init__(self, provider: str, error: Exception):
+        self.provider = provider
+        self.error = error
+        super().__init__(f"The {provider} request failed and can't be retried: {error}")
+
+
+class LLMRetriesExhausted(Exception):
+    """
+    Exception raised when a provider call keeps failing with retryable errors until the retry
+    policy runs out of attempts or time
+    """
+
+    def __init__(self, provider: str, attempts: int, error: Exception):
+        self.provider = provider
+        self.attempts = attempts
+        self.error = error
+        super().__init__(
+            f"Gave up on the {provider} request after {attempts} attempts. Last error: {error}"
+        )
+
+
+class UnknownCassetteMode(Exception):
+    """
+    Exception raised when the cassette mode is neither record nor replay
+    """
+
+    def __init__(self, mode: str):
+        super().__init__(
+            f"Cassette mode {mode} is not supported. Please choose between record or replay"
+        )
+
+
+class CassetteResponseNotFound(Exception):
+    """
+    Exception raised on replay when the cassette has no response recorded for a request
+    """
+
+    def __init__(self, path: str, key: str):
+        super().__init__(
+            f"The cassette at {path} has no response for request {key[:12]}. The prompts have changed since it was recorded, please record it again."
+        )
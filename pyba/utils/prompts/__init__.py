@@ -1,5 +1,11 @@
 from pyba.utils.prompts.system_prompt import system_prompt as system_instruction
-from pyba.utils.prompts.general_prompt import general_prompt
+from pyba.utils.prompts.general_prompt import (
+    general_prompt,
+    general_prompt_rules,
+    general_prompt_delta,
+    general_prompt_batch_rules,
+)
+from pyba.utils.prompts.compact_action_prompt import compact_action_system_instruction
 from pyba.utils.prompts.output_general_prompt import output_prompt
 from pyba.utils.prompts.output_system_prompt import (
     output_system_prompt as output_system_instruction,
@@ -14,3 +20,4 @@ from pyba.utils.prompts.extraction_prompts import (
     extraction_system_instruction,
     extraction_general_instruction,
 )
+from pyba.utils.prompts.json_mode_prompt import json_mode_prompt
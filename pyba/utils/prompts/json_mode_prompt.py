@@ -0,0 +1,11 @@
+# Appended to the system prompt for OpenAI compatible servers that only support JSON mode
+
+json_mode_prompt = """
+
+---
+
+### Output Format
+Respond with a single JSON object and nothing else. It must validate against this JSON schema:
+
+{schema}
+"""
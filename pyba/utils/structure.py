@@ -1,7 +1,8 @@
 from dataclasses import dataclass, field
-from typing import Optional, List, Dict
+from typing import Annotated, Any, Optional, List, Dict, Literal, Union
 
 from pydantic import BaseModel, Field
+from pydantic.json_schema import GenerateJsonSchema
 
 
 class PlaywrightAction(BaseModel):
@@ -156,6 +157,195 @@ class PlaywrightResponse(BaseModel):
     )
 
 
+class CompactJsonSchema(GenerateJsonSchema):
+    """
+    Writes discriminated unions as a plain `anyOf` and leaves out the per-field titles. Pydantic
+    emits `oneOf` with a `discriminator` mapping, which OpenAI's strict structured outputs and
+    Gemini's response schemas don't accept. The union is still validated by its discriminator.
+    """
+
+    def tagged_union_schema(self, schema):
+        json_schema = super().tagged_union_schema(schema)
+        json_schema.pop("discriminator", None)
+        if "oneOf" in json_schema:
+            json_schema["anyOf"] = json_schema.pop("oneOf")
+        return json_schema
+
+    def field_title_should_be_set(self, schema) -> bool:
+        return False
+
+
+# The compact actions, a union keyed by `action` with only the arguments each action takes
+
+
+class NavigateAction(BaseModel):
+    action: Literal["goto", "new_page"]
+    url: str
+
+
+class BrowserAction(BaseModel):
+    action: Literal["go_back", "go_forward", "reload", "close_page", "done"] = Field(
+        ..., description="`done` when the task is complete"
+    )
+
+
+class ClickAction(BaseModel):
+    action: Literal["click", "dblclick", "hover", "right_click", "check", "uncheck", "download"]
+    selector: str
+
+
+class FillAction(BaseModel):
+    action: Literal["fill", "select", "dropdown"]
+    selector: str
+    value: str
+
+
+class TypeAction(BaseModel):
+    action: Literal["type"]
+    selector: str
+    text: str
+
+
+class PressAction(BaseModel):
+    action: Literal["press"]
+    selector: Optional[str] = None
+    key: str
+
+
+class UploadAction(BaseModel):
+    action: Literal["upload"]
+    selector: str
+    path: str
+
+
+class ScrollAction(BaseModel):
+    action: Literal["scroll", "mouse_move", "mouse_click"]
+    x: Optional[int] = None
+    y: Optional[int] = None
+
+
+class WaitAction(BaseModel):
+    action: Literal["wait"]
+    selector: Optional[str] = None
+    timeout: Optional[int] = Field(None, description="Timeout for the selector in ms")
+    ms: Optional[int] = Field(None, description="Fixed wait in ms")
+
+
+class KeyboardAction(BaseModel):
+    action: Literal["keyboard_press", "keyboard_type"]
+    text: str = Field(..., description="The key to press or the text to type")
+
+
+class SwitchPageAction(BaseModel):
+    action: Literal["switch_page"]
+    index: int
+
+
+class EvaluateJSAction(BaseModel):
+    action: Literal["evaluate_js"]
+    script: str
+
+
+class ScreenshotAction(BaseModel):
+    action: Literal["screenshot"]
+    path: str
+
+
+CompactPlaywrightAction = Annotated[
+    Union[
+        NavigateAction,
+        BrowserAction,
+        ClickAction,
+        FillAction,
+        TypeAction,
+        PressAction,
+        UploadAction,
+        ScrollAction,
+        WaitAction,
+        KeyboardAction,
+        SwitchPageAction,
+        EvaluateJSAction,
+        ScreenshotAction,
+    ],
+    Field(discriminator="action"),
+]
+
+
+class CompactPlaywrightResponse(BaseModel):
+    """
+    The compact alternative to `PlaywrightResponse`. Each action only carries its own arguments,
+    so the schema sent with the requests is a fraction of the size and the model doesn't write
+    out (or reason over) the ~40 null fields of a `PlaywrightAction`.
+    """
+
+    actions: List[CompactPlaywrightAction]
+    extract_info: Optional[bool] = Field(
+        ...,
+        description="A specific boolean value for the playwright agent to decide if extraction is required from this page",
+    )
+
+    @classmethod
+    def model_json_schema(cls, *args, schema_generator=CompactJsonSchema, **kwargs):
+        return super().model_json_schema(*args, schema_generator=schema_generator, **kwargs)
+
+
+# action type -> {compact argument: PlaywrightAction field}. The actions without arguments set
+# the field of the same name to True, `done` leaves every field empty (the task is complete)
+COMPACT_ACTION_FIELDS: Dict[str, Dict[str, str]] = {
+    "goto": {"url": "goto"},
+    "go_back": {},
+    "go_forward": {},
+    "reload": {},
+    "click": {"selector": "click"},
+    "dblclick": {"selector": "dblclick"},
+    "hover": {"selector": "hover"},
+    "right_click": {"selector": "right_click"},
+    "check": {"selector": "check"},
+    "uncheck": {"selector": "uncheck"},
+    "download": {"selector": "download_selector"},
+    "fill": {"selector": "fill_selector", "value": "fill_value"},
+    "select": {"selector": "select_selector", "value": "select_value"},
+    "dropdown": {"selector": "dropdown_field_id", "value": "dropdown_field_value"},
+    "type": {"selector": "type_selector", "text": "type_text"},
+    "press": {"selector": "press_selector", "key": "press_key"},
+    "upload": {"selector": "upload_selector", "path": "upload_path"},
+    "scroll": {"x": "scroll_x", "y": "scroll_y"},
+    "mouse_move": {"x": "mouse_move_x", "y": "mouse_move_y"},
+    "mouse_click": {"x": "mouse_click_x", "y": "mouse_click_y"},
+    "wait": {"selector": "wait_selector", "timeout": "wait_timeout", "ms": "wait_ms"},
+    "keyboard_press": {"text": "keyboard_press"},
+    "keyboard_type": {"text": "keyboard_type"},
+    "new_page": {"url": "new_page"},
+    "close_page": {},
+    "switch_page": {"index": "switch_page_index"},
+    "evaluate_js": {"script": "evaluate_js"},
+    "screenshot": {"path": "screenshot_path"},
+    "done": {},
+}
+
+
+def expand_action(action: Any) -> Any:
+    """
+    Converts a compact action (anything with an `action` type, a model or a dict) into the
+    equivalent `PlaywrightAction`. Actions already in the flat format are returned as they are.
+
+    Args:
+        `action`: The compact or flat action
+    """
+    fields = action if isinstance(action, dict) else getattr(action, "__dict__", {})
+    action_type = fields.get("action")
+    if action_type not in COMPACT_ACTION_FIELDS:
+        return action
+
+    arguments = COMPACT_ACTION_FIELDS[action_type]
+    if not arguments and action_type != "done":
+        return PlaywrightAction(**{action_type: True})
+
+    return PlaywrightAction(
+        **{field: fields.get(argument) for argument, field in arguments.items()}
+    )
+
+
 class OutputResponseFormat(BaseModel):
     """
     Output type for the model for direct response